@@ -266,6 +266,27 @@ def kodiRpcToTraktMediaObjects(data: Dict, mode: str = "collected") -> Optional[
         return
 
 
+# convert kodi episodes into collected and watched seasons in a single pass,
+# both projections share the same episode objects
+def kodiRpcToTraktEpisodeProjections(episodes: List) -> Tuple[List, List]:
+    a_collected = {}
+    a_watched = {}
+    for episode in episodes:
+        s_no = episode["season"]
+        if s_no not in a_collected:
+            a_collected[s_no] = []
+            a_watched[s_no] = []
+        episodeObject = kodiRpcToTraktMediaObject("episode", episode, "collected")
+        if episodeObject:
+            a_collected[s_no].append(episodeObject)
+            if episodeObject["watched"]:
+                a_watched[s_no].append(episodeObject)
+
+    collected = [{"number": s_no, "episodes": a_collected[s_no]} for s_no in a_collected]
+    watched = [{"number": s_no, "episodes": a_watched[s_no]} for s_no in a_watched]
+    return collected, watched
+
+
 def getShowDetailsFromKodi(showID: int, fields: List) -> Optional[Dict]:
     result = kodiJsonRequest(
         {
@@ -310,6 +331,46 @@ def getSeasonDetailsFromKodi(seasonID: int, fields: List) -> Optional[Dict]:
         return None
 
 
+# get all episodes from kodi in pages, grouped by the show they belong to
+
+
+def getEpisodesFromKodiByShow(fields: List, page_size: int = 2000) -> Optional[Dict[int, List[Dict]]]:
+    if "tvshowid" not in fields:
+        fields = fields + ["tvshowid"]
+
+    episodesByShow = {}
+    start = 0
+    while True:
+        result = kodiJsonRequest(
+            {
+                "jsonrpc": "2.0",
+                "method": "VideoLibrary.GetEpisodes",
+                "params": {
+                    "properties": fields,
+                    "limits": {"start": start, "end": start + page_size},
+                },
+                "id": 0,
+            }
+        )
+        if not result:
+            logger.debug(
+                "getEpisodesFromKodiByShow(): Result from Kodi was empty (start: %d)."
+                % start
+            )
+            return None
+
+        episodes = result.get("episodes", [])
+        for episode in episodes:
+            episodesByShow.setdefault(episode["tvshowid"], []).append(episode)
+
+        start += page_size
+        total = result.get("limits", {}).get("total", 0)
+        if not episodes or start >= total:
+            break
+
+    return episodesByShow
+
+
 # get a single episode from kodi given the id
 
 
@@ -0,0 +1,161 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# how often last_activities is checked for rating changes made elsewhere
+CHECK_INTERVAL = 60
+
+
+class RatingsCache:
+    """In-process cache of the user's Trakt ratings, keyed by Trakt id.
+
+    Every media type ("movies", "shows", "seasons", "episodes") is downloaded
+    on first use and kept until its rated_at in last_activities moves. Ratings
+    sent through this add-on are applied in place instead.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Dict],
+        getLastActivities: Callable[[], Optional[Dict]],
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self._fetch = fetch
+        self._getLastActivities = getLastActivities
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._entries: Dict[str, Dict] = {}
+        self._stamps: Dict[str, Optional[str]] = {}
+        self._episodeKeys: Dict[str, Any] = {}
+        self._adopt: Set[str] = set()
+        self._activities: Optional[Dict] = None
+        self._checked_at: Optional[float] = None
+
+    def movie(self, movieId: Any) -> Dict:
+        return self._get("movies", str(movieId))
+
+    def show(self, showId: Any) -> Dict:
+        return self._get("shows", str(showId))
+
+    def season(self, showId: Any, season: int) -> Dict:
+        return self._get("seasons", (str(showId), int(season)))
+
+    def episode(self, showId: Any, season: int, episode: int) -> Dict:
+        return self._get("episodes", (str(showId), int(season), int(episode)))
+
+    def update(self, mediaObject: Dict, remove: bool = False) -> None:
+        """Apply ratings sent to sync/ratings, media types that can't be updated in place are dropped."""
+        with self._lock:
+            for media, items in mediaObject.items():
+                for item in items:
+                    if media == "movies":
+                        self._set("movies", item.get("ids", {}).get("trakt"), item, remove)
+                    elif media == "shows":
+                        self._updateShow(item, remove)
+                    elif media == "episodes":
+                        episodeId = item.get("ids", {}).get("trakt")
+                        key = self._episodeKeys.get(str(episodeId)) if episodeId else None
+                        self._set("episodes", key, item, remove)
+                    else:
+                        self._drop(media)
+            # look at last_activities again on the next lookup, so the
+            # rated_at moved by this write is adopted instead of reloading
+            self._checked_at = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries = {}
+            self._stamps = {}
+            self._episodeKeys = {}
+            self._adopt = set()
+
+    def _get(self, media: str, key: Any) -> Dict:
+        with self._lock:
+            self._validate(media)
+            return dict(self._entries[media].get(key, {}))
+
+    def _validate(self, media: str) -> None:
+        now = self._clock()
+        if self._checked_at is None or now - self._checked_at >= CHECK_INTERVAL:
+            try:
+                self._activities = self._getLastActivities()
+            except Exception as ex:
+                logger.debug("Failed to fetch last_activities: %s" % ex)
+                self._activities = None
+            self._checked_at = now
+
+        stamp = (self._activities or {}).get(media, {}).get("rated_at")
+        if media in self._entries:
+            if media in self._adopt:
+                self._adopt.discard(media)
+                self._stamps[media] = stamp
+            elif stamp is None or stamp != self._stamps.get(media):
+                logger.debug("%s ratings changed on Trakt, reloading them" % media)
+                self._drop(media)
+
+        if media not in self._entries:
+            self._load(media)
+            self._stamps[media] = stamp
+
+    def _load(self, media: str) -> None:
+        entries = {}
+        if media == "episodes":
+            self._episodeKeys = {}
+        for item in self._fetch(media).values():
+            data = item.to_dict()
+            showId = str(data["ids"].get("trakt"))
+            if media in ("movies", "shows"):
+                entries[showId] = data
+                continue
+            for season in data.get("seasons", []):
+                if media == "seasons":
+                    entries[(showId, season["number"])] = season
+                    continue
+                for episode in season.get("episodes", []):
+                    key = (showId, season["number"], episode["number"])
+                    entries[key] = episode
+                    if episode.get("ids", {}).get("trakt"):
+                        self._episodeKeys[str(episode["ids"]["trakt"])] = key
+        self._entries[media] = entries
+        logger.debug("Loaded %d %s ratings" % (len(entries), media))
+
+    def _updateShow(self, item: Dict, remove: bool) -> None:
+        showId = item.get("ids", {}).get("trakt")
+        if "seasons" not in item:
+            self._set("shows", showId, item, remove)
+            return
+        for season in item["seasons"]:
+            if "episodes" not in season:
+                key = (str(showId), int(season["number"])) if showId else None
+                self._set("seasons", key, season, remove)
+                continue
+            for episode in season["episodes"]:
+                key = (str(showId), int(season["number"]), int(episode["number"])) if showId else None
+                self._set("episodes", key, episode, remove)
+
+    def _set(self, media: str, key: Any, item: Dict, remove: bool) -> None:
+        if media not in self._entries:
+            return
+        if key is None:
+            self._drop(media)
+            return
+        if not isinstance(key, tuple):
+            key = str(key)
+
+        if remove:
+            self._entries[media].pop(key, None)
+        else:
+            entry = dict(self._entries[media].get(key, {}))
+            entry["rating"] = item.get("rating")
+            if "rated_at" in item:
+                entry["rated_at"] = item["rated_at"]
+            self._entries[media][key] = entry
+        self._adopt.add(media)
+
+    def _drop(self, media: str) -> None:
+        self._entries.pop(media, None)
+        self._stamps.pop(media, None)
+        self._adopt.discard(media)
@@ -0,0 +1,62 @@
+import os
+import logging
+from typing import Dict, Iterable
+
+import xbmcvfs
+import xbmcaddon
+
+from resources.lib.sqlite_connections import ThreadConnections
+
+logger = logging.getLogger(__name__)
+
+__addon__ = xbmcaddon.Addon("script.trakt")
+
+
+class RuntimeStore:
+    """Remembers episode runtimes (in seconds) looked up on Trakt, keyed by Trakt episode id.
+
+    Used for library episodes Kodi has no runtime for, so each one is only
+    looked up once.
+    """
+
+    _create = (
+        "CREATE TABLE IF NOT EXISTS episode_runtimes ("
+        "  trakt_id INTEGER PRIMARY KEY,"
+        "  runtime INTEGER NOT NULL"
+        ")"
+    )
+
+    def __init__(self):
+        self.path = xbmcvfs.translatePath(__addon__.getAddonInfo("profile"))
+        if not xbmcvfs.exists(self.path):
+            xbmcvfs.mkdir(self.path)
+        self.path = os.path.join(self.path, "cache.db")
+        self._connections = ThreadConnections(self.path)
+        with self._get_conn() as conn:
+            conn.execute(self._create)
+
+    def _get_conn(self):
+        return self._connections.get()
+
+    def get_many(self, traktIds: Iterable) -> Dict[int, int]:
+        """Return {trakt id: runtime} for the ids that are known."""
+        traktIds = [int(traktId) for traktId in traktIds]
+        runtimes = {}
+        with self._get_conn() as conn:
+            # stay well below SQLITE_MAX_VARIABLE_NUMBER
+            for i in range(0, len(traktIds), 500):
+                chunk = traktIds[i:i + 500]
+                rows = conn.execute(
+                    "SELECT trakt_id, runtime FROM episode_runtimes WHERE trakt_id IN (%s)"
+                    % ",".join("?" * len(chunk)),
+                    chunk,
+                ).fetchall()
+                runtimes.update(dict(rows))
+        return runtimes
+
+    def put_many(self, runtimes: Dict) -> None:
+        with self._get_conn() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO episode_runtimes (trakt_id, runtime) VALUES (?, ?)",
+                [(int(traktId), int(runtime)) for traktId, runtime in runtimes.items()],
+            )
@@ -331,3 +331,5 @@ def run() -> None:
     if 'action' in data:
         logger.debug("Queuing for dispatch: %s" % data)
         q.append(data)
+        # wake up the service, it only reads the queue when told to
+        xbmc.executebuiltin("NotifyAll(script.trakt,dispatchQueued)")
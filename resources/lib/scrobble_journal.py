@@ -0,0 +1,227 @@
+import os
+import time
+import logging
+import threading
+from json import loads, dumps
+
+import xbmcvfs
+import xbmcaddon
+
+from resources.lib import utilities
+from resources.lib.sqlite_connections import ThreadConnections
+
+logger = logging.getLogger(__name__)
+
+__addon__ = xbmcaddon.Addon("script.trakt")
+
+# events this old are no longer sent as live scrobbles (start/pause are
+# dropped, stops are handed over to the history retry queue)
+STALE_AFTER = 10 * 60
+
+# a failed send is retried after RETRY_DELAY, doubled with every attempt up
+# to MAX_RETRY_DELAY, until the event is STALE_AFTER old
+RETRY_DELAY = 5
+MAX_RETRY_DELAY = 60
+
+
+class ScrobbleJournal:
+    """Write-ahead log of scrobble events (start/pause/stop), in the order they happened."""
+
+    _create = (
+        "CREATE TABLE IF NOT EXISTS scrobble_journal ("
+        "  id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        "  media_type TEXT NOT NULL,"
+        "  media_info TEXT NOT NULL,"
+        "  show_info TEXT,"
+        "  status TEXT NOT NULL,"
+        "  progress REAL NOT NULL,"
+        "  created_at REAL NOT NULL,"
+        "  attempts INTEGER NOT NULL DEFAULT 0"
+        ")"
+    )
+
+    def __init__(self):
+        self.path = xbmcvfs.translatePath(__addon__.getAddonInfo("profile"))
+        if not xbmcvfs.exists(self.path):
+            xbmcvfs.mkdir(self.path)
+        self.path = os.path.join(self.path, "queue.db")
+        self._connections = ThreadConnections(self.path)
+        with self._get_conn() as conn:
+            conn.execute(self._create)
+
+    def _get_conn(self):
+        return self._connections.get()
+
+    def add(self, media_type, media_info, show_info, status, progress):
+        with self._get_conn() as conn:
+            return conn.execute(
+                "INSERT INTO scrobble_journal "
+                "(media_type, media_info, show_info, status, progress, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    media_type,
+                    dumps(media_info),
+                    dumps(show_info) if show_info else None,
+                    status,
+                    progress,
+                    time.time(),
+                ),
+            ).lastrowid
+
+    def get_pending(self):
+        with self._get_conn() as conn:
+            rows = conn.execute(
+                "SELECT id, media_type, media_info, show_info, status, progress, created_at, attempts "
+                "FROM scrobble_journal ORDER BY id"
+            ).fetchall()
+        return [
+            {
+                "id": r[0],
+                "media_type": r[1],
+                "media_info": loads(r[2]),
+                "show_info": loads(r[3]) if r[3] else None,
+                "status": r[4],
+                "progress": r[5],
+                "created_at": r[6],
+                "attempts": r[7],
+            }
+            for r in rows
+        ]
+
+    def remove_many(self, row_ids):
+        with self._get_conn() as conn:
+            conn.executemany(
+                "DELETE FROM scrobble_journal WHERE id = ?", [(row_id,) for row_id in row_ids]
+            )
+
+    def increment_attempts(self, row_id):
+        with self._get_conn() as conn:
+            conn.execute(
+                "UPDATE scrobble_journal SET attempts = attempts + 1 WHERE id = ?", (row_id,)
+            )
+
+    def __len__(self):
+        with self._get_conn() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM scrobble_journal"
+            ).fetchone()[0]
+
+
+class ScrobbleSender(threading.Thread):
+    """Replays the scrobble journal to Trakt in the background.
+
+    send(event) returns the Trakt response, None (or raising) counts as a
+    failure and is retried with backoff until the event is STALE_AFTER old.
+    expired(event) takes the stops that can no longer be sent as a live
+    scrobble. Callbacks registered with add() run on this thread once their
+    event was sent, as callback(response, superseded). When compaction folds
+    an event into a later one for the same item, its callbacks move along and
+    run with that event's response and superseded=True.
+    """
+
+    def __init__(self, journal, send, expired):
+        threading.Thread.__init__(self)
+        self.name = "trakt-scrobble"
+        self.daemon = True
+        self.journal = journal
+        self.send = send
+        self.expired = expired
+        self._callbacks = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._retry_at = 0
+        # replay whatever a previous session left in the journal
+        self._wake.set()
+
+    def add(self, media_type, media_info, show_info, status, progress, callback=None):
+        with self._lock:
+            row_id = self.journal.add(media_type, media_info, show_info, status, progress)
+            if callback:
+                self._callbacks[row_id] = [(callback, False)]
+        self._wake.set()
+        return row_id
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def run(self):
+        while not self._stopped:
+            timeout = max(self._retry_at - time.time(), 0) if self._retry_at else None
+            self._wake.wait(timeout)
+            self._wake.clear()
+            if self._stopped:
+                break
+            if self._retry_at > time.time():
+                continue
+            self._retry_at = 0
+            try:
+                self.flush()
+            except Exception as ex:
+                logger.fatal(utilities.createError(ex))
+
+    def flush(self):
+        events = self.journal.get_pending()
+        if not events:
+            return
+
+        pending = events
+        events, superseded = utilities.compactScrobbles(pending)
+        if superseded:
+            logger.debug("Compacted %d superseded scrobble event(s)" % len(superseded))
+            self.journal.remove_many([event["id"] for event in superseded])
+            # an event is superseded by the one right after it, handing the
+            # callbacks over in order ends them up on the surviving event
+            following = dict(
+                (event["id"], pending[index + 1]["id"]) for index, event in enumerate(pending[:-1])
+            )
+            for event in superseded:
+                self.__carryCallbacks(event["id"], following[event["id"]])
+
+        for event in events:
+            if self._stopped:
+                return
+            if time.time() - event["created_at"] > STALE_AFTER:
+                self.__expire(event)
+                continue
+
+            try:
+                response = self.send(event)
+            except Exception as ex:
+                logger.debug("Scrobble '%s' raised: %s" % (event["status"], ex))
+                response = None
+
+            if response is None:
+                # keep the order, nothing after it goes out before it. The
+                # event stays journaled until it is sent or goes stale, so
+                # scrobbles survive Trakt (or the network) being down
+                self.journal.increment_attempts(event["id"])
+                delay = min(RETRY_DELAY * 2 ** min(event["attempts"], 10), MAX_RETRY_DELAY)
+                self._retry_at = time.time() + delay
+                logger.debug("Scrobble '%s' failed, retrying in %ds" % (event["status"], delay))
+                return
+
+            self.journal.remove_many([event["id"]])
+            for callback, carried in self.__callbacks(event):
+                callback(response, carried)
+
+    def __expire(self, event):
+        logger.info("Giving up on scrobble '%s' (%.1f%%) after %d attempt(s)" % (
+            event["status"], event["progress"], event["attempts"]))
+        self.journal.remove_many([event["id"]])
+        self.__callbacks(event)
+        if event["status"] == "stop":
+            self.expired(event)
+
+    def __callbacks(self, event):
+        with self._lock:
+            return self._callbacks.pop(event["id"], [])
+
+    def __carryCallbacks(self, row_id, to_row_id):
+        with self._lock:
+            callbacks = self._callbacks.pop(row_id, [])
+            if callbacks:
+                self._callbacks.setdefault(to_row_id, []).extend(
+                    (callback, True) for callback, _ in callbacks
+                )
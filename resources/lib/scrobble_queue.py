@@ -1,19 +1,23 @@
 import os
-import sqlite3
+import time
 import logging
-import threading
 from json import loads, dumps
-from _thread import get_ident
 
 import xbmcvfs
 import xbmcaddon
 
+from resources.lib.sqlite_connections import ThreadConnections
+
 logger = logging.getLogger(__name__)
 
 __addon__ = xbmcaddon.Addon("script.trakt")
 
 MAX_RETRIES = 50
 
+# a failed retry waits RETRY_DELAY, doubled with every further failure
+RETRY_DELAY = 60
+MAX_RETRY_DELAY = 6 * 60 * 60
+
 
 class ScrobbleQueue:
     """Persists failed stop-scrobbles for later retry via sync/history."""
@@ -27,7 +31,8 @@ class ScrobbleQueue:
         "  watched_at TEXT NOT NULL,"
         "  progress REAL NOT NULL,"
         "  created_at REAL NOT NULL,"
-        "  retry_count INTEGER DEFAULT 0"
+        "  retry_count INTEGER DEFAULT 0,"
+        "  next_retry_at REAL NOT NULL DEFAULT 0"
         ")"
     )
 
@@ -36,23 +41,17 @@ class ScrobbleQueue:
         if not xbmcvfs.exists(self.path):
             xbmcvfs.mkdir(self.path)
         self.path = os.path.join(self.path, "queue.db")
-        self._connection_cache = {}
+        self._connections = ThreadConnections(self.path)
         with self._get_conn() as conn:
             conn.execute(self._create)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(failed_scrobbles)")]
+            if "next_retry_at" not in columns:
+                conn.execute(
+                    "ALTER TABLE failed_scrobbles ADD COLUMN next_retry_at REAL NOT NULL DEFAULT 0"
+                )
 
     def _get_conn(self):
-        tid = get_ident()
-        alive_tids = {t.ident for t in threading.enumerate()}
-        stale_tids = [t for t in self._connection_cache if t not in alive_tids]
-        for stale_tid in stale_tids:
-            try:
-                self._connection_cache[stale_tid].close()
-            except Exception:
-                pass
-            del self._connection_cache[stale_tid]
-        if tid not in self._connection_cache:
-            self._connection_cache[tid] = sqlite3.Connection(self.path, timeout=60)
-        return self._connection_cache[tid]
+        return self._connections.get()
 
     def add(self, media_type, media_info, show_info, progress, watched_at):
         with self._get_conn() as conn:
@@ -70,11 +69,13 @@ class ScrobbleQueue:
             )
         logger.info("Queued failed %s scrobble for retry" % media_type)
 
-    def get_pending(self):
+    def get_pending(self, due_only=False):
+        """Return the queued scrobbles, only those whose retry is due if due_only."""
         with self._get_conn() as conn:
             rows = conn.execute(
                 "SELECT id, media_type, media_info, show_info, watched_at, progress, retry_count "
-                "FROM failed_scrobbles ORDER BY id"
+                "FROM failed_scrobbles WHERE ? OR next_retry_at <= ? ORDER BY id",
+                (not due_only, time.time()),
             ).fetchall()
         return [
             {
@@ -90,24 +91,40 @@ class ScrobbleQueue:
         ]
 
     def remove(self, row_id):
+        self.remove_many([row_id])
+
+    def remove_many(self, row_ids):
         with self._get_conn() as conn:
-            conn.execute("DELETE FROM failed_scrobbles WHERE id = ?", (row_id,))
+            conn.executemany(
+                "DELETE FROM failed_scrobbles WHERE id = ?", [(row_id,) for row_id in row_ids]
+            )
 
     def increment_retry(self, row_id):
+        self.increment_retries([row_id])
+
+    def increment_retries(self, row_ids):
+        """Count a failed attempt and push the next one back (exponential backoff)."""
+        now = time.time()
         with self._get_conn() as conn:
-            conn.execute(
-                "UPDATE failed_scrobbles SET retry_count = retry_count + 1 WHERE id = ?",
-                (row_id,),
-            )
-            row = conn.execute(
-                "SELECT retry_count FROM failed_scrobbles WHERE id = ?", (row_id,)
-            ).fetchone()
-            if row and row[0] > MAX_RETRIES:
+            for row_id in row_ids:
+                row = conn.execute(
+                    "SELECT retry_count FROM failed_scrobbles WHERE id = ?", (row_id,)
+                ).fetchone()
+                if not row:
+                    continue
+                retry_count = row[0] + 1
+                if retry_count > MAX_RETRIES:
+                    conn.execute(
+                        "DELETE FROM failed_scrobbles WHERE id = ?", (row_id,)
+                    )
+                    logger.warning(
+                        "Dropped scrobble after %d retries" % MAX_RETRIES
+                    )
+                    continue
+                delay = min(RETRY_DELAY * 2 ** min(retry_count - 1, 20), MAX_RETRY_DELAY)
                 conn.execute(
-                    "DELETE FROM failed_scrobbles WHERE id = ?", (row_id,)
-                )
-                logger.warning(
-                    "Dropped scrobble after %d retries" % MAX_RETRIES
+                    "UPDATE failed_scrobbles SET retry_count = ?, next_retry_at = ? WHERE id = ?",
+                    (retry_count, now + delay, row_id),
                 )
 
     def __len__(self):
@@ -1,12 +1,14 @@
 import xbmc
 import time
 import logging
+import threading
 from datetime import datetime, timezone
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, Optional
 from resources.lib import utilities
 from resources.lib import kodiUtilities
 import math
 from resources.lib.rating import ratingCheck
+from resources.lib.scrobble_journal import ScrobbleJournal, ScrobbleSender
 from resources.lib.scrobble_queue import ScrobbleQueue
 
 logger = logging.getLogger(__name__)
@@ -20,6 +22,10 @@ class Scrobbler:
 
     def __init__(self) -> None:
         self.scrobble_queue = ScrobbleQueue()
+        # scrobbles are journaled and sent from a thread of their own, so
+        # playback transitions never wait on Trakt
+        self.sender = ScrobbleSender(ScrobbleJournal(), self.__send, self.__scrobbleExpired)
+        self.sender.start()
         self.isPlaying = False
         self.isPaused = False
         self.stopScrobbler = False
@@ -85,10 +91,7 @@ class Scrobbler:
                         watchedPercent, self.curVideo["multi_episode_count"]
                     )
                     if self.curMPEpisode != epIndex:
-                        response = self.__scrobble("stop")
-                        if response is not None:
-                            logger.debug("Scrobble response: %s" % str(response))
-                            self.videosToRate.append(self.curVideoInfo)
+                        if self.__scrobble("stop", onStopped=self.__addToRate(self.curVideoInfo)):
                             # update current information
                             self.curMPEpisode = epIndex
                             episode_details = kodiUtilities.getEpisodeDetailsFromKodi(
@@ -115,8 +118,7 @@ class Scrobbler:
                             logger.debug(
                                 "Multi episode transition - call start for next episode"
                             )
-                            response = self.__scrobble("start")
-                            self.__preFetchUserRatings(response)
+                            self.__scrobble("start", self.__preFetchUserRatings)
 
                 elif self.isPVR:
                     activePlayers = kodiUtilities.kodiJsonRequest(
@@ -139,9 +141,7 @@ class Scrobbler:
                         logger.debug("Scrobble - %s" % result)
                         type, curVideo = kodiUtilities.getInfoLabelDetails(result)
                         if curVideo != self.curVideo:
-                            response = self.__scrobble("stop")
-                            if response is not None:
-                                logger.debug("Scrobble response: %s" % str(response))
+                            if self.__scrobble("stop"):
                                 logger.debug("Scrobble PVR transition")
                                 # update current information
                                 self.curVideo = curVideo
@@ -204,7 +204,7 @@ class Scrobbler:
                                     "Scrobble Episode type, traktShowSummary: %s"
                                     % self.traktShowSummary
                                 )
-                                response = self.__scrobble("start")
+                                self.__scrobble("start")
 
                 elif isSeek:
                     self.__scrobble("start")
@@ -387,7 +387,8 @@ class Scrobbler:
             if kodiUtilities.getSettingAsBool(
                 "scrobble_movie"
             ) or kodiUtilities.getSettingAsBool("scrobble_episode"):
-                result = self.__scrobble("start")
+                # ratings are pre-fetched once Trakt answered the start
+                self.__scrobble("start", self.__startScrobbled)
             elif (
                 kodiUtilities.getSettingAsBool("rate_movie")
                 and utilities.isMovie(self.curVideo["type"])
@@ -415,13 +416,16 @@ class Scrobbler:
                 }
                 result["episode"]["season"] = self.curVideoInfo["season"]
 
-            if result and "id" in self.curVideo:
-                if utilities.isMovie(self.curVideo["type"]) and "movie" in result:
-                    result["movie"]["movieid"] = self.curVideo["id"]
-                elif utilities.isEpisode(self.curVideo["type"]) and "episode" in result:
-                    result["episode"]["episodeid"] = self.curVideo["id"]
+            self.__startScrobbled(result)
 
-            self.__preFetchUserRatings(result)
+    def __startScrobbled(self, result: Dict) -> None:
+        if result and "id" in self.curVideo:
+            if utilities.isMovie(self.curVideo["type"]) and "movie" in result:
+                result["movie"]["movieid"] = self.curVideo["id"]
+            elif utilities.isEpisode(self.curVideo["type"]) and "episode" in result:
+                result["episode"]["episodeid"] = self.curVideo["id"]
+
+        self.__preFetchUserRatings(result)
 
     def __preFetchUserRatings(self, result: Dict) -> None:
         if result:
@@ -504,13 +508,15 @@ class Scrobbler:
         self.stopScrobbler = False
         if self.watchedTime != 0:
             if "type" in self.curVideo:
-                self.__scrobble("stop")
-                ratingCheck(
-                    self.curVideo["type"],
-                    self.videosToRate,
-                    self.watchedTime,
-                    self.videoDuration,
-                )
+                rating = (self.curVideo["type"], self.videosToRate, self.watchedTime, self.videoDuration)
+
+                def stopped(response: Dict) -> None:
+                    # on the scrobble thread, the rating dialog is modal
+                    threading.Thread(target=ratingCheck, args=rating, name="trakt-rating").start()
+
+                # only ask for a rating once Trakt has the stop
+                if not self.__scrobble("stop", onStopped=stopped):
+                    ratingCheck(*rating)
             self.watchedTime = 0
             self.isPVR = False
             self.isMultiPartEpisode = False
@@ -526,9 +532,28 @@ class Scrobbler:
         else:
             return 0
 
-    def __scrobble(self, status: str) -> Optional[Dict]:
+    def __scrobble(
+        self,
+        status: str,
+        onStarted: Optional[Callable[[Dict], None]] = None,
+        onStopped: Optional[Callable[[Dict], None]] = None,
+    ) -> bool:
+        """Journal a scrobble of the current video, it is sent to Trakt in the background.
+
+        onStarted is called with the Trakt response of a start scrobble, as long
+        as the video is still playing by then, onStopped with the response of a
+        stop. Both run on the sender thread, also when the event was folded
+        into a later one for the same item (with that event's response).
+
+        Unlike the old synchronous call, the Trakt response isn't known yet:
+        callers move on to the next playback state as soon as the event is
+        journaled, even if sending it later fails. Failed sends are retried by
+        the sender, expired stops end up in the history retry queue.
+
+        :return: True once the event is journaled, False if nothing was scrobbled
+        """
         if not self.curVideoInfo:
-            return
+            return False
 
         logger.info("Scrobble '%s'" % status)
         scrobbleMovieOption = kodiUtilities.getSettingAsBool("scrobble_movie")
@@ -539,33 +564,11 @@ class Scrobbler:
         # Trakt returns 422 for stop with progress < 1%, skip the call
         if status == "stop" and watchedPercent < 1.0:
             logger.debug("Progress too low (%.1f%%), skipping stop scrobble" % watchedPercent)
-            return None
+            return False
 
         if utilities.isMovie(self.curVideo["type"]) and scrobbleMovieOption:
-            response = self.traktapi.scrobbleMovie(
-                self.curVideoInfo, watchedPercent, status
-            )
-            if response is not None:
-                if status == "stop":
-                    self.__clearPlaybackProgress(response)
-                if response.get("duplicate"):
-                    logger.debug("Movie already scrobbled recently, skipping notification")
-                else:
-                    self.__scrobbleNotification(response)
-                logger.debug("Scrobble response: %s" % str(response))
-                return response
-            else:
-                logger.debug(
-                    "Failed to scrobble movie: %s | %s | %s"
-                    % (self.curVideoInfo, watchedPercent, status)
-                )
-                # Only queue if watched enough to count (Trakt's threshold is 80%)
-                if status == "stop" and watchedPercent >= 80:
-                    self.scrobble_queue.add(
-                        "movie", self.curVideoInfo, None,
-                        watchedPercent,
-                        datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
-                    )
+            mediaType = "movie"
+            showInfo = None
 
         elif utilities.isEpisode(self.curVideo["type"]) and scrobbleEpisodeOption:
             if self.isMultiPartEpisode:
@@ -585,82 +588,154 @@ class Scrobbler:
                 "scrobble sending show object: %s" % str(self.traktShowSummary)
             )
             logger.debug("scrobble sending episode object: %s" % str(self.curVideoInfo))
-            response = self.traktapi.scrobbleEpisode(
-                self.traktShowSummary, self.curVideoInfo, watchedPercent, status
+            mediaType = "episode"
+            showInfo = self.traktShowSummary
+
+        else:
+            return False
+
+        curVideoInfo = self.curVideoInfo
+        isPVR = self.isPVR
+
+        def scrobbled(response: Dict, superseded: bool) -> None:
+            self.__scrobbled(
+                status, mediaType, curVideoInfo, isPVR, response, onStarted, onStopped, superseded
             )
 
-            if kodiUtilities.getSettingAsBool("scrobble_secondary_title"):
+        self.sender.add(mediaType, curVideoInfo, showInfo, status, watchedPercent, scrobbled)
+        return True
+
+    def __send(self, event: Dict) -> Optional[Dict]:
+        """Send a journaled scrobble event, runs on the sender thread."""
+        status = event["status"]
+        watchedPercent = event["progress"]
+
+        if event["media_type"] == "movie":
+            response = self.traktapi.scrobbleMovie(event["media_info"], watchedPercent, status)
+            if response is None:
                 logger.debug(
-                    "[traktPlayer] Setting is enabled to try secondary show title, if necessary."
+                    "Failed to scrobble movie: %s | %s | %s"
+                    % (event["media_info"], watchedPercent, status)
                 )
-                # If there is an empty response, the reason might be that the title we have isn't the actual show title,
-                # but rather an alternative title. To handle this case, call the Trakt search function.
-                if response is None:
-                    logger.debug(
-                        "Searching for show title: %s" % self.traktShowSummary["title"]
-                    )
-                    # This text query API is basically the same as searching on the website. Works with alternative
-                    # titles, unlike the scrobble function.
-                    newResp = self.traktapi.getTextQuery(
-                        self.traktShowSummary["title"], "show", None
-                    )
-                    if not newResp:
-                        logger.debug("Empty Response from getTextQuery, giving up")
-                    else:
-                        logger.debug(
-                            "Got Response from getTextQuery: %s" % str(newResp)
-                        )
-                        # We got something back. Have to assume the first show found is the right one; if there's more than
-                        # one, there's no way to know which to use. Pull the primary title from the response (and the year,
-                        # just because it's there).
-                        showObj = {"title": newResp[0].title, "year": newResp[0].year}
-                        logger.debug(
-                            "scrobble sending getTextQuery first show object: %s"
-                            % str(showObj)
-                        )
-                        # Now we can attempt the scrobble again, using the primary title this time.
-                        response = self.traktapi.scrobbleEpisode(
-                            showObj, self.curVideoInfo, watchedPercent, status
-                        )
+            return response
 
-            if response is not None:
-                if status == "stop":
-                    self.__clearPlaybackProgress(response)
-                if response.get("duplicate"):
-                    logger.debug("Episode already scrobbled recently, skipping notification")
-                    return response
+        response = self.traktapi.scrobbleEpisode(
+            event["show_info"], event["media_info"], watchedPercent, status
+        )
 
-                # Don't scrobble incorrect episode, episode numbers can differ from database. ie Aired vs. DVD order. Use fuzzy logic to match episode title.
-                if self.isPVR and "episode" in response and not utilities._fuzzyMatch(
-                    self.curVideoInfo["title"], response["episode"]["title"], 50.0
-                ):
-                    logger.debug(
-                        "scrobble sending incorrect scrobbleEpisode stopping: %sx%s - %s != %s"
-                        % (
-                            self.curVideoInfo["season"],
-                            self.curVideoInfo["number"],
-                            self.curVideoInfo["title"],
-                            response["episode"]["title"],
-                        )
+        if kodiUtilities.getSettingAsBool("scrobble_secondary_title"):
+            logger.debug(
+                "[traktPlayer] Setting is enabled to try secondary show title, if necessary."
+            )
+            # If there is an empty response, the reason might be that the title we have isn't the actual show title,
+            # but rather an alternative title. To handle this case, call the Trakt search function.
+            if response is None:
+                showObj = self.__findSecondaryShow(event["show_info"]["title"])
+                if showObj:
+                    # Now we can attempt the scrobble again, using the primary title this time.
+                    response = self.traktapi.scrobbleEpisode(
+                        showObj, event["media_info"], watchedPercent, status
                     )
-                    self.stopScrobbler = True
 
-                self.__scrobbleNotification(response)
-                logger.debug("Scrobble response: %s" % str(response))
-                return response
-            else:
-                logger.debug(
-                    "Failed to scrobble episode: %s | %s | %s | %s"
-                    % (self.traktShowSummary, self.curVideoInfo, watchedPercent, status)
+        if response is None:
+            logger.debug(
+                "Failed to scrobble episode: %s | %s | %s | %s"
+                % (event["show_info"], event["media_info"], watchedPercent, status)
+            )
+        return response
+
+    def __scrobbled(
+        self,
+        status: str,
+        mediaType: str,
+        curVideoInfo: Dict,
+        isPVR: bool,
+        response: Dict,
+        onStarted: Optional[Callable[[Dict], None]],
+        onStopped: Optional[Callable[[Dict], None]],
+        superseded: bool,
+    ) -> None:
+        if status == "start" and onStarted and curVideoInfo is self.curVideoInfo:
+            onStarted(response)
+        if status == "stop" and onStopped:
+            onStopped(response)
+        if superseded:
+            # the event it was folded into cleans up and notifies for itself
+            return
+
+        logger.debug("Scrobble response: %s" % str(response))
+        if status == "stop":
+            self.__clearPlaybackProgress(mediaType, response)
+
+        if response.get("duplicate"):
+            logger.debug("%s already scrobbled recently, skipping notification" % mediaType.capitalize())
+            return
+
+        # Don't scrobble incorrect episode, episode numbers can differ from database. ie Aired vs. DVD order. Use fuzzy logic to match episode title.
+        if mediaType == "episode" and isPVR and "episode" in response and not utilities._fuzzyMatch(
+            curVideoInfo["title"], response["episode"]["title"], 50.0
+        ):
+            logger.debug(
+                "scrobble sending incorrect scrobbleEpisode stopping: %sx%s - %s != %s"
+                % (
+                    curVideoInfo["season"],
+                    curVideoInfo["number"],
+                    curVideoInfo["title"],
+                    response["episode"]["title"],
                 )
-                if status == "stop" and watchedPercent >= 80:
-                    self.scrobble_queue.add(
-                        "episode", self.curVideoInfo, self.traktShowSummary,
-                        watchedPercent,
-                        datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
-                    )
+            )
+            self.stopScrobbler = True
+
+        self.__scrobbleNotification(mediaType, response)
+
+    def __addToRate(self, curVideoInfo: Dict) -> Callable[[Dict], None]:
+        # the list of the video playing now, a new video starts a new list
+        videosToRate = self.videosToRate
+
+        def stopped(response: Dict) -> None:
+            videosToRate.append(curVideoInfo)
+
+        return stopped
+
+    def __scrobbleExpired(self, event: Dict) -> None:
+        # Only queue if watched enough to count (Trakt's threshold is 80%)
+        if event["progress"] >= 80:
+            self.scrobble_queue.add(
+                event["media_type"], event["media_info"], event["show_info"],
+                event["progress"],
+                datetime.fromtimestamp(event["created_at"], timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            )
+
+    def close(self) -> None:
+        self.sender.stop()
+
+    def __findSecondaryShow(self, title: str) -> Optional[Dict]:
+        """Find the primary title of a show by one of its alternative titles.
+
+        The text search results are kept by traktapi's search cache, so every
+        later start/pause/stop of the show is answered locally.
+        """
+        logger.debug("Searching for show title: %s" % title)
+        # This text query API is basically the same as searching on the website. Works with alternative
+        # titles, unlike the scrobble function.
+        newResp = self.traktapi.getTextQuery(title, "show", None)
+        if newResp is None:
+            logger.debug("Empty Response from getTextQuery, giving up")
+            return None
 
-    def __clearPlaybackProgress(self, response: Dict) -> None:
+        showObj = None
+        if newResp:
+            logger.debug("Got Response from getTextQuery: %s" % str(newResp))
+            # We got something back. Have to assume the first show found is the right one; if there's more than
+            # one, there's no way to know which to use. Pull the primary title from the response (and the year,
+            # just because it's there).
+            showObj = {"title": newResp[0].title, "year": newResp[0].year}
+            logger.debug("scrobble sending getTextQuery first show object: %s" % str(showObj))
+        else:
+            logger.debug("Empty Response from getTextQuery, giving up")
+        return showObj
+
+    def __clearPlaybackProgress(self, mediaType: str, response: Dict) -> None:
         """If setting enabled and stop resulted in a pause (not a scrobble),
         delete the playback progress entry from Trakt."""
         if not kodiUtilities.getSettingAsBool("clear_playback_progress"):
@@ -668,7 +743,6 @@ class Scrobbler:
         if not response or response.get("action") != "pause":
             return
 
-        mediaType = self.curVideo.get("type")
         # Extract trakt ID from the response
         traktId = None
         if mediaType == "movie" and "movie" in response:
@@ -680,12 +754,10 @@ class Scrobbler:
             logger.debug("Clearing playback progress for %s trakt:%s" % (mediaType, traktId))
             self.traktapi.removePlaybackProgressForItem(mediaType, traktId)
 
-    def __scrobbleNotification(self, info: Dict) -> None:
-        if not self.curVideoInfo:
+    def __scrobbleNotification(self, mediaType: str, info: Dict) -> None:
+        if mediaType not in info:
             return
 
         if kodiUtilities.getSettingAsBool("scrobble_notification"):
-            s = utilities.getFormattedItemName(
-                self.curVideo["type"], info[self.curVideo["type"]]
-            )
+            s = utilities.getFormattedItemName(mediaType, info[mediaType])
             kodiUtilities.notification(kodiUtilities.getString(32015), s)
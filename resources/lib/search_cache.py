@@ -0,0 +1,79 @@
+import os
+import logging
+import time
+from json import loads, dumps
+from typing import List, Optional
+
+import xbmcvfs
+import xbmcaddon
+
+from resources.lib.sqlite_connections import ThreadConnections
+
+logger = logging.getLogger(__name__)
+
+__addon__ = xbmcaddon.Addon("script.trakt")
+
+# ids and titles rarely move on Trakt, misses are retried sooner since the
+# item may just not have been added yet
+FOUND_TTL = 30 * 24 * 60 * 60
+NOT_FOUND_TTL = 24 * 60 * 60
+
+
+class SearchCache:
+    """Remembers Trakt search results (id lookups and text queries) between playbacks.
+
+    Results are stored as the raw search items, keyed by e.g.
+    "lookup/tvdb/12345" or "query/show/2019/some title".
+    """
+
+    _create = (
+        "CREATE TABLE IF NOT EXISTS search_results ("
+        "  key TEXT PRIMARY KEY,"
+        "  items TEXT NOT NULL,"
+        "  expires REAL NOT NULL"
+        ")"
+    )
+
+    def __init__(self):
+        self.path = xbmcvfs.translatePath(__addon__.getAddonInfo("profile"))
+        if not xbmcvfs.exists(self.path):
+            xbmcvfs.mkdir(self.path)
+        self.path = os.path.join(self.path, "cache.db")
+        self._connections = ThreadConnections(self.path)
+        with self._get_conn() as conn:
+            conn.execute(self._create)
+
+    def _get_conn(self):
+        return self._connections.get()
+
+    @staticmethod
+    def lookupKey(id: str, id_type: str) -> str:
+        return "lookup/%s/%s" % (id_type, id)
+
+    @staticmethod
+    def queryKey(query: str, type: str, year: Optional[int]) -> str:
+        return "query/%s/%s/%s" % (type, year or "", query.strip().lower())
+
+    def get(self, key: str) -> Optional[List]:
+        """Return the cached items for key (an empty list for a cached miss), or None."""
+        with self._get_conn() as conn:
+            row = conn.execute(
+                "SELECT items FROM search_results WHERE key = ? AND expires > ?",
+                (key, time.time()),
+            ).fetchone()
+        if not row:
+            return None
+        logger.debug("Search cache hit for %s" % key)
+        return loads(row[0])
+
+    def put(self, key: str, items: List) -> None:
+        ttl = FOUND_TTL if items else NOT_FOUND_TTL
+        with self._get_conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO search_results (key, items, expires) VALUES (?, ?, ?)",
+                (key, dumps(items), time.time() + ttl),
+            )
+
+    def purge(self) -> None:
+        with self._get_conn() as conn:
+            conn.execute("DELETE FROM search_results WHERE expires <= ?", (time.time(),))
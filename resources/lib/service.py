@@ -18,20 +18,42 @@ from resources.lib.scrobbler import Scrobbler
 from resources.lib.sync import Sync
 from resources.lib.traktapi import traktAPI
 from trakt.core.helpers import to_iso8601_datetime
+from trakt.core.ratelimit import LANE_DEFERRED, LANE_INTERACTIVE
 
 logger = logging.getLogger(__name__)
 
+# queued actions taken off the dispatch queue at once
+DISPATCH_BATCH = 50
+# the dispatch thread wakes up when an action is queued, or after this many
+# seconds for the transition and retry checks
+DISPATCH_WAIT = 1
+
+# failed scrobbles back off on their own, this only bounds how often the
+# queue is looked at
+RETRY_CHECK_INTERVAL = 30
+# failed scrobbles sent per sync/history request
+RETRY_BATCH = 100
+
 
 class traktService:
     def __init__(self) -> None:
         self.scrobbler = None
         self.updateTagsThread = None
         self.syncThread = None
-        self.dispatchQueue = sqlitequeue.SqliteQueue()
+        self.dispatchQueue = sqlitequeue.DispatchQueue()
+        self.dispatchQueued = threading.Event()
+        self.dispatchThread = None
+        self._stopping = False
 
     def _dispatchQueue(self, data: Dict) -> None:
         logger.debug("Queuing for dispatch: %s" % data)
         self.dispatchQueue.append(data)
+        self.dispatchQueued.set()
+
+    def _reloadQueue(self) -> None:
+        # the context menu script queued an action from its own process
+        self.dispatchQueue.reload()
+        self.dispatchQueued.set()
 
     def _dispatch(self, data: Dict) -> None:
         try:
@@ -97,65 +119,65 @@ class traktService:
 
     def _retryFailedScrobbles(self) -> None:
         queue = self.scrobbler.scrobble_queue
-        pending = queue.get_pending()
+        pending = queue.get_pending(due_only=True)
         if not pending:
             return
 
         logger.info("[RetryScrobbles] %d pending scrobble(s) to retry" % len(pending))
-        for item in pending:
-            media_type = item["media_type"]
-            media_info = item["media_info"]
-            show_info = item["show_info"]
-            watched_at = item["watched_at"]
-
-            if media_type == "movie":
-                ids = media_info.get("ids", {})
-                payload = {
-                    "movies": [
-                        {
-                            "ids": ids,
-                            "title": media_info.get("title"),
-                            "year": media_info.get("year"),
-                            "watched_at": watched_at,
-                        }
-                    ]
-                }
-            elif media_type == "episode":
-                show_ids = show_info.get("ids", {}) if show_info else {}
-                payload = {
-                    "shows": [
-                        {
-                            "ids": show_ids,
-                            "title": show_info.get("title") if show_info else None,
-                            "year": show_info.get("year") if show_info else None,
-                            "seasons": [
-                                {
-                                    "number": media_info.get("season"),
-                                    "episodes": [
-                                        {
-                                            "number": media_info.get("number"),
-                                            "watched_at": watched_at,
-                                        }
-                                    ],
-                                }
-                            ],
-                        }
-                    ]
-                }
-            else:
-                queue.remove(item["id"])
-                continue
-
-            result = globals.traktapi.addToHistory(payload)
-            if result is not None:
-                logger.info("[RetryScrobbles] Successfully retried %s scrobble" % media_type)
-                queue.remove(item["id"])
-            else:
-                queue.increment_retry(item["id"])
+        unknown = [item for item in pending if item["media_type"] not in ("movie", "episode")]
+        if unknown:
+            queue.remove_many([item["id"] for item in unknown])
+
+        pending = [item for item in pending if item["media_type"] in ("movie", "episode")]
+        for batch in utilities.chunks(pending, RETRY_BATCH):
+            result = globals.traktapi.addToHistory(
+                utilities.buildHistoryPayload(batch), lane=LANE_DEFERRED
+            )
+            if result is None:
+                # Trakt likely still down, leave the rest for the next check
+                queue.increment_retries([item["id"] for item in batch])
                 logger.debug("[RetryScrobbles] Retry failed, will try again later")
-                # Trakt likely still down, stop burning through the queue
                 break
 
+            notFound = utilities.findNotFoundScrobbles(batch, result.get("not_found", {}))
+            if notFound:
+                logger.debug("[RetryScrobbles] %d scrobble(s) not found on Trakt" % len(notFound))
+                queue.increment_retries([item["id"] for item in notFound])
+            notFoundIds = set(item["id"] for item in notFound)
+            queue.remove_many([item["id"] for item in batch if item["id"] not in notFoundIds])
+            logger.info(
+                "[RetryScrobbles] Successfully retried %d scrobble(s)" % (len(batch) - len(notFound))
+            )
+
+    def _dispatchLoop(self) -> None:
+        while not self._stopping:
+            # blocks until an action is queued, with a fallback for the
+            # periodic checks below
+            self.dispatchQueued.wait(DISPATCH_WAIT)
+            self.dispatchQueued.clear()
+            if self._stopping:
+                break
+
+            try:
+                batch = self.dispatchQueue.get_many(DISPATCH_BATCH)
+                while batch and not self._stopping:
+                    for data in utilities.coalesceEvents(batch):
+                        logger.debug("Queued dispatch: %s" % data)
+                        self._dispatch(data)
+                    batch = self.dispatchQueue.get_many(DISPATCH_BATCH)
+
+                if time.time() - self._last_transition_check >= 1:
+                    self._last_transition_check = time.time()
+                    if self.Player.isPlayingVideo():
+                        self.scrobbler.transitionCheck()
+
+                if time.time() - self._last_retry_check > RETRY_CHECK_INTERVAL:
+                    self._last_retry_check = time.time()
+                    self._retryFailedScrobbles()
+            except Exception as ex:
+                message = utilities.createError(ex)
+                logger.fatal(message)
+
     def run(self) -> None:
         startup_delay = kodiUtilities.getSettingAsInt("startup_delay")
         if startup_delay:
@@ -165,16 +187,18 @@ class traktService:
         logger.debug("Service thread starting.")
 
         # Log and discard stale queue items from previous session
-        stale_count = len(self.dispatchQueue)
+        stale_count = len(self.dispatchQueue.store)
         if stale_count > 0:
             logger.debug("Discarding %d stale item(s) from dispatch queue." % stale_count)
-            for item in self.dispatchQueue:
+            for item in self.dispatchQueue.store:
                 logger.debug("Discarded queue item: %s" % item)
             self.dispatchQueue.purge()
 
         # setup event driven classes
         self.Player = traktPlayer(action=self._dispatchQueue)
-        self.Monitor = traktMonitor(action=self._dispatchQueue)
+        self.Monitor = traktMonitor(
+            action=self._dispatchQueue, queued=self._reloadQueue
+        )
 
         # init traktapi class
         globals.traktapi = traktAPI()
@@ -198,21 +222,15 @@ class traktService:
         # init scrobbler class
         self.scrobbler = Scrobbler()
         self._last_retry_check = time.time()
+        self._last_transition_check = 0.0
 
-        # start loop for events
-        while not self.Monitor.abortRequested():
-            while len(self.dispatchQueue) and (not self.Monitor.abortRequested()):
-                data = self.dispatchQueue.get()
-                logger.debug("Queued dispatch: %s" % data)
-                self._dispatch(data)
-
-            if self.Player.isPlayingVideo():
-                self.scrobbler.transitionCheck()
-
-            if time.time() - self._last_retry_check > 300:
-                self._last_retry_check = time.time()
-                self._retryFailedScrobbles()
+        # queued actions are dispatched on a thread of their own, this one
+        # has to stay in waitForAbort() for Kodi to run the player/monitor
+        # callbacks that queue them
+        self.dispatchThread = threading.Thread(target=self._dispatchLoop, name="trakt-dispatch")
+        self.dispatchThread.start()
 
+        while not self.Monitor.abortRequested():
             if self.Monitor.waitForAbort(1):
                 # Abort was requested while waiting. We should exit
                 break
@@ -220,10 +238,17 @@ class traktService:
         # we are shutting down
         logger.debug("Beginning shut down.")
 
+        self._stopping = True
+        self.dispatchQueued.set()
+        self.dispatchThread.join()
+
         # delete player/monitor
         del self.Player
         del self.Monitor
 
+        # stop replaying the scrobble journal, what's left is sent next time
+        self.scrobbler.close()
+
         # check if sync thread is running, if so, join it.
         if self.syncThread.is_alive():
             self.syncThread.join()
@@ -410,7 +435,7 @@ class traktService:
                     params = {"movies": [summaryInfo]}
                     logger.debug("doMarkWatched(): %s" % str(params))
 
-                    result = globals.traktapi.addToHistory(params)
+                    result = globals.traktapi.addToHistory(params, lane=LANE_INTERACTIVE)
                     if result:
                         kodiUtilities.notification(kodiUtilities.getString(32113), s)
                     else:
@@ -432,7 +457,7 @@ class traktService:
             logger.debug("doMarkWatched(): %s" % str(summaryInfo))
             s = utilities.getFormattedItemName(media_type, data)
 
-            result = globals.traktapi.addToHistory(summaryInfo)
+            result = globals.traktapi.addToHistory(summaryInfo, lane=LANE_INTERACTIVE)
             if result:
                 kodiUtilities.notification(kodiUtilities.getString(32113), s)
             else:
@@ -480,7 +505,7 @@ class traktService:
         if len(summaryInfo["shows"][0]["seasons"][0]["episodes"]) > 0:
             logger.debug("doMarkWatched(): %s" % str(summaryInfo))
 
-            result = globals.traktapi.addToHistory(summaryInfo)
+            result = globals.traktapi.addToHistory(summaryInfo, lane=LANE_INTERACTIVE)
             if result:
                 kodiUtilities.notification(
                     kodiUtilities.getString(32113),
@@ -649,11 +674,18 @@ class traktMonitor(xbmc.Monitor):
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         self.action = kwargs["action"]
+        self.queued = kwargs.get("queued")
         # xbmc.getCondVisibility('Library.IsScanningVideo') returns false when cleaning during update...
         self.scanning_video = False
         logger.debug("[traktMonitor] Initalized.")
 
     def onNotification(self, sender: str, method: str, data: str) -> None:
+        # the context menu script queued an action from its own process
+        if sender == "script.trakt" and method.endswith(".dispatchQueued"):
+            if self.queued:
+                self.queued()
+            return
+
         # method looks like Other.NEXTUPWATCHEDSIGNAL
         if "." not in method or method.split(".")[1].upper() != "NEXTUPWATCHEDSIGNAL":
             return
@@ -0,0 +1,81 @@
+import os
+import logging
+import time
+from json import loads, dumps
+
+import xbmcvfs
+import xbmcaddon
+
+from resources.lib.sqlite_connections import ThreadConnections
+
+logger = logging.getLogger(__name__)
+
+__addon__ = xbmcaddon.Addon("script.trakt")
+
+# snapshots older than this are refreshed in full even if their stamp still
+# matches, this bounds how long changes that deltas can't see (history
+# removals, backdated plays from other apps) can go unnoticed
+MAX_AGE = 7 * 24 * 60 * 60
+
+
+class SnapshotStore:
+    """Persists the raw Trakt sync payloads (collection, watched, ratings) between syncs.
+
+    Every snapshot is keyed by endpoint (e.g. "sync/watched/shows") and stamped
+    with the last_activities timestamp it was fetched for.
+    """
+
+    _create = (
+        "CREATE TABLE IF NOT EXISTS snapshots ("
+        "  endpoint TEXT PRIMARY KEY,"
+        "  stamp TEXT NOT NULL,"
+        "  items TEXT NOT NULL,"
+        "  fetched_at REAL NOT NULL"
+        ")"
+    )
+
+    def __init__(self):
+        self.path = xbmcvfs.translatePath(__addon__.getAddonInfo("profile"))
+        if not xbmcvfs.exists(self.path):
+            xbmcvfs.mkdir(self.path)
+        self.path = os.path.join(self.path, "cache.db")
+        self._connections = ThreadConnections(self.path)
+        with self._get_conn() as conn:
+            conn.execute(self._create)
+
+    def _get_conn(self):
+        return self._connections.get()
+
+    def get(self, endpoint):
+        """Return the snapshot for endpoint, or None if there is none or it is too old."""
+        with self._get_conn() as conn:
+            row = conn.execute(
+                "SELECT stamp, items, fetched_at FROM snapshots WHERE endpoint = ?",
+                (endpoint,),
+            ).fetchone()
+        if not row:
+            return None
+        if row[2] < time.time() - MAX_AGE:
+            logger.debug("Snapshot for %s is too old, ignoring it" % endpoint)
+            return None
+        return {"stamp": row[0], "items": loads(row[1]), "fetched_at": row[2]}
+
+    def put(self, endpoint, stamp, items, fetched_at=None):
+        with self._get_conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO snapshots (endpoint, stamp, items, fetched_at) "
+                "VALUES (?, ?, ?, ?)",
+                (endpoint, stamp, dumps(items), fetched_at or time.time()),
+            )
+
+    def invalidate(self, prefix):
+        """Drop every snapshot whose endpoint starts with prefix."""
+        with self._get_conn() as conn:
+            conn.execute(
+                "DELETE FROM snapshots WHERE substr(endpoint, 1, ?) = ?",
+                (len(prefix), prefix),
+            )
+
+    def purge(self):
+        with self._get_conn() as conn:
+            conn.execute("DELETE FROM snapshots")
@@ -0,0 +1,47 @@
+import sqlite3
+import logging
+import threading
+import weakref
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadConnections:
+    """Hands out one SQLite connection per thread for a database file.
+
+    Connections live in a threading.local, so looking one up costs a single
+    attribute access. A finalizer on the owning thread closes the connection
+    once the thread is gone. Databases are switched to WAL so readers (the
+    service, the context menu script) no longer block the writer.
+    """
+
+    def __init__(self, path: str, timeout: float = 60) -> None:
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def get(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            weakref.finalize(threading.current_thread(), _close, conn)
+        return conn
+
+    def _connect(self) -> sqlite3.Connection:
+        # only ever used by the thread that opened it, the finalizer may run
+        # on another thread though
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            # safe with WAL, only the last commits may be lost on power loss
+            conn.execute("PRAGMA synchronous=NORMAL")
+        except sqlite3.Error as ex:
+            logger.debug("Unable to enable WAL for %s: %s" % (self.path, ex))
+        return conn
+
+
+def _close(conn: sqlite3.Connection) -> None:
+    try:
+        conn.close()
+    except Exception:
+        pass
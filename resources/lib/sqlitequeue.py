@@ -2,15 +2,15 @@ import os
 import sqlite3
 from json import loads, dumps
 
-from time import sleep
-
 import threading
-from _thread import get_ident
+from collections import deque
 
 import xbmcvfs
 import xbmcaddon
 import logging
-from typing import Any, Iterator, Optional, Dict
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+from resources.lib.sqlite_connections import ThreadConnections
 
 logger = logging.getLogger(__name__)
 
@@ -27,13 +27,8 @@ class SqliteQueue:
                 ')'
                 )
     _count = 'SELECT COUNT(*) FROM queue'
-    _iterate = 'SELECT id, item FROM queue'
+    _iterate = 'SELECT id, item FROM queue ORDER BY id'
     _append = 'INSERT INTO queue (item) VALUES (?)'
-    _write_lock = 'BEGIN IMMEDIATE'
-    _get = (
-            'SELECT id, item FROM queue '
-            'ORDER BY id LIMIT 1'
-            )
     _del = 'DELETE FROM queue WHERE id = ?'
     _peek = (
             'SELECT item FROM queue '
@@ -42,7 +37,7 @@ class SqliteQueue:
     _purge = 'DELETE FROM queue'
 
     path: str
-    _connection_cache: Dict[int, sqlite3.Connection]
+    _connections: ThreadConnections
 
     def __init__(self) -> None:
         self.path = xbmcvfs.translatePath(__addon__.getAddonInfo("profile"))
@@ -50,7 +45,7 @@ class SqliteQueue:
             logger.debug("Making path structure: %s" % repr(self.path))
             xbmcvfs.mkdir(self.path)
         self.path = os.path.join(self.path, 'queue.db')
-        self._connection_cache = {}
+        self._connections = ThreadConnections(self.path)
         with self._get_conn() as conn:
             conn.execute(self._create)
 
@@ -60,61 +55,33 @@ class SqliteQueue:
         return executed
 
     def __iter__(self) -> Iterator[Any]:
+        for _, obj in self.rows():
+            yield obj
+
+    def rows(self) -> Iterator[Tuple[int, Any]]:
         with self._get_conn() as conn:
-            for _, obj_buffer in conn.execute(self._iterate):
-                yield loads(obj_buffer)
+            for row_id, obj_buffer in conn.execute(self._iterate):
+                yield row_id, loads(obj_buffer)
 
     def _get_conn(self) -> sqlite3.Connection:
-        tid = get_ident()
-        # Evict connections from dead threads to prevent unbounded cache growth
-        alive_tids = {t.ident for t in threading.enumerate()}
-        stale_tids = [t for t in self._connection_cache if t not in alive_tids]
-        for stale_tid in stale_tids:
-            try:
-                self._connection_cache[stale_tid].close()
-            except Exception:
-                pass
-            del self._connection_cache[stale_tid]
-        if tid not in self._connection_cache:
-            self._connection_cache[tid] = sqlite3.Connection(self.path, timeout=60)
-        return self._connection_cache[tid]
+        return self._connections.get()
 
     def purge(self) -> None:
         with self._get_conn() as conn:
             conn.execute(self._purge)
 
-    def append(self, obj: Any) -> None:
+    def append(self, obj: Any) -> int:
         obj_buffer = dumps(obj)
         with self._get_conn() as conn:
-            conn.execute(self._append, (obj_buffer,))
+            return conn.execute(self._append, (obj_buffer,)).lastrowid
+
+    def remove(self, row_id: int) -> None:
+        with self._get_conn() as conn:
+            conn.execute(self._del, (row_id,))
 
-    def get(self, sleep_wait: bool = True) -> Optional[Any]:
-        keep_pooling = True
-        wait = 0.1
-        max_wait = 2
-        tries = 0
+    def remove_many(self, row_ids: Iterable[int]) -> None:
         with self._get_conn() as conn:
-            row_id = None
-            obj_buffer = None
-            while keep_pooling:
-                conn.execute(self._write_lock)
-                cursor = conn.execute(self._get)
-                row = cursor.fetchone()
-                if row:
-                    row_id, obj_buffer = row
-                    keep_pooling = False
-                else:
-                    conn.commit()  # unlock the database
-                    if not sleep_wait:
-                        keep_pooling = False
-                        continue
-                    tries += 1
-                    sleep(wait)
-                    wait = min(max_wait, tries / 10 + wait)
-            if row_id:
-                conn.execute(self._del, (row_id,))
-                return loads(obj_buffer)
-        return None
+            conn.executemany(self._del, [(row_id,) for row_id in row_ids])
 
     def peek(self) -> Optional[Any]:
         with self._get_conn() as conn:
@@ -122,3 +89,64 @@ class SqliteQueue:
             if row:
                 return loads(row[0])
             return None
+
+
+class DispatchQueue:
+    """In-memory queue of service actions, written through to a SqliteQueue.
+
+    The service's dispatch thread drains it without touching SQLite for
+    reads, the SQLite copy only keeps items across restarts and lets other
+    processes (the context menu script) queue actions, which are picked up
+    by reload().
+    """
+
+    store: SqliteQueue
+
+    def __init__(self, store: Optional[SqliteQueue] = None) -> None:
+        self.store = store or SqliteQueue()
+        self._items = deque()
+        self._known = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+    def append(self, obj: Any) -> None:
+        # insert under the lock as well, or a reload() could queue the row
+        # first and get_many() consume it before it is pushed here again
+        with self._lock:
+            self._push(self.store.append(obj), obj)
+
+    def reload(self) -> None:
+        """Pick up items other processes added to the SQLite queue."""
+        with self._lock:
+            for row_id, obj in list(self.store.rows()):
+                self._push(row_id, obj)
+
+    def get_many(self, count: int) -> List[Any]:
+        """Return up to count items, never waits.
+
+        The service waits for new items on its dispatchQueued event instead.
+        """
+        with self._lock:
+            batch = []
+            while self._items and len(batch) < count:
+                batch.append(self._items.popleft())
+            if batch:
+                self.store.remove_many(row_id for row_id, _ in batch)
+            for row_id, _ in batch:
+                self._known.discard(row_id)
+        return [obj for _, obj in batch]
+
+    def purge(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._known.clear()
+        self.store.purge()
+
+    def _push(self, row_id: int, obj: Any) -> None:
+        if row_id in self._known:
+            return
+        self._known.add(row_id)
+        self._items.append((row_id, obj))
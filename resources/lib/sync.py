@@ -1,5 +1,6 @@
+import json
 import logging
-from typing import Any
+from typing import Any, Dict, Optional
 
 import xbmc
 import xbmcgui
@@ -23,6 +24,9 @@ class Sync():
         self.sync_on_update = getSettingAsBool('sync_on_update')
         self.notify = getSettingAsBool('show_sync_notifications')
         self.notify_during_playback = not getSettingAsBool("hide_notifications_playback")
+        self.__fullSync = True
+        self.__activities: Dict = {}
+        self.__cachedActivities: Dict = {}
 
     def __syncCheck(self, media_type: str) -> bool:
         return self.__syncCollectionCheck(media_type) or self.__syncWatchedCheck(media_type) or self.__syncPlaybackCheck(media_type) or self.__syncRatingsCheck()
@@ -55,7 +59,7 @@ class Sync():
     def sync(self) -> None:
         logger.info("Starting synchronization with Trakt.tv")
 
-        if not self.manual and self.__canSkipSync():
+        if self.__canSkipSync():
             logger.info("[Sync] No changes on Trakt or Kodi since last sync, skipping.")
             return
 
@@ -85,9 +89,15 @@ class Sync():
         logger.info("[Sync] Finished synchronization with Trakt.tv")
 
     def __canSkipSync(self) -> bool:
-        """Check if sync can be skipped because nothing changed on either side."""
-        if getSettingAsBool("kodi_library_dirty"):
-            logger.debug("[Sync] Kodi library is dirty, cannot skip sync.")
+        """Check if sync can be skipped because nothing changed on either side.
+
+        Also decides whether this is a full sync or one where each phase only
+        runs when its own last_activities category changed, see activityChanged.
+        """
+        self.__fullSync = True
+
+        if self.manual:
+            logger.debug("[Sync] Manual sync, running all sync phases.")
             return False
 
         try:
@@ -99,21 +109,59 @@ class Sync():
         if not activities or "all" not in activities:
             logger.debug("[Sync] Invalid last_activities response, cannot skip sync.")
             return False
+        self.__activities = activities
+
+        if getSettingAsBool("kodi_library_dirty"):
+            logger.debug("[Sync] Kodi library is dirty, cannot skip sync.")
+            return False
 
-        cached = getSetting("last_activities_all")
+        cached = self.__loadCachedActivities()
         current = activities["all"]
 
-        if not cached:
+        if not cached or "all" not in cached:
             logger.debug("[Sync] No cached last_activities, running full sync.")
             return False
 
-        if current == cached:
+        if current == cached["all"]:
             logger.debug("[Sync] last_activities unchanged (%s), skipping sync." % current)
             return True
 
-        logger.debug("[Sync] last_activities changed (cached=%s, current=%s)." % (cached, current))
+        logger.debug("[Sync] last_activities changed (cached=%s, current=%s)." % (cached["all"], current))
+        self.__cachedActivities = cached
+        self.__fullSync = False
+        return False
+
+    def activityChanged(self, section: str, field: str) -> bool:
+        """Check if a last_activities category (e.g. movies/watched_at) changed since the last sync.
+
+        Always true for a full sync, so every phase runs.
+        """
+        if self.__fullSync:
+            return True
+
+        current = self.__activities.get(section, {}).get(field)
+        cached = self.__cachedActivities.get(section, {}).get(field)
+        if current is None or current != cached:
+            logger.debug("[Sync] %s.%s changed (cached=%s, current=%s)." % (section, field, cached, current))
+            return True
+
+        logger.debug("[Sync] %s.%s unchanged, skipping its sync phases." % (section, field))
         return False
 
+    def activityStamp(self, section: str, field: str) -> Optional[str]:
+        """Current last_activities timestamp of a category, None if it wasn't fetched (e.g. manual sync)."""
+        return self.__activities.get(section, {}).get(field)
+
+    def __loadCachedActivities(self) -> Optional[Dict]:
+        cached = getSetting("last_activities")
+        if not cached:
+            return None
+        try:
+            return json.loads(cached)
+        except ValueError:
+            logger.debug("[Sync] Cached last_activities is not valid JSON, ignoring it.")
+            return None
+
     def __saveLastActivities(self) -> None:
         """Cache post-sync timestamps and clear the dirty flag."""
         try:
@@ -123,7 +171,7 @@ class Sync():
             return
 
         if activities and "all" in activities:
-            setSetting("last_activities_all", activities["all"])
+            setSetting("last_activities", json.dumps(activities))
             logger.debug("[Sync] Cached last_activities: %s" % activities["all"])
 
         setSetting("kodi_library_dirty", "false")
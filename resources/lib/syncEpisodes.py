@@ -1,17 +1,37 @@
-import copy
 import logging
-from typing import Dict, Tuple, Union, Optional, Any
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from requests.exceptions import ConnectionError, ConnectTimeout
+from urllib3.exceptions import NewConnectionError
 
 from resources.lib import kodiUtilities, utilities
+from trakt.core.exceptions import RequestError, RequestFailedError
+from trakt.core.ratelimit import LANE_BACKGROUND
 
 logger = logging.getLogger(__name__)
 
 
+def _neverProcessed(ex: Exception) -> bool:
+    """True if ex proves Trakt did not add anything, so the request can be resent.
+
+    sync/history isn't idempotent, after e.g. a read timeout the plays may
+    already have been added.
+    """
+    # Trakt answered with an error status, or nothing was sent at all
+    if isinstance(ex, (RequestError, RequestFailedError, ConnectTimeout)):
+        return True
+    if isinstance(ex, ConnectionError) and ex.args:
+        # connection refused, DNS failure, ...
+        return isinstance(getattr(ex.args[0], "reason", None), NewConnectionError)
+    return False
+
+
 class SyncEpisodes:
     sync: Any
 
     def __init__(self, sync: Any, progress: Any) -> None:
         self.sync = sync
+        self.__traktFetches = {}
         if self.sync.show_notification:
             kodiUtilities.notification(
                 "%s %s"
@@ -64,24 +84,30 @@ class SyncEpisodes:
 
         traktShowsProgress = self.__traktLoadShowsPlaybackProgress(25, 36)
 
+        # index every side once, the compares below all reuse them
+        kodiCollectedIndex = utilities.LibraryIndex(kodiShowsCollected)
+        kodiWatchedIndex = utilities.LibraryIndex(kodiShowsWatched)
+        traktCollectedIndex = utilities.LibraryIndex(traktShowsCollected)
+        traktWatchedIndex = utilities.LibraryIndex(traktShowsWatched)
+
         self.__addEpisodesToTraktCollection(
-            kodiShowsCollected, traktShowsCollected, 37, 47
+            kodiCollectedIndex, traktCollectedIndex, 37, 47
         )
 
         self.__deleteEpisodesFromTraktCollection(
-            traktShowsCollected, kodiShowsCollected, 48, 58
+            traktCollectedIndex, kodiCollectedIndex, 48, 58
         )
 
-        self.__addEpisodesToTraktWatched(kodiShowsWatched, traktShowsWatched, 59, 69)
+        self.__addEpisodesToTraktWatched(kodiWatchedIndex, traktWatchedIndex, 59, 69)
 
         self.__addEpisodesToKodiWatched(
-            traktShowsWatched, kodiShowsWatched, kodiShowsCollected, 70, 80
+            traktWatchedIndex, kodiWatchedIndex, kodiCollectedIndex, 70, 80
         )
 
-        self.__addEpisodeProgressToKodi(traktShowsProgress, kodiShowsCollected, 81, 91)
+        self.__addEpisodeProgressToKodi(traktShowsProgress, kodiCollectedIndex, 81, 91)
 
-        self.__syncShowsRatings(traktShowsRated, kodiShowsCollected, 92, 95)
-        self.__syncEpisodeRatings(traktEpisodesRated, kodiShowsCollected, 96, 99)
+        self.__syncShowsRatings(traktShowsRated, kodiCollectedIndex, 92, 95)
+        self.__syncEpisodeRatings(traktEpisodesRated, kodiCollectedIndex, 96, 99)
 
         if self.sync.show_notification:
             kodiUtilities.notification(
@@ -138,11 +164,30 @@ class SyncEpisodes:
         if tvshows is None:
             return None, None
         self.sync.UpdateProgress(2, line2=kodiUtilities.getString(32096))
+        logger.debug("[Episodes Sync] Getting episode data from Kodi")
+        episodesByShow = kodiUtilities.getEpisodesFromKodiByShow(
+            [
+                "season",
+                "episode",
+                "playcount",
+                "uniqueid",
+                "lastplayed",
+                "file",
+                "dateadded",
+                "runtime",
+                "userrating",
+            ]
+        )
+        if episodesByShow is None:
+            logger.debug(
+                "[Episodes Sync] There was a problem getting episode data from Kodi, aborting sync."
+            )
+            return None, None
+
         resultCollected = {"shows": []}
         resultWatched = {"shows": []}
         i = 0
         x = float(len(tvshows))
-        logger.debug("[Episodes Sync] Getting episode data from Kodi")
         for show_col1 in tvshows:
             i += 1
             y = ((i / x) * 8) + 2
@@ -166,34 +211,8 @@ class SyncEpisodes:
                 "seasons": [],
             }
 
-            data = kodiUtilities.kodiJsonRequest(
-                {
-                    "jsonrpc": "2.0",
-                    "method": "VideoLibrary.GetEpisodes",
-                    "params": {
-                        "tvshowid": show_col1["tvshowid"],
-                        "properties": [
-                            "season",
-                            "episode",
-                            "playcount",
-                            "uniqueid",
-                            "lastplayed",
-                            "file",
-                            "dateadded",
-                            "runtime",
-                            "userrating",
-                        ],
-                    },
-                    "id": 0,
-                }
-            )
-            if not data:
-                logger.debug(
-                    "[Episodes Sync] There was a problem getting episode data for '%s', aborting sync."
-                    % show["title"]
-                )
-                return None, None
-            elif "episodes" not in data:
+            episodes = episodesByShow.get(show_col1["tvshowid"])
+            if not episodes:
                 logger.debug(
                     "[Episodes Sync] '%s' has no episodes in Kodi." % show["title"]
                 )
@@ -203,12 +222,10 @@ class SyncEpisodes:
                 del show_col1["tvshowid"]
 
             showWatched = dict(show)
-            data2 = copy.deepcopy(data)
-            show["seasons"] = kodiUtilities.kodiRpcToTraktMediaObjects(data)
-
-            showWatched["seasons"] = kodiUtilities.kodiRpcToTraktMediaObjects(
-                data2, "watched"
-            )
+            (
+                show["seasons"],
+                showWatched["seasons"],
+            ) = kodiUtilities.kodiRpcToTraktEpisodeProjections(episodes)
 
             resultCollected["shows"].append(show)
             resultWatched["shows"].append(showWatched)
@@ -226,24 +243,27 @@ class SyncEpisodes:
         logger.debug(
             "[Episodes Sync] Getting episode collection/watched/rated from Trakt.tv"
         )
+        # the downloads don't depend on each other, so they all run at once
+        endpoints = []
+        if self.sync.activityChanged("episodes", "collected_at"):
+            endpoints.append(("sync/collection", "shows", self.sync.activityStamp("episodes", "collected_at")))
+        if self.sync.activityChanged("episodes", "watched_at"):
+            endpoints.append(("sync/watched", "shows", self.sync.activityStamp("episodes", "watched_at")))
+        if kodiUtilities.getSettingAsBool("sync_ratings_to_trakt") or kodiUtilities.getSettingAsBool("sync_ratings_to_kodi"):
+            if self.sync.activityChanged("shows", "rated_at"):
+                endpoints.append(("sync/ratings", "shows", self.sync.activityStamp("shows", "rated_at")))
+            if self.sync.activityChanged("episodes", "rated_at"):
+                endpoints.append(("sync/ratings", "episodes", self.sync.activityStamp("episodes", "rated_at")))
+        if kodiUtilities.getSettingAsBool("trakt_episode_playback") and self.sync.activityChanged("episodes", "paused_at"):
+            endpoints.append(("sync/playback", "episodes", None))
+        self.__traktFetches = self.sync.traktapi.fetchSyncItems(endpoints)
+
         try:
-            traktShowsCollected = {}
-            traktShowsCollected = self.sync.traktapi.getShowsCollected(
-                traktShowsCollected
-            )
+            traktShowsCollected = self.__mapTraktFetch("sync/collection", "shows")
             self.sync.UpdateProgress(12, line2=kodiUtilities.getString(32101))
-            traktShowsWatched = {}
-            traktShowsWatched = self.sync.traktapi.getShowsWatched(traktShowsWatched)
-
-            traktShowsRated = {}
-            traktEpisodesRated = {}
-
-            if kodiUtilities.getSettingAsBool("sync_ratings_to_trakt") or kodiUtilities.getSettingAsBool("sync_ratings_to_kodi"):
-                traktShowsRated = self.sync.traktapi.getShowsRated(traktShowsRated)
-
-                traktEpisodesRated = self.sync.traktapi.getEpisodesRated(
-                    traktEpisodesRated
-                )
+            traktShowsWatched = self.__mapTraktFetch("sync/watched", "shows")
+            traktShowsRated = self.__mapTraktFetch("sync/ratings", "shows")
+            traktEpisodesRated = self.__mapTraktFetch("sync/ratings", "episodes")
 
         except Exception:
             logger.debug(
@@ -315,9 +335,18 @@ class SyncEpisodes:
 
         return showsCollected, showsWatched, showsRated, episodesRated
 
+    def __mapTraktFetch(self, path: str, media: str) -> Dict:
+        store = {}
+        if (path, media) in self.__traktFetches:
+            self.sync.traktapi.mapSyncItems(
+                path, media, store, self.__traktFetches[(path, media)].result()
+            )
+        return store
+
     def __traktLoadShowsPlaybackProgress(self, fromPercent: int, toPercent: int) -> Union[Dict, bool, None]:
         if (
             kodiUtilities.getSettingAsBool("trakt_episode_playback")
+            and self.sync.activityChanged("episodes", "paused_at")
             and not self.sync.IsCanceled()
         ):
             self.sync.UpdateProgress(
@@ -328,7 +357,10 @@ class SyncEpisodes:
 
             logger.debug("[Playback Sync] Getting playback progress from Trakt.tv")
             try:
-                traktProgressShows = self.sync.traktapi.getEpisodePlaybackProgress()
+                fetch = self.__traktFetches.get(("sync/playback", "episodes"))
+                traktProgressShows = self.sync.traktapi.getEpisodePlaybackProgress(
+                    fetch.result() if fetch else None
+                )
             except Exception as ex:
                 logger.debug(
                     "[Playback Sync] Invalid Trakt.tv progress list, possible error getting data from Trakt, aborting Trakt.tv playback update. Error: %s"
@@ -356,10 +388,15 @@ class SyncEpisodes:
             return showsProgress
 
     def __addEpisodesToTraktCollection(
-        self, kodiShows: Dict, traktShows: Dict, fromPercent: int, toPercent: int
+        self,
+        kodiShows: utilities.LibraryIndex,
+        traktShows: utilities.LibraryIndex,
+        fromPercent: int,
+        toPercent: int,
     ) -> None:
         if (
             kodiUtilities.getSettingAsBool("sync_collection_episodes_to_trakt")
+            and self.sync.activityChanged("episodes", "collected_at")
             and not self.sync.IsCanceled()
         ):
             traktShowsAdd = utilities.compareEpisodes(
@@ -430,10 +467,15 @@ class SyncEpisodes:
             )
 
     def __deleteEpisodesFromTraktCollection(
-        self, traktShows: Dict, kodiShows: Dict, fromPercent: int, toPercent: int
+        self,
+        traktShows: utilities.LibraryIndex,
+        kodiShows: utilities.LibraryIndex,
+        fromPercent: int,
+        toPercent: int,
     ) -> None:
         if (
             kodiUtilities.getSettingAsBool("sync_clean_collection_episodes_to_trakt")
+            and self.sync.activityChanged("episodes", "collected_at")
             and not self.sync.IsCanceled()
         ):
             traktShowsRemove = utilities.compareEpisodes(
@@ -485,10 +527,15 @@ class SyncEpisodes:
             )
 
     def __addEpisodesToTraktWatched(
-        self, kodiShows: Dict, traktShows: Dict, fromPercent: int, toPercent: int
+        self,
+        kodiShows: utilities.LibraryIndex,
+        traktShows: utilities.LibraryIndex,
+        fromPercent: int,
+        toPercent: int,
     ) -> None:
         if (
             kodiUtilities.getSettingAsBool("sync_playcount_episodes_to_trakt")
+            and self.sync.activityChanged("episodes", "watched_at")
             and not self.sync.IsCanceled()
         ):
             traktShowsUpdate = utilities.compareEpisodes(
@@ -529,25 +576,20 @@ class SyncEpisodes:
             errorcount = 0
             i = 0
             x = float(len(traktShowsUpdate["shows"]))
-            for show in traktShowsUpdate["shows"]:
+            for batch in utilities.batchShows(traktShowsUpdate["shows"]):
                 if self.sync.IsCanceled():
                     return
-                epCount = utilities.countEpisodes([show])
-                title = show["title"]
-                i += 1
+                epCount = utilities.countEpisodes(batch)
+                title = ", ".join(show["title"] for show in batch[:3])
+                if len(batch) > 3:
+                    title += ", ..."
+                i += len(batch)
                 y = ((i / x) * (toPercent - fromPercent)) + fromPercent
                 self.sync.UpdateProgress(
                     int(y), line2=title, line3=kodiUtilities.getString(32073) % epCount
                 )
 
-                s = {"shows": [show]}
-                logger.debug("[traktUpdateEpisodes] Shows to update %s" % s)
-                try:
-                    self.sync.traktapi.addToHistory(s)
-                except Exception as ex:
-                    message = utilities.createError(ex)
-                    logger.fatal(message)
-                    errorcount += 1
+                errorcount += self.__addBatchToHistory(batch)
 
             logger.debug("[traktUpdateEpisodes] Finished with %d error(s)" % errorcount)
             self.sync.UpdateProgress(
@@ -556,11 +598,65 @@ class SyncEpisodes:
                 line3=" ",
             )
 
+    def __addBatchToHistory(self, shows: List[Dict]) -> int:
+        """Send shows to the history in one request.
+
+        A batch Trakt provably did not process is halved and resent, a request
+        that may have gone through is never resent. Returns the number of
+        shows that could not be added.
+        """
+        s = {"shows": shows}
+        logger.debug("[traktUpdateEpisodes] Shows to update %s" % s)
+        try:
+            result = self.sync.traktapi.addToHistory(s, exceptions=True)
+        except Exception as ex:
+            message = utilities.createError(ex)
+            logger.fatal(message)
+            if not _neverProcessed(ex):
+                logger.debug(
+                    "[traktUpdateEpisodes] %d show(s) may have been added, not resending" % len(shows)
+                )
+                return len(shows)
+        else:
+            return self.__countNotFound(shows, result)
+
+        if len(shows) == 1 or self.sync.IsCanceled():
+            return len(shows)
+        logger.debug(
+            "[traktUpdateEpisodes] Retrying %d show(s) in smaller batches" % len(shows)
+        )
+        middle = len(shows) // 2
+        return self.__addBatchToHistory(shows[:middle]) + self.__addBatchToHistory(
+            shows[middle:]
+        )
+
+    def __countNotFound(self, shows: List[Dict], result: Optional[Dict]) -> int:
+        """Report the shows of a batch Trakt listed as not found.
+
+        These would fail the same way again, so they are not resent.
+        """
+        if not result:
+            return 0
+        logger.debug(
+            "[traktUpdateEpisodes] Added %d of %d episode(s)"
+            % (result.get("added", {}).get("episodes", 0), utilities.countEpisodes(shows))
+        )
+        notFound = utilities.findNotFoundShows(shows, result.get("not_found", {}))
+        for show in notFound:
+            logger.debug("[traktUpdateEpisodes] Show not found on Trakt: %s" % show["title"])
+        return len(notFound)
+
     def __addEpisodesToKodiWatched(
-        self, traktShows: Dict, kodiShows: Dict, kodiShowsCollected: Dict, fromPercent: int, toPercent: int
+        self,
+        traktShows: utilities.LibraryIndex,
+        kodiShows: utilities.LibraryIndex,
+        kodiShowsCollected: utilities.LibraryIndex,
+        fromPercent: int,
+        toPercent: int,
     ) -> None:
         if (
             kodiUtilities.getSettingAsBool("kodi_episode_playcount")
+            and self.sync.activityChanged("episodes", "watched_at")
             and not self.sync.IsCanceled()
         ):
             kodiShowsUpdate = utilities.compareEpisodes(
@@ -574,7 +670,7 @@ class SyncEpisodes:
 
             if kodiUtilities.getSettingAsBool("rewatch_aware_sync") or self.sync.force_rewatch:
                 kodiShowsUpdate = utilities.filterRewatchEpisodes(
-                    kodiShowsUpdate, traktShows
+                    kodiShowsUpdate, traktShows.data
                 )
 
             if len(kodiShowsUpdate["shows"]) == 0:
@@ -646,7 +742,72 @@ class SyncEpisodes:
                 toPercent, line2=kodiUtilities.getString(32109) % len(episodes)
             )
 
-    def __addEpisodeProgressToKodi(self, traktShows: Dict, kodiShows: Dict, fromPercent: int, toPercent: int) -> None:
+    def __fillMissingRuntimes(self, shows: List[Dict]) -> None:
+        missing = [
+            (show, season, episode)
+            for show in shows
+            for season in show["seasons"]
+            for episode in season["episodes"]
+            if not episode["runtime"]
+        ]
+        if not missing:
+            return
+
+        runtimes = self.sync.traktapi.runtimes.get_many(
+            episode["ids"]["trakt"]
+            for _, _, episode in missing
+            if episode["ids"].get("trakt")
+        )
+
+        # one seasons listing per show covers all of its episodes
+        lookedUp = {}
+        for show, season, episode in missing:
+            traktId = episode["ids"].get("trakt")
+            if traktId and int(traktId) in runtimes:
+                episode["runtime"] = runtimes[int(traktId)]
+                continue
+
+            showId = show["ids"]["trakt"]
+            if showId not in lookedUp:
+                lookedUp[showId] = self.__getShowRuntimes(showId)
+            runtime = lookedUp[showId].get((season["number"], episode["number"]))
+            if runtime:
+                episode["runtime"] = runtime
+
+        found = {}
+        for showRuntimes in lookedUp.values():
+            found.update(showRuntimes.get("ids", {}))
+        if found:
+            self.sync.traktapi.runtimes.put_many(found)
+        logger.debug(
+            "[Episodes Sync] Looked up runtimes of %d episode(s) with %d request(s)"
+            % (len(missing), len(lookedUp))
+        )
+
+    def __getShowRuntimes(self, showId: Any) -> Dict:
+        """Return {(season, episode): runtime} for a show, with the same runtimes by Trakt id under "ids"."""
+        runtimes = {"ids": {}}
+        try:
+            seasons = self.sync.traktapi.getShowWithAllEpisodesList(
+                showId, extended="episodes,full"
+            )
+        except Exception as ex:
+            logger.debug(
+                "[Episodes Sync] Failed to get episodes of show %s: %s" % (showId, ex)
+            )
+            return runtimes
+
+        for season in seasons or []:
+            for number, episode in season.episodes.items():
+                if not episode.runtime:
+                    continue
+                runtimes[(season.pk, number)] = episode.runtime * 60
+                traktId = episode.get_key("trakt")
+                if traktId:
+                    runtimes["ids"][traktId] = episode.runtime * 60
+        return runtimes
+
+    def __addEpisodeProgressToKodi(self, traktShows: Dict, kodiShows: utilities.LibraryIndex, fromPercent: int, toPercent: int) -> None:
         if (
             kodiUtilities.getSettingAsBool("trakt_episode_playback")
             and traktShows
@@ -679,22 +840,20 @@ class SyncEpisodes:
             ]:
                 logger.debug("[Episodes Sync] Episodes updated: %s" % s)
 
+            # If library items don't have a runtime set get it from
+            # Trakt to avoid later using 0 in runtime * progress_pct.
+            self.__fillMissingRuntimes(kodiShowsUpdate["shows"])
+
             episodes = []
             for show in kodiShowsUpdate["shows"]:
                 for season in show["seasons"]:
                     for episode in season["episodes"]:
-                        # If library item doesn't have a runtime set get it from
-                        # Trakt to avoid later using 0 in runtime * progress_pct.
                         if not episode["runtime"]:
-                            episode["runtime"] = (
-                                self.sync.traktapi.getEpisodeSummary(
-                                    show["ids"]["trakt"],
-                                    season["number"],
-                                    episode["number"],
-                                    extended="full",
-                                ).runtime
-                                * 60
+                            logger.debug(
+                                "[Episodes Sync] No runtime for %s S%02dE%02d, skipping progress"
+                                % (show["title"], season["number"], episode["number"])
                             )
+                            continue
                         episodes.append(
                             {
                                 "episodeid": episode["ids"]["episodeid"],
@@ -746,9 +905,10 @@ class SyncEpisodes:
                 toPercent, line2=kodiUtilities.getString(32131) % len(episodes)
             )
 
-    def __syncShowsRatings(self, traktShows: Dict, kodiShows: Dict, fromPercent: int, toPercent: int) -> None:
+    def __syncShowsRatings(self, traktShows: Dict, kodiShows: utilities.LibraryIndex, fromPercent: int, toPercent: int) -> None:
         if (
             kodiUtilities.getSettingAsBool("sync_ratings_to_trakt")
+            and self.sync.activityChanged("shows", "rated_at")
             and traktShows
             and not self.sync.IsCanceled()
         ):
@@ -776,10 +936,11 @@ class SyncEpisodes:
                     % len(traktShowsToUpdate["shows"]),
                 )
 
-                self.sync.traktapi.addRating(traktShowsToUpdate)
+                self.sync.traktapi.addRating(traktShowsToUpdate, lane=LANE_BACKGROUND)
 
         if (
             kodiUtilities.getSettingAsBool("sync_ratings_to_kodi")
+            and self.sync.activityChanged("shows", "rated_at")
             and traktShows
             and not self.sync.IsCanceled()
         ):
@@ -846,9 +1007,10 @@ class SyncEpisodes:
                     toPercent, line2=kodiUtilities.getString(32178) % len(shows)
                 )
 
-    def __syncEpisodeRatings(self, traktShows: Dict, kodiShows: Dict, fromPercent: int, toPercent: int) -> None:
+    def __syncEpisodeRatings(self, traktShows: Dict, kodiShows: utilities.LibraryIndex, fromPercent: int, toPercent: int) -> None:
         if (
             kodiUtilities.getSettingAsBool("sync_ratings_to_trakt")
+            and self.sync.activityChanged("episodes", "rated_at")
             and traktShows
             and not self.sync.IsCanceled()
         ):
@@ -875,10 +1037,11 @@ class SyncEpisodes:
                     line2=kodiUtilities.getString(32182)
                     % len(traktShowsToUpdate["shows"]),
                 )
-                self.sync.traktapi.addRating(traktShowsToUpdate)
+                self.sync.traktapi.addRating(traktShowsToUpdate, lane=LANE_BACKGROUND)
 
         if (
             kodiUtilities.getSettingAsBool("sync_ratings_to_kodi")
+            and self.sync.activityChanged("episodes", "rated_at")
             and traktShows
             and not self.sync.IsCanceled()
         ):
@@ -2,6 +2,7 @@ import logging
 from typing import Dict, List, Optional, Any, Union
 
 from resources.lib import kodiUtilities, utilities
+from trakt.core.ratelimit import LANE_BACKGROUND
 
 logger = logging.getLogger(__name__)
 
@@ -11,6 +12,7 @@ class SyncMovies:
 
     def __init__(self, sync: Any, progress: Any) -> None:
         self.sync = sync
+        self.__traktFetches = {}
         if self.sync.show_notification:
             kodiUtilities.notification(
                 "%s %s"
@@ -42,17 +44,21 @@ class SyncMovies:
 
         traktMoviesProgress = self.__traktLoadMoviesPlaybackProgress(25, 36)
 
-        self.__addMoviesToTraktCollection(kodiMovies, traktMovies, 37, 47)
+        # index both sides once, the compares below all reuse them
+        kodiIndex = utilities.LibraryIndex(kodiMovies)
+        traktIndex = utilities.LibraryIndex(traktMovies)
 
-        self.__deleteMoviesFromTraktCollection(traktMovies, kodiMovies, 48, 58)
+        self.__addMoviesToTraktCollection(kodiIndex, traktIndex, 37, 47)
 
-        self.__addMoviesToTraktWatched(kodiMovies, traktMovies, 59, 69)
+        self.__deleteMoviesFromTraktCollection(traktIndex, kodiIndex, 48, 58)
 
-        self.__addMoviesToKodiWatched(traktMovies, kodiMovies, 70, 80)
+        self.__addMoviesToTraktWatched(kodiIndex, traktIndex, 59, 69)
 
-        self.__addMovieProgressToKodi(traktMoviesProgress, kodiMovies, 81, 91)
+        self.__addMoviesToKodiWatched(traktIndex, kodiIndex, 70, 80)
 
-        self.__syncMovieRatings(traktMovies, kodiMovies, 92, 99)
+        self.__addMovieProgressToKodi(traktMoviesProgress, kodiIndex, 81, 91)
+
+        self.__syncMovieRatings(traktIndex, kodiIndex, 92, 99)
 
         if self.sync.show_progress and not self.sync.run_silent:
             self.sync.UpdateProgress(
@@ -117,14 +123,28 @@ class SyncMovies:
 
         logger.debug("[Movies Sync] Getting movie collection from Trakt.tv")
 
-        traktMovies = {}
-        traktMovies = self.sync.traktapi.getMoviesCollected(traktMovies)
-
-        self.sync.UpdateProgress(17, line2=kodiUtilities.getString(32082))
-        traktMovies = self.sync.traktapi.getMoviesWatched(traktMovies)
-
+        # the downloads don't depend on each other, so they all run at once and
+        # get mapped in the original order once they are in
+        endpoints = []
+        if self.sync.activityChanged("movies", "collected_at"):
+            endpoints.append(("sync/collection", "movies", self.sync.activityStamp("movies", "collected_at")))
+        if self.sync.activityChanged("movies", "watched_at"):
+            endpoints.append(("sync/watched", "movies", self.sync.activityStamp("movies", "watched_at")))
         if kodiUtilities.getSettingAsBool("sync_ratings_to_trakt") or kodiUtilities.getSettingAsBool("sync_ratings_to_kodi"):
-            traktMovies = self.sync.traktapi.getMoviesRated(traktMovies)
+            if self.sync.activityChanged("movies", "rated_at"):
+                endpoints.append(("sync/ratings", "movies", self.sync.activityStamp("movies", "rated_at")))
+        if kodiUtilities.getSettingAsBool("trakt_movie_playback") and self.sync.activityChanged("movies", "paused_at"):
+            endpoints.append(("sync/playback", "movies", None))
+        self.__traktFetches = self.sync.traktapi.fetchSyncItems(endpoints)
+
+        traktMovies = {}
+        for path in ["sync/collection", "sync/watched", "sync/ratings"]:
+            if (path, "movies") in self.__traktFetches:
+                self.sync.traktapi.mapSyncItems(
+                    path, "movies", traktMovies, self.__traktFetches[(path, "movies")].result()
+                )
+            if path == "sync/collection":
+                self.sync.UpdateProgress(17, line2=kodiUtilities.getString(32082))
 
         self.sync.UpdateProgress(24, line2=kodiUtilities.getString(32083))
         movies = []
@@ -138,13 +158,17 @@ class SyncMovies:
     def __traktLoadMoviesPlaybackProgress(self, fromPercent: int, toPercent: int) -> Union[Dict, bool]:
         if (
             kodiUtilities.getSettingAsBool("trakt_movie_playback")
+            and self.sync.activityChanged("movies", "paused_at")
             and not self.sync.IsCanceled()
         ):
             self.sync.UpdateProgress(fromPercent, line2=kodiUtilities.getString(32122))
 
             logger.debug("[Movies Sync] Getting playback progress from Trakt.tv")
             try:
-                traktProgressMovies = self.sync.traktapi.getMoviePlaybackProgress()
+                fetch = self.__traktFetches.get(("sync/playback", "movies"))
+                traktProgressMovies = self.sync.traktapi.getMoviePlaybackProgress(
+                    fetch.result() if fetch else None
+                )
             except Exception:
                 logger.debug(
                     "[Movies Sync] Invalid Trakt.tv playback progress list, possible error getting data from Trakt, aborting Trakt.tv playback update."
@@ -171,10 +195,11 @@ class SyncMovies:
             return moviesProgress
 
     def __addMoviesToTraktCollection(
-        self, kodiMovies: List[Dict], traktMovies: List[Dict], fromPercent: int, toPercent: int
+        self, kodiMovies: utilities.LibraryIndex, traktMovies: utilities.LibraryIndex, fromPercent: int, toPercent: int
     ) -> None:
         if (
             kodiUtilities.getSettingAsBool("sync_collection_movies_to_trakt")
+            and self.sync.activityChanged("movies", "collected_at")
             and not self.sync.IsCanceled()
         ):
             traktMoviesToAdd = utilities.compareMovies(
@@ -220,10 +245,11 @@ class SyncMovies:
             )
 
     def __deleteMoviesFromTraktCollection(
-        self, traktMovies: List[Dict], kodiMovies: List[Dict], fromPercent: int, toPercent: int
+        self, traktMovies: utilities.LibraryIndex, kodiMovies: utilities.LibraryIndex, fromPercent: int, toPercent: int
     ) -> None:
         if (
             kodiUtilities.getSettingAsBool("sync_clean_collection_movies_to_trakt")
+            and self.sync.activityChanged("movies", "collected_at")
             and not self.sync.IsCanceled()
         ):
             logger.debug("[Movies Sync] Starting to remove.")
@@ -272,10 +298,11 @@ class SyncMovies:
             )
 
     def __addMoviesToTraktWatched(
-        self, kodiMovies: List[Dict], traktMovies: List[Dict], fromPercent: int, toPercent: int
+        self, kodiMovies: utilities.LibraryIndex, traktMovies: utilities.LibraryIndex, fromPercent: int, toPercent: int
     ) -> None:
         if (
             kodiUtilities.getSettingAsBool("sync_playcount_movies_to_trakt")
+            and self.sync.activityChanged("movies", "watched_at")
             and not self.sync.IsCanceled()
         ):
             traktMoviesToUpdate = utilities.compareMovies(
@@ -338,9 +365,10 @@ class SyncMovies:
                 line2=kodiUtilities.getString(32087) % len(traktMoviesToUpdate),
             )
 
-    def __addMoviesToKodiWatched(self, traktMovies: List[Dict], kodiMovies: List[Dict], fromPercent: int, toPercent: int) -> None:
+    def __addMoviesToKodiWatched(self, traktMovies: utilities.LibraryIndex, kodiMovies: utilities.LibraryIndex, fromPercent: int, toPercent: int) -> None:
         if (
             kodiUtilities.getSettingAsBool("kodi_movie_playcount")
+            and self.sync.activityChanged("movies", "watched_at")
             and not self.sync.IsCanceled()
         ):
             kodiMoviesToUpdate = utilities.compareMovies(
@@ -410,7 +438,7 @@ class SyncMovies:
                 line2=kodiUtilities.getString(32090) % len(kodiMoviesToUpdate),
             )
 
-    def __addMovieProgressToKodi(self, traktMovies: Dict, kodiMovies: List[Dict], fromPercent: int, toPercent: int) -> None:
+    def __addMovieProgressToKodi(self, traktMovies: Dict, kodiMovies: utilities.LibraryIndex, fromPercent: int, toPercent: int) -> None:
         if (
             kodiUtilities.getSettingAsBool("trakt_movie_playback")
             and traktMovies
@@ -493,9 +521,10 @@ class SyncMovies:
                 line2=kodiUtilities.getString(32128) % len(kodiMoviesToUpdate),
             )
 
-    def __syncMovieRatings(self, traktMovies: List[Dict], kodiMovies: List[Dict], fromPercent: int, toPercent: int) -> None:
+    def __syncMovieRatings(self, traktMovies: utilities.LibraryIndex, kodiMovies: utilities.LibraryIndex, fromPercent: int, toPercent: int) -> None:
         if (
             kodiUtilities.getSettingAsBool("sync_ratings_to_trakt")
+            and self.sync.activityChanged("movies", "rated_at")
             and traktMovies
             and not self.sync.IsCanceled()
         ):
@@ -524,10 +553,11 @@ class SyncMovies:
 
                 moviesRatings = {"movies": traktMoviesToUpdate}
 
-                self.sync.traktapi.addRating(moviesRatings)
+                self.sync.traktapi.addRating(moviesRatings, lane=LANE_BACKGROUND)
 
         if (
             kodiUtilities.getSettingAsBool("sync_ratings_to_kodi")
+            and self.sync.activityChanged("movies", "rated_at")
             and traktMovies
             and not self.sync.IsCanceled()
         ):
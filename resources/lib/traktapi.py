@@ -1,11 +1,18 @@
 import logging
 import os
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from json import dumps, loads
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+
+import dateutil.parser
 
 import xbmcaddon
 from resources.lib import deviceAuthDialog
+from resources.lib.ratings_cache import RatingsCache
+from resources.lib.runtime_store import RuntimeStore
+from resources.lib.search_cache import SearchCache
+from resources.lib.snapshot_store import SnapshotStore
 from resources.lib.kodiUtilities import (
     checkAndConfigureProxy,
     getSetting,
@@ -15,6 +22,7 @@ from resources.lib.kodiUtilities import (
     setSetting,
 )
 from resources.lib.utilities import (
+    applyHistoryToWatched,
     findEpisodeMatchInList,
     findMovieMatchInList,
     findSeasonMatchInList,
@@ -22,6 +30,12 @@ from resources.lib.utilities import (
 )
 from resources.lib.obfuscation import deobfuscate
 from trakt import Trakt
+from trakt.core.cache import ResponseCache
+from trakt.core.exceptions import RequestFailedError
+from trakt.core.pagination import PaginationIterator
+from trakt.core.ratelimit import LANE_BACKGROUND, LANE_INTERACTIVE
+from trakt.mapper.search import SearchMapper
+from trakt.mapper.sync import SyncMapper
 from trakt.objects import Movie, Show
 
 # read settings
@@ -30,6 +44,13 @@ __addonversion__ = __addon__.getAddonInfo("version")
 
 logger = logging.getLogger(__name__)
 
+# independent sync GETs are downloaded in parallel, writes are throttled separately
+SYNC_FETCH_WORKERS = 4
+HISTORY_PAGE_SIZE = 1000
+HISTORY_MAX_PAGES = 5
+# history pages requested ahead while the previous one is being read
+HISTORY_PREFETCH = 2
+
 
 class traktAPI:
     # Placeholders for build-time injection
@@ -67,6 +88,17 @@ class traktAPI:
 
         Trakt.configuration.defaults.oauth(refresh=True)
 
+        self.snapshots = SnapshotStore()
+        # summaries and search results are public, keep them next to the snapshots
+        Trakt.http.cache = ResponseCache(self.snapshots.path)
+        self.runtimes = RuntimeStore()
+        self.searches = SearchCache()
+        # misses expire after a day, don't let them pile up
+        self.searches.purge()
+        self.ratings = RatingsCache(self.__getRatings, self.getLastActivities)
+        # (media type, trakt id) -> sync/playback id, so clearing progress is a single DELETE
+        self.playbackIds: Dict[Tuple[str, str], Any] = {}
+
         if getSetting("authorization") and not force:
             self.authorization = loads(getSetting("authorization"))
         else:
@@ -77,7 +109,7 @@ class traktAPI:
 
     def login(self) -> None:
         # Request new device code
-        with Trakt.configuration.http(timeout=90):
+        with Trakt.configuration.http(timeout=90, priority=LANE_INTERACTIVE):
             code = Trakt["oauth/device"].code()
 
             if not code:
@@ -169,7 +201,7 @@ class traktAPI:
         result = None
 
         with Trakt.configuration.oauth.from_response(self.authorization):
-            with Trakt.configuration.http(retry=True):
+            with Trakt.configuration.http(retry=True, priority=LANE_INTERACTIVE):
                 if status == "start":
                     result = Trakt["scrobble"].start(
                         show=show, episode=episode, progress=percent
@@ -184,13 +216,14 @@ class traktAPI:
                     )
                 else:
                     logger.debug("scrobble() Bad scrobble status")
+        self.__indexScrobble("episode", result)
         return result
 
     def scrobbleMovie(self, movie: Dict, percent: float, status: str) -> Optional[Dict]:
         result = None
 
         with Trakt.configuration.oauth.from_response(self.authorization):
-            with Trakt.configuration.http(retry=True):
+            with Trakt.configuration.http(retry=True, priority=LANE_INTERACTIVE):
                 if status == "start":
                     result = Trakt["scrobble"].start(movie=movie, progress=percent)
                 elif status == "pause":
@@ -199,169 +232,277 @@ class traktAPI:
                     result = Trakt["scrobble"].stop(movie=movie, progress=percent)
                 else:
                     logger.debug("scrobble() Bad scrobble status")
+        self.__indexScrobble("movie", result)
         return result
 
-    def getShowsCollected(self, shows: Dict) -> Dict:
-        with Trakt.configuration.oauth.from_response(self.authorization):
-            with Trakt.configuration.http(retry=True, timeout=90):
-                Trakt["sync/collection"].shows(shows, exceptions=True)
-        return shows
+    def __indexScrobble(self, mediaType: str, result: Optional[Dict]) -> None:
+        # a scrobble response that ends in a pause carries the playback id,
+        # a real scrobble clears the playback entry on Trakt's side
+        if not result or mediaType not in result:
+            return
+        traktId = result[mediaType].get("ids", {}).get("trakt")
+        if not traktId:
+            return
+        key = (mediaType, str(traktId))
+        if result.get("action") == "pause" and result.get("id"):
+            self.playbackIds[key] = result["id"]
+        elif result.get("action") == "scrobble":
+            self.playbackIds.pop(key, None)
 
-    def getMoviesCollected(self, movies: Dict) -> Dict:
-        with Trakt.configuration.oauth.from_response(self.authorization):
-            with Trakt.configuration.http(retry=True, timeout=90):
-                Trakt["sync/collection"].movies(movies, exceptions=True)
-        return movies
+    def getShowsCollected(self, shows: Dict, stamp: Optional[str] = None) -> Dict:
+        return self.__loadSyncItems("sync/collection", "shows", shows, stamp)
 
-    def getShowsWatched(self, shows: Dict) -> Dict:
-        with Trakt.configuration.oauth.from_response(self.authorization):
-            with Trakt.configuration.http(retry=True, timeout=90):
-                Trakt["sync/watched"].shows(shows, exceptions=True)
-        return shows
+    def getMoviesCollected(self, movies: Dict, stamp: Optional[str] = None) -> Dict:
+        return self.__loadSyncItems("sync/collection", "movies", movies, stamp)
 
-    def getMoviesWatched(self, movies: Dict) -> Dict:
-        with Trakt.configuration.oauth.from_response(self.authorization):
-            with Trakt.configuration.http(retry=True, timeout=90):
-                Trakt["sync/watched"].movies(movies, exceptions=True)
-        return movies
+    def getShowsWatched(self, shows: Dict, stamp: Optional[str] = None) -> Dict:
+        return self.__loadSyncItems("sync/watched", "shows", shows, stamp)
 
-    def getShowsRated(self, shows: Dict) -> Dict:
-        with Trakt.configuration.oauth.from_response(self.authorization):
-            with Trakt.configuration.http(retry=True, timeout=90):
-                Trakt["sync/ratings"].shows(store=shows, exceptions=True)
-        return shows
+    def getMoviesWatched(self, movies: Dict, stamp: Optional[str] = None) -> Dict:
+        return self.__loadSyncItems("sync/watched", "movies", movies, stamp)
 
-    def getEpisodesRated(self, shows: Dict) -> Dict:
-        with Trakt.configuration.oauth.from_response(self.authorization):
-            with Trakt.configuration.http(retry=True, timeout=90):
-                Trakt["sync/ratings"].episodes(store=shows, exceptions=True)
-        return shows
+    def getShowsRated(self, shows: Dict, stamp: Optional[str] = None) -> Dict:
+        return self.__loadSyncItems("sync/ratings", "shows", shows, stamp)
+
+    def getEpisodesRated(self, shows: Dict, stamp: Optional[str] = None) -> Dict:
+        return self.__loadSyncItems("sync/ratings", "episodes", shows, stamp)
+
+    def getMoviesRated(self, movies: Dict, stamp: Optional[str] = None) -> Dict:
+        return self.__loadSyncItems("sync/ratings", "movies", movies, stamp)
+
+    def fetchSyncItems(self, endpoints: List[Tuple[str, str, Optional[str]]]) -> Dict[Tuple[str, str], Future]:
+        """Start downloading several (path, media, stamp) sync endpoints on a small thread pool.
+
+        Returns a future per (path, media), its result() raises if that download failed.
+        """
+        executor = ThreadPoolExecutor(max_workers=SYNC_FETCH_WORKERS)
+        futures = {}
+        for path, media, stamp in endpoints:
+            futures[(path, media)] = executor.submit(self.__getSyncItems, path, media, stamp)
+        executor.shutdown(wait=False)
+        return futures
+
+    def __loadSyncItems(self, path: str, media: str, store: Dict, stamp: Optional[str]) -> Dict:
+        return self.mapSyncItems(path, media, store, self.__getSyncItems(path, media, stamp))
+
+    def mapSyncItems(self, path: str, media: str, store: Dict, items: List) -> Dict:
+        interface = Trakt[path]
+        SyncMapper.process(
+            interface.client, store, items, media=media, **interface.flags
+        )
+        return store
+
+    def __getSyncItems(self, path: str, media: str, stamp: Optional[str]) -> List:
+        """Raw sync items, served from the local snapshot while the last_activities stamp matches.
 
-    def getMoviesRated(self, movies: Dict) -> Dict:
+        Without a stamp the items are always downloaded and nothing is cached.
+        """
+        endpoint = "%s/%s" % (path, media)
+        snapshot = self.snapshots.get(endpoint) if stamp else None
+        if snapshot and snapshot["stamp"] == stamp:
+            logger.debug("Using local snapshot for %s (%s)" % (endpoint, stamp))
+            return snapshot["items"]
+
+        items = None
+        fetched_at = None
+        if snapshot and path == "sync/watched":
+            items = self.__applyWatchedHistory(media, snapshot)
+            fetched_at = snapshot["fetched_at"]
+        if items is None:
+            items = self.__fetchSyncItems(path, media)
+            fetched_at = None
+
+        if stamp:
+            self.snapshots.put(endpoint, stamp, items, fetched_at)
+        return items
+
+    def __fetchSyncItems(self, path: str, media: str) -> List:
+        logger.debug("Downloading %s/%s" % (path, media))
         with Trakt.configuration.oauth.from_response(self.authorization):
             with Trakt.configuration.http(retry=True, timeout=90):
-                Trakt["sync/ratings"].movies(store=movies, exceptions=True)
-        return movies
+                response = Trakt[path].get(media, parse=False, exceptions=True)
+                items = Trakt[path].get_data(response, exceptions=True)
+        if not isinstance(items, list):
+            raise RequestFailedError("Invalid %s/%s response" % (path, media))
+        return items
+
+    def __applyWatchedHistory(self, media: str, snapshot: Dict) -> Optional[List]:
+        """Bring a watched snapshot up to date with the history added since its stamp.
+
+        Returns None when the delta can't be fetched, the caller then downloads everything.
+        """
+        historyMedia = "movies" if media == "movies" else "episodes"
+        try:
+            start_at = dateutil.parser.parse(snapshot["stamp"])
+            with Trakt.configuration.oauth.from_response(self.authorization):
+                with Trakt.configuration.http(retry=True, timeout=90):
+                    # the first page comes with the page count, the rest are prefetched
+                    pages = Trakt["sync/history"].get(
+                        historyMedia, start_at=start_at, per_page=HISTORY_PAGE_SIZE,
+                        pagination="get", parse=False, exceptions=True
+                    )
+                    if not isinstance(pages, PaginationIterator) or pages.total_pages is None:
+                        return None
+                    if pages.total_pages > HISTORY_MAX_PAGES:
+                        logger.debug("Too much new %s history, downloading sync/watched instead" % historyMedia)
+                        return None
+                    history = list(pages.with_prefetch(HISTORY_PREFETCH))
+        except Exception as ex:
+            logger.debug("Failed to get %s history since %s: %s" % (historyMedia, snapshot["stamp"], ex))
+            return None
+
+        if pages.total_items is not None and len(history) < pages.total_items:
+            # a page went missing, a partial delta would corrupt the snapshot
+            logger.debug("Incomplete %s history since %s" % (historyMedia, snapshot["stamp"]))
+            return None
+
+        logger.debug("Applying %d new %s history entries to the watched snapshot" % (len(history), historyMedia))
+        # start_at is inclusive, plays at the stamp itself are in the snapshot already
+        return applyHistoryToWatched(snapshot["items"], history, media, since=snapshot["stamp"])
 
     def addToCollection(self, mediaObject: Dict) -> Optional[Dict]:
         with Trakt.configuration.oauth.from_response(self.authorization):
-            with Trakt.configuration.http(retry=True):
+            with Trakt.configuration.http(retry=True, priority=LANE_BACKGROUND):
                 result = Trakt["sync/collection"].add(mediaObject)
         return result
 
     def removeFromCollection(self, mediaObject: Dict) -> Optional[Dict]:
         with Trakt.configuration.oauth.from_response(self.authorization):
-            with Trakt.configuration.http(retry=True):
+            with Trakt.configuration.http(retry=True, priority=LANE_BACKGROUND):
                 result = Trakt["sync/collection"].remove(mediaObject)
         return result
 
-    def addToHistory(self, mediaObject: Dict) -> Optional[Dict]:
-        with Trakt.configuration.oauth.from_response(self.authorization):
-            with Trakt.configuration.http(retry=True):
-                result = Trakt["sync/history"].add(mediaObject)
-        return result
+    def addToHistory(
+        self, mediaObject: Dict, lane: str = LANE_BACKGROUND, exceptions: bool = False
+    ) -> Optional[Dict]:
+        try:
+            with Trakt.configuration.oauth.from_response(self.authorization):
+                with Trakt.configuration.http(retry=True, priority=lane):
+                    return Trakt["sync/history"].add(mediaObject, exceptions=exceptions)
+        finally:
+            # plays added here can be backdated, which history deltas can't see
+            self.snapshots.invalidate("sync/watched/")
 
     def deletePlaybackProgress(self, playbackId: Any) -> Any:
         with Trakt.configuration.oauth.from_response(self.authorization):
-            with Trakt.configuration.http(retry=True):
+            with Trakt.configuration.http(retry=True, priority=LANE_INTERACTIVE):
                 return Trakt["sync/playback"].delete(playbackId)
 
     def removePlaybackProgressForItem(self, mediaType: str, traktId: Any) -> Any:
-        """Find and delete the playback progress entry matching traktId."""
+        """Delete the playback progress entry matching traktId."""
+        playbackId = self.playbackIds.pop((mediaType, str(traktId)), None)
+        if playbackId is not None:
+            logger.debug("Removing playback progress for %s trakt:%s (playback id: %s)" % (mediaType, traktId, playbackId))
+            try:
+                if self.deletePlaybackProgress(playbackId):
+                    return True
+            except Exception as ex:
+                logger.debug("Failed to remove playback progress: %s" % str(ex))
+            logger.debug("Playback id %s is stale, looking it up again" % playbackId)
+
         try:
             if mediaType == "movie":
-                items = self.getMoviePlaybackProgress()
-                for item in items:
-                    if item.get_key("trakt") == traktId:
-                        logger.debug("Removing playback progress for movie trakt:%s (playback id: %s)" % (traktId, item.id))
-                        return self.deletePlaybackProgress(item.id)
+                self.getMoviePlaybackProgress()
             elif mediaType == "episode":
-                shows = self.getEpisodePlaybackProgress()
-                for show in shows:
-                    for _, season in show.seasons.items():
-                        for _, episode in season.episodes.items():
-                            if episode.get_key("trakt") == traktId:
-                                logger.debug("Removing playback progress for episode trakt:%s (playback id: %s)" % (traktId, episode.id))
-                                return self.deletePlaybackProgress(episode.id)
+                self.getEpisodePlaybackProgress()
+            playbackId = self.playbackIds.pop((mediaType, str(traktId)), None)
+            if playbackId is not None:
+                logger.debug("Removing playback progress for %s trakt:%s (playback id: %s)" % (mediaType, traktId, playbackId))
+                return self.deletePlaybackProgress(playbackId)
         except Exception as ex:
             logger.debug("Failed to remove playback progress: %s" % str(ex))
         return False
 
     def addToWatchlist(self, mediaObject: Dict) -> Optional[Dict]:
         with Trakt.configuration.oauth.from_response(self.authorization):
-            with Trakt.configuration.http(retry=True):
+            with Trakt.configuration.http(retry=True, priority=LANE_INTERACTIVE):
                 result = Trakt["sync/watchlist"].add(mediaObject)
         return result
 
-    def getShowRatingForUser(self, showId: str, idType: str = "tvdb") -> Dict:
+    def __getRatings(self, media: str) -> Dict:
         ratings = {}
         with Trakt.configuration.oauth.from_response(self.authorization):
             with Trakt.configuration.http(retry=True):
-                Trakt["sync/ratings"].shows(store=ratings)
-        return findShowMatchInList(showId, ratings, idType)
+                getattr(Trakt["sync/ratings"], media)(store=ratings)
+        return ratings
+
+    def getShowRatingForUser(self, showId: str, idType: str = "tvdb") -> Dict:
+        if idType == "trakt":
+            return self.ratings.show(showId)
+        return findShowMatchInList(showId, self.__getRatings("shows"), idType)
 
     def getSeasonRatingForUser(self, showId: str, season: int, idType: str = "tvdb") -> Dict:
-        ratings = {}
-        with Trakt.configuration.oauth.from_response(self.authorization):
-            with Trakt.configuration.http(retry=True):
-                Trakt["sync/ratings"].seasons(store=ratings)
-        return findSeasonMatchInList(showId, season, ratings, idType)
+        if idType == "trakt":
+            return self.ratings.season(showId, season)
+        return findSeasonMatchInList(showId, season, self.__getRatings("seasons"), idType)
 
     def getEpisodeRatingForUser(self, showId: str, season: int, episode: int, idType: str = "tvdb") -> Dict:
-        ratings = {}
-        with Trakt.configuration.oauth.from_response(self.authorization):
-            with Trakt.configuration.http(retry=True):
-                Trakt["sync/ratings"].episodes(store=ratings)
-        return findEpisodeMatchInList(showId, season, episode, ratings, idType)
+        if idType == "trakt":
+            return self.ratings.episode(showId, season, episode)
+        return findEpisodeMatchInList(showId, season, episode, self.__getRatings("episodes"), idType)
 
     def getMovieRatingForUser(self, movieId: str, idType: str = "imdb") -> Dict:
-        ratings = {}
-        with Trakt.configuration.oauth.from_response(self.authorization):
-            with Trakt.configuration.http(retry=True):
-                Trakt["sync/ratings"].movies(store=ratings)
-        return findMovieMatchInList(movieId, ratings, idType)
+        if idType == "trakt":
+            return self.ratings.movie(movieId)
+        return findMovieMatchInList(movieId, self.__getRatings("movies"), idType)
+
+    def __updateRatings(self, mediaObject: Dict, result: Optional[Dict], remove: bool) -> None:
+        if not result:
+            return
+        if any(result.get("not_found", {}).values()):
+            # can't tell which of the items made it, start over
+            self.ratings.clear()
+        else:
+            self.ratings.update(mediaObject, remove=remove)
 
     # Send a rating to Trakt as mediaObject so we can add the rating
-    def addRating(self, mediaObject: Dict) -> Optional[Dict]:
+    def addRating(self, mediaObject: Dict, lane: str = LANE_INTERACTIVE) -> Optional[Dict]:
         with Trakt.configuration.oauth.from_response(self.authorization):
-            with Trakt.configuration.http(retry=True):
+            with Trakt.configuration.http(retry=True, priority=lane):
                 result = Trakt["sync/ratings"].add(mediaObject)
+        self.__updateRatings(mediaObject, result, False)
         return result
 
     # Send a rating to Trakt as mediaObject so we can remove the rating
-    def removeRating(self, mediaObject: Dict) -> Optional[Dict]:
+    def removeRating(self, mediaObject: Dict, lane: str = LANE_INTERACTIVE) -> Optional[Dict]:
         with Trakt.configuration.oauth.from_response(self.authorization):
-            with Trakt.configuration.http(retry=True):
+            with Trakt.configuration.http(retry=True, priority=lane):
                 result = Trakt["sync/ratings"].remove(mediaObject)
+        self.__updateRatings(mediaObject, result, True)
         return result
 
-    def getMoviePlaybackProgress(self) -> List["Movie"]:
-        progressMovies = []
-
-        # Fetch playback
-        with Trakt.configuration.oauth.from_response(self.authorization):
-            with Trakt.configuration.http(retry=True):
-                playback = Trakt["sync/playback"].movies(exceptions=True)
-
-                for _, item in playback.items():
-                    if type(item) is Movie:
-                        progressMovies.append(item)
-
-        return progressMovies
-
-    def getEpisodePlaybackProgress(self) -> List["Show"]:
-        progressEpisodes = []
+    def getMoviePlaybackProgress(self, items: Optional[List] = None) -> List["Movie"]:
+        if items is None:
+            items = self.__getSyncItems("sync/playback", "movies", None)
+        playback = self.mapSyncItems("sync/playback", "movies", {}, items)
+        movies = [item for item in playback.values() if type(item) is Movie]
 
-        # Fetch playback
-        with Trakt.configuration.oauth.from_response(self.authorization):
-            with Trakt.configuration.http(retry=True):
-                playback = Trakt["sync/playback"].episodes(exceptions=True)
+        self.__indexPlayback("movie", movies)
+        return movies
 
-                for _, item in playback.items():
-                    if type(item) is Show:
-                        progressEpisodes.append(item)
+    def getEpisodePlaybackProgress(self, items: Optional[List] = None) -> List["Show"]:
+        if items is None:
+            items = self.__getSyncItems("sync/playback", "episodes", None)
+        playback = self.mapSyncItems("sync/playback", "episodes", {}, items)
+        shows = [item for item in playback.values() if type(item) is Show]
+
+        episodes = [
+            episode
+            for show in shows
+            for season in show.seasons.values()
+            for episode in season.episodes.values()
+        ]
+        self.__indexPlayback("episode", episodes)
+        return shows
 
-        return progressEpisodes
+    def __indexPlayback(self, mediaType: str, items: List) -> None:
+        # a full listing replaces everything known for the media type
+        for key in [key for key in list(self.playbackIds) if key[0] == mediaType]:
+            self.playbackIds.pop(key, None)
+        for item in items:
+            traktId = item.get_key("trakt")
+            if traktId and item.id:
+                self.playbackIds[(mediaType, str(traktId))] = item.id
 
     def getMovieSummary(self, movieId: str, extended: Optional[str] = None) -> "Movie":
         with Trakt.configuration.http(retry=True):
@@ -376,27 +517,43 @@ class traktAPI:
         with Trakt.configuration.http(retry=True):
             return Trakt["shows"].get(showId)
 
-    def getShowWithAllEpisodesList(self, showId: str) -> List:
+    def getShowWithAllEpisodesList(self, showId: str, extended: str = "episodes") -> List:
         with Trakt.configuration.http(retry=True, timeout=90):
-            return Trakt["shows"].seasons(showId, extended="episodes")
+            return Trakt["shows"].seasons(showId, extended=extended)
 
     def getEpisodeSummary(self, showId: str, season: int, episode: int, extended: Optional[str] = None) -> Any:
         with Trakt.configuration.http(retry=True):
             return Trakt["shows"].episode(showId, season, episode, extended=extended)
 
     def getIdLookup(self, id: str, id_type: str) -> Optional[List]:
-        with Trakt.configuration.http(retry=True):
-            result = Trakt["search"].lookup(id, id_type)
-            if result and not isinstance(result, list):
-                result = [result]
-            return result
+        key = SearchCache.lookupKey(id, id_type)
+        items = self.searches.get(key)
+        if items is None:
+            with Trakt.configuration.http(retry=True):
+                interface = Trakt["search"]
+                items = interface.get_data(interface.lookup(id, id_type, parse=False))
+            if not isinstance(items, list):
+                return None
+            self.searches.put(key, items)
+        return self.__mapSearchItems(items)
 
     def getTextQuery(self, query: str, type: str, year: Optional[int]) -> Optional[List]:
-        with Trakt.configuration.http(retry=True, timeout=90):
-            result = Trakt["search"].query(query, type, year)
-            if result and not isinstance(result, list):
-                result = [result]
-            return result
+        key = SearchCache.queryKey(query, type, year)
+        items = self.searches.get(key)
+        if items is None:
+            with Trakt.configuration.http(retry=True, timeout=90):
+                interface = Trakt["search"]
+                items = interface.get_data(interface.query(query, type, year, parse=False))
+            if not isinstance(items, list):
+                return None
+            self.searches.put(key, items)
+        return self.__mapSearchItems(items)
+
+    def __mapSearchItems(self, items: List) -> Optional[List]:
+        result = SearchMapper.process_many(Trakt["search"].client, items)
+        if result and not isinstance(result, list):
+            result = [result]
+        return result
 
     def getLastActivities(self) -> Optional[Dict]:
         with Trakt.configuration.oauth.from_response(self.authorization):
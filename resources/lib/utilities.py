@@ -3,6 +3,7 @@ import time
 import re
 import logging
 import traceback
+from json import dumps
 from typing import Tuple, List, Dict, Union, Optional
 import dateutil.parser
 from datetime import datetime
@@ -39,6 +40,190 @@ def chunks(list_data: List, n: int) -> List:
     return [list_data[i : i + n] for i in range(0, len(list_data), n)]
 
 
+def batchShows(shows: List[Dict], maxEpisodes: int = 1000, maxBytes: int = 256 * 1024) -> List[List[Dict]]:
+    """Split shows into batches bounded by episode count and JSON payload size.
+
+    A show is never split, so a single show over either bound gets a batch of its own.
+    """
+    batches = []
+    batch = []
+    episodes = size = 0
+    for show in shows:
+        showEpisodes = countEpisodes([show])
+        showSize = len(dumps(show))
+        if batch and (episodes + showEpisodes > maxEpisodes or size + showSize > maxBytes):
+            batches.append(batch)
+            batch = []
+            episodes = size = 0
+        batch.append(show)
+        episodes += showEpisodes
+        size += showSize
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def buildHistoryPayload(scrobbles: List[Dict]) -> Dict:
+    """Merge queued failed scrobbles into a single sync/history payload.
+
+    Episodes of the same show are grouped under one show entry.
+    """
+    movies = []
+    shows = {}
+    for scrobble in scrobbles:
+        media_info = scrobble["media_info"]
+        if scrobble["media_type"] == "movie":
+            movies.append(
+                {
+                    "ids": media_info.get("ids", {}),
+                    "title": media_info.get("title"),
+                    "year": media_info.get("year"),
+                    "watched_at": scrobble["watched_at"],
+                }
+            )
+        elif scrobble["media_type"] == "episode":
+            show_info = scrobble["show_info"] or {}
+            show_ids = show_info.get("ids", {})
+            key = dumps([show_ids, show_info.get("title"), show_info.get("year")], sort_keys=True)
+            if key not in shows:
+                shows[key] = {
+                    "ids": show_ids,
+                    "title": show_info.get("title"),
+                    "year": show_info.get("year"),
+                    "seasons": {},
+                }
+            season = shows[key]["seasons"].setdefault(
+                media_info.get("season"), {"number": media_info.get("season"), "episodes": []}
+            )
+            season["episodes"].append(
+                {"number": media_info.get("number"), "watched_at": scrobble["watched_at"]}
+            )
+
+    payload = {}
+    if movies:
+        payload["movies"] = movies
+    if shows:
+        for show in shows.values():
+            show["seasons"] = list(show["seasons"].values())
+        payload["shows"] = list(shows.values())
+    return payload
+
+
+def _findListedItem(ids: Dict, items: List) -> Optional[Dict]:
+    # the item of a not_found list sharing any id with ids
+    if not ids:
+        return None
+    for item in items:
+        if any(key in ids and ids[key] == value for key, value in item.get("ids", {}).items()):
+            return item
+    return None
+
+
+def findNotFoundShows(shows: List[Dict], notFound: Dict) -> List[Dict]:
+    """Return the shows of a sync/history payload Trakt listed as not found."""
+    return [
+        show for show in shows
+        if _findListedItem(show.get("ids", {}), notFound.get("shows", [])) is not None
+    ]
+
+
+def findNotFoundScrobbles(scrobbles: List[Dict], notFound: Dict) -> List[Dict]:
+    """Return the scrobbles Trakt listed in the not_found part of a sync/history response."""
+    result = []
+    for scrobble in scrobbles:
+        if scrobble["media_type"] == "movie":
+            ids = scrobble["media_info"].get("ids", {})
+            if _findListedItem(ids, notFound.get("movies", [])) is not None:
+                result.append(scrobble)
+            continue
+
+        media_info = scrobble["media_info"]
+        if _findListedItem(media_info.get("ids", {}), notFound.get("episodes", [])) is not None:
+            result.append(scrobble)
+            continue
+
+        show = _findListedItem((scrobble["show_info"] or {}).get("ids", {}), notFound.get("shows", []))
+        if show is not None and _listsEpisode(show, media_info.get("season"), media_info.get("number")):
+            result.append(scrobble)
+    return result
+
+
+def _listsEpisode(show: Dict, season: int, number: int) -> bool:
+    # a show listed without seasons stands for all of its episodes
+    if "seasons" not in show:
+        return True
+    for listedSeason in show["seasons"]:
+        if listedSeason.get("number") != season:
+            continue
+        if "episodes" not in listedSeason:
+            return True
+        if any(episode.get("number") == number for episode in listedSeason["episodes"]):
+            return True
+    return False
+
+
+def _sameScrobbleItem(event1: Dict, event2: Dict) -> bool:
+    if event1["media_type"] != event2["media_type"]:
+        return False
+    info1 = event1["media_info"]
+    info2 = event2["media_info"]
+    if event1["media_type"] == "episode":
+        if (info1.get("season"), info1.get("number")) != (info2.get("season"), info2.get("number")):
+            return False
+        info1 = event1["show_info"] or {}
+        info2 = event2["show_info"] or {}
+    ids1 = info1.get("ids") or {}
+    ids2 = info2.get("ids") or {}
+    if any(key in ids2 and ids2[key] == value for key, value in ids1.items()):
+        return True
+    return bool(info1.get("title")) and (info1.get("title"), info1.get("year")) == (
+        info2.get("title"),
+        info2.get("year"),
+    )
+
+
+def compactScrobbles(events: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """Drop journaled scrobble events that a later event for the same item supersedes.
+
+    A start or pause followed by another event for the same item carries no
+    information (start -> stop collapses into the stop), neither does a stop
+    repeated with the same progress.
+
+    :return: the events to send and the superseded ones
+    """
+    kept = []
+    superseded = []
+    for index, event in enumerate(events):
+        following = events[index + 1] if index + 1 < len(events) else None
+        if following is not None and _sameScrobbleItem(event, following) and (
+            event["status"] != "stop"
+            or (following["status"] == "stop" and following["progress"] == event["progress"])
+        ):
+            superseded.append(event)
+        else:
+            kept.append(event)
+    return kept, superseded
+
+
+def coalesceEvents(events: List[Dict]) -> List[Dict]:
+    """Drop player events that are superseded by the ones right after them.
+
+    Of consecutive seeks only the last is kept, and a pause directly followed
+    by a resume cancels out.
+    """
+    coalesced = []
+    for event in events:
+        action = event.get("action")
+        previous = coalesced[-1].get("action") if coalesced else None
+        if action in ("seek", "seekchapter") and previous in ("seek", "seekchapter"):
+            coalesced[-1] = event
+        elif action == "resumed" and previous == "paused":
+            coalesced.pop()
+        else:
+            coalesced.append(event)
+    return coalesced
+
+
 def getFormattedItemName(type: str, info: Dict) -> str:
     s = ""
     try:
@@ -405,6 +590,42 @@ def sanitizeShows(shows: Dict) -> None:
                     del episode["ids"]["episodeid"]
 
 
+class LibraryIndex:
+    """Reusable lookup index over a movie list or a {"shows": [...]} dict.
+
+    Build it once per sync and pass it to compareMovies, compareShows and
+    compareEpisodes in place of the raw data, so the id maps and the
+    season/episode lookups are not rebuilt on every compare.
+    """
+
+    def __init__(self, data: Union[List, Dict]) -> None:
+        self.data = data
+        self.items = data["shows"] if isinstance(data, dict) else data
+        self._index: Optional[Dict] = None
+        self._seasons: Dict[int, Dict] = {}
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def find(self, mediaObjectToMatch: Dict, matchByTitleAndYear: bool) -> Optional[Dict]:
+        if self._index is None:
+            self._index = _buildMediaIndex(self.items)
+        return _indexedFind(mediaObjectToMatch, self._index, matchByTitleAndYear)
+
+    def seasons(self, show: Dict) -> Dict:
+        """Season number -> episode number -> episode, for a show of this index."""
+        key = id(show)
+        if key not in self._seasons:
+            self._seasons[key] = _getEpisodes(show["seasons"])
+        return self._seasons[key]
+
+
+def _asLibraryIndex(data: Union[List, Dict, LibraryIndex]) -> LibraryIndex:
+    if isinstance(data, LibraryIndex):
+        return data
+    return LibraryIndex(data)
+
+
 def _copy_episode(episode):
     """Shallow copy episode dict, including the nested ids dict."""
     ep = dict(episode)
@@ -414,8 +635,8 @@ def _copy_episode(episode):
 
 
 def compareMovies(
-    movies_col1: List,
-    movies_col2: List,
+    movies_col1: Union[List, LibraryIndex],
+    movies_col2: Union[List, LibraryIndex],
     matchByTitleAndYear: bool,
     watched: bool = False,
     restrict: bool = False,
@@ -423,10 +644,11 @@ def compareMovies(
     rating: bool = False,
 ) -> List:
     movies = []
-    col2_index = _buildMediaIndex(movies_col2)
-    for movie_col1 in movies_col1:
+    col1_index = _asLibraryIndex(movies_col1)
+    col2_index = _asLibraryIndex(movies_col2)
+    for movie_col1 in col1_index.items:
         if movie_col1:
-            movie_col2 = _indexedFind(movie_col1, col2_index, matchByTitleAndYear)
+            movie_col2 = col2_index.find(movie_col1, matchByTitleAndYear)
             # logger.debug("movie_col1 %s" % movie_col1)
             # logger.debug("movie_col2 %s" % movie_col2)
 
@@ -468,17 +690,20 @@ def compareMovies(
 
 
 def compareShows(
-    shows_col1: Dict, shows_col2: Dict, matchByTitleAndYear: bool, rating: bool = False, restrict: bool = False
+    shows_col1: Union[Dict, LibraryIndex],
+    shows_col2: Union[Dict, LibraryIndex],
+    matchByTitleAndYear: bool,
+    rating: bool = False,
+    restrict: bool = False,
 ) -> Dict:
     shows = []
     # logger.debug("shows_col1 %s" % shows_col1)
     # logger.debug("shows_col2 %s" % shows_col2)
-    col2_index = _buildMediaIndex(shows_col2["shows"])
-    for show_col1 in shows_col1["shows"]:
+    col1_index = _asLibraryIndex(shows_col1)
+    col2_index = _asLibraryIndex(shows_col2)
+    for show_col1 in col1_index.items:
         if show_col1:
-            show_col2 = _indexedFind(
-                show_col1, col2_index, matchByTitleAndYear
-            )
+            show_col2 = col2_index.find(show_col1, matchByTitleAndYear)
             # logger.debug("show_col1 %s" % show_col1)
             # logger.debug("show_col2 %s" % show_col2)
 
@@ -525,33 +750,33 @@ def compareShows(
 
 # always return shows_col1 if you have enrich it, but don't return shows_col2
 def compareEpisodes(
-    shows_col1: Dict,
-    shows_col2: Dict,
+    shows_col1: Union[Dict, LibraryIndex],
+    shows_col2: Union[Dict, LibraryIndex],
     matchByTitleAndYear: bool,
     watched: bool = False,
     restrict: bool = False,
-    collected: Optional[Dict] = None,
+    collected: Optional[Union[Dict, LibraryIndex]] = None,
     playback: bool = False,
     rating: bool = False,
 ) -> Dict:
     shows = []
     # logger.debug("epi shows_col1 %s" % shows_col1)
     # logger.debug("epi shows_col2 %s" % shows_col2)
-    col2_index = _buildMediaIndex(shows_col2["shows"])
-    collected_index = _buildMediaIndex(collected["shows"]) if collected else None
-    for show_col1 in shows_col1["shows"]:
+    col1_index = _asLibraryIndex(shows_col1)
+    col2_index = _asLibraryIndex(shows_col2)
+    # an index over an empty library is falsy, only a missing one means "not given"
+    collected_index = _asLibraryIndex(collected) if collected is not None else None
+    for show_col1 in col1_index.items:
         if show_col1:
-            show_col2 = _indexedFind(
-                show_col1, col2_index, matchByTitleAndYear
-            )
+            show_col2 = col2_index.find(show_col1, matchByTitleAndYear)
             # logger.debug("show_col1 %s" % show_col1)
             # logger.debug("show_col2 %s" % show_col2)
 
             if show_col2:
                 season_diff = {}
                 # format the data to be easy to compare Trakt and KODI data
-                season_col1 = __getEpisodes(show_col1["seasons"])
-                season_col2 = __getEpisodes(show_col2["seasons"])
+                season_col1 = col1_index.seasons(show_col1)
+                season_col2 = col2_index.seasons(show_col2)
                 for season in season_col1:
                     a = season_col1[season]
                     if season in season_col2:
@@ -595,12 +820,12 @@ def compareEpisodes(
                         elif len(diff) > 0:
                             if restrict:
                                 # get all the episodes that we have in Kodi, watched or not - update kodi
-                                collectedShow = _indexedFind(
-                                    show_col1, collected_index, matchByTitleAndYear
-                                ) if collected_index else None
+                                collectedShow = collected_index.find(
+                                    show_col1, matchByTitleAndYear
+                                ) if collected_index is not None else None
                                 # logger.debug("collected %s" % collectedShow)
-                                collectedSeasons = __getEpisodes(
-                                    collectedShow["seasons"]
+                                collectedSeasons = collected_index.seasons(
+                                    collectedShow
                                 )
                                 t = list(
                                     set(collectedSeasons[season]).intersection(
@@ -757,6 +982,71 @@ def filterRewatchEpisodes(shows_to_update: Dict, trakt_shows: Dict) -> Dict:
     return {"shows": filtered_shows}
 
 
+def _addPlay(item: Dict, watched_at: Optional[str]) -> None:
+    item["plays"] = item.get("plays", 0) + 1
+    if watched_at and (not item.get("last_watched_at") or watched_at > item["last_watched_at"]):
+        item["last_watched_at"] = watched_at
+        if "last_updated_at" in item:
+            item["last_updated_at"] = watched_at
+
+
+def applyHistoryToWatched(items: List, history: List, media: str, since: Optional[str] = None) -> List:
+    """Merge sync/history events into a raw sync/watched payload for "movies" or "shows".
+
+    Every event counts as one more play, items that are not in the payload yet are added.
+    Events watched at or before since (the stamp of the payload) are already counted in it,
+    and an event listed twice (by history id) is only counted once.
+    """
+    key = "movie" if media == "movies" else "show"
+    index = {}
+    for item in items:
+        index[item[key]["ids"].get("trakt")] = item
+
+    sinceDate = dateutil.parser.parse(since) if since else None
+    seen = set()
+    for event in history:
+        if key not in event or (key == "show" and "episode" not in event):
+            continue
+        if "id" in event:
+            if event["id"] in seen:
+                continue
+            seen.add(event["id"])
+        if sinceDate and event.get("watched_at") and dateutil.parser.parse(event["watched_at"]) <= sinceDate:
+            continue
+        watched_at = event.get("watched_at")
+        item = index.get(event[key]["ids"].get("trakt"))
+        if item is None:
+            item = {"plays": 0, "last_watched_at": None, "last_updated_at": None, key: event[key]}
+            if key == "show":
+                item["reset_at"] = None
+                item["seasons"] = []
+            items.append(item)
+            index[event[key]["ids"].get("trakt")] = item
+        _addPlay(item, watched_at)
+
+        if key == "show":
+            episode = event["episode"]
+            season = None
+            for s in item["seasons"]:
+                if s["number"] == episode["season"]:
+                    season = s
+                    break
+            if season is None:
+                season = {"number": episode["season"], "episodes": []}
+                item["seasons"].append(season)
+            watchedEpisode = None
+            for e in season["episodes"]:
+                if e["number"] == episode["number"]:
+                    watchedEpisode = e
+                    break
+            if watchedEpisode is None:
+                watchedEpisode = {"number": episode["number"], "plays": 0, "last_watched_at": None}
+                season["episodes"].append(watchedEpisode)
+            _addPlay(watchedEpisode, watched_at)
+
+    return items
+
+
 def countEpisodes(shows: Union[Dict, List], collection: bool = True) -> int:
     count = 0
     if "shows" in shows:
@@ -776,7 +1066,7 @@ def countEpisodes(shows: Union[Dict, List], collection: bool = True) -> int:
     return count
 
 
-def __getEpisodes(seasons: List) -> Dict:
+def _getEpisodes(seasons: List) -> Dict:
     data = {}
     for season in seasons:
         episodes = {}
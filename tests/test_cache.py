@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+
+import json
+
+import mock
+import pytest
+import requests
+
+from trakt.core import cache as cache_module
+from trakt.core.cache import ResponseCache
+from trakt.core.http import HttpClient
+
+
+class FakeClock:
+    """Stands in for the time module, only moves when advanced."""
+
+    def __init__(self):
+        self.now = 1600000000.0
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    return ResponseCache(str(tmp_path / "cache.db"), max_entries=2)
+
+
+def make_request(path, method="GET", headers=None):
+    return requests.Request(method, "https://api.trakt.tv/" + path, headers=headers).prepare()
+
+
+def make_response(request, body=None, status=200, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response._content = json.dumps(body).encode("utf-8") if body is not None else b""
+    response.request = request
+    return response
+
+
+def make_http(cache, *responses):
+    http = HttpClient.__new__(HttpClient)
+    http.cache = cache
+    http._send = mock.Mock(side_effect=responses)
+    return http
+
+
+def test_fresh_hit_sends_no_request(cache, clock):
+    request = make_request("shows/1")
+    http = make_http(cache, make_response(request, {"title": "Show"}, headers={"Cache-Control": "max-age=60"}))
+
+    assert http.send(make_request("shows/1")).json() == {"title": "Show"}
+    clock.advance(30)
+    response = http.send(make_request("shows/1"))
+
+    assert response.status_code == 200
+    assert response.json() == {"title": "Show"}
+    assert http._send.call_count == 1
+
+
+def test_stale_entry_is_revalidated_and_304_reuses_the_body(cache, clock):
+    request = make_request("shows/1")
+    http = make_http(
+        cache,
+        make_response(request, {"title": "Show"}, headers={"Cache-Control": "max-age=60", "ETag": '"v1"'}),
+        make_response(request, status=304, headers={"Cache-Control": "max-age=60"}),
+    )
+
+    http.send(make_request("shows/1"))
+    clock.advance(61)
+    revalidate = make_request("shows/1")
+    response = http.send(revalidate)
+
+    assert revalidate.headers["If-None-Match"] == '"v1"'
+    assert response.status_code == 200
+    assert response.json() == {"title": "Show"}
+
+    # the 304 renewed the entry
+    clock.advance(30)
+    assert cache.get(make_request("shows/1")).fresh
+
+
+def test_no_store_and_non_get_requests_bypass_the_cache(cache):
+    request = make_request("shows/1")
+    http = make_http(
+        cache,
+        make_response(request, {"title": "Show"}, headers={"Cache-Control": "no-store"}),
+        make_response(request, {"title": "Show"}, headers={"Cache-Control": "max-age=60"}),
+    )
+
+    http.send(make_request("shows/1"))
+    assert cache.get(make_request("shows/1")) is None
+
+    http.send(make_request("shows/1", method="POST"))
+    assert cache.get(make_request("shows/1")) is None
+    assert http._send.call_count == 2
+
+
+def test_authenticated_requests_are_not_cached(cache):
+    request = make_request("sync/watched/shows", headers={"Authorization": "Bearer token"})
+
+    assert not cache.cacheable(request)
+    assert cache.cacheable(make_request("shows/1"))
+
+
+def test_lru_eviction_is_per_family(cache, clock):
+    def put(path):
+        request = make_request(path)
+        cache.put(request, make_response(request, {"path": path}, headers={"Cache-Control": "max-age=600"}))
+        clock.advance(1)
+
+    put("shows/1")
+    put("shows/2")
+    put("movies/1")
+    # reading shows/1 makes shows/2 the least recently used show
+    cache.get(make_request("shows/1"))
+    clock.advance(1)
+    put("shows/3")
+
+    assert cache.get(make_request("shows/1")) is not None
+    assert cache.get(make_request("shows/2")) is None
+    assert cache.get(make_request("shows/3")) is not None
+    # another family doesn't count against the shows
+    assert cache.get(make_request("movies/1")) is not None
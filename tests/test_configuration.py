@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+
+import threading
+
+from trakt.core.configuration import ConfigurationManager
+
+
+def in_thread(func):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(func()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_context_does_not_leak_into_other_threads():
+    manager = ConfigurationManager()
+    manager.defaults.client("default-id")
+
+    entered = threading.Event()
+    release = threading.Event()
+    seen = []
+
+    def worker():
+        with manager.client("worker-id"):
+            seen.append(manager["client.id"])
+            entered.set()
+            release.wait(5)
+            seen.append(manager["client.id"])
+        seen.append(manager["client.id"])
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    entered.wait(5)
+
+    # the worker's context is active, but only on the worker's stack
+    assert manager["client.id"] == "default-id"
+    assert in_thread(lambda: manager["client.id"]) == "default-id"
+
+    with manager.client("main-id"):
+        assert manager["client.id"] == "main-id"
+        release.set()
+        thread.join()
+
+    assert seen == ["worker-id", "worker-id", "default-id"]
+    assert manager["client.id"] == "default-id"
+
+
+def test_changing_defaults_invalidates_snapshots():
+    manager = ConfigurationManager()
+    manager.defaults.http(timeout=10)
+
+    assert manager["http.timeout"] == 10
+    snapshot = manager.snapshot()
+    assert manager.snapshot() is snapshot
+
+    manager.defaults.http(timeout=20)
+
+    assert manager["http.timeout"] == 20
+    assert manager.snapshot() is not snapshot
+
+
+def test_changing_defaults_invalidates_snapshots_of_other_threads():
+    manager = ConfigurationManager()
+    manager.defaults.http(timeout=10)
+
+    cached = threading.Event()
+    changed = threading.Event()
+    seen = []
+
+    def worker():
+        seen.append(manager["http.timeout"])
+        cached.set()
+        changed.wait(5)
+        seen.append(manager["http.timeout"])
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    cached.wait(5)
+
+    manager.defaults.http(timeout=20)
+    changed.set()
+    thread.join()
+
+    assert seen == [10, 20]
+
+
+def test_changing_an_active_context_invalidates_snapshots():
+    manager = ConfigurationManager()
+    context = manager.auth("user", "token")
+
+    with context:
+        assert manager["auth.login"] == "user"
+        context["auth.login"] = "other"
+        assert manager["auth.login"] == "other"
+
+    assert manager["auth.login"] is None
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 #
 
+import json
 import mock
 import sys
 
@@ -23,3 +24,60 @@ def test_showSettings():
     assert not xbmcaddon_mock.Addon().openSettings.called
     kodiUtilities.showSettings()
     assert xbmcaddon_mock.Addon().openSettings.called
+
+
+def test_getEpisodesFromKodiByShow_pages_and_groups():
+    pages = [
+        {
+            "result": {
+                "episodes": [
+                    {"episodeid": 1, "tvshowid": 10},
+                    {"episodeid": 2, "tvshowid": 20},
+                ],
+                "limits": {"start": 0, "end": 2, "total": 3},
+            }
+        },
+        {
+            "result": {
+                "episodes": [{"episodeid": 3, "tvshowid": 10}],
+                "limits": {"start": 2, "end": 3, "total": 3},
+            }
+        },
+    ]
+    xbmc_mock.executeJSONRPC.side_effect = [json.dumps(page) for page in pages]
+    try:
+        result = kodiUtilities.getEpisodesFromKodiByShow(["season"], page_size=2)
+    finally:
+        xbmc_mock.executeJSONRPC.side_effect = None
+
+    assert [e["episodeid"] for e in result[10]] == [1, 3]
+    assert [e["episodeid"] for e in result[20]] == [2]
+
+
+def test_getEpisodesFromKodiByShow_failed_request():
+    xbmc_mock.executeJSONRPC.side_effect = [json.dumps({"error": {}})]
+    try:
+        assert kodiUtilities.getEpisodesFromKodiByShow(["season"]) is None
+    finally:
+        xbmc_mock.executeJSONRPC.side_effect = None
+
+
+def test_kodiRpcToTraktEpisodeProjections():
+    episodes = [
+        {"season": 1, "episode": 1, "label": "Pilot", "episodeid": 1, "playcount": 2,
+         "file": "/tv/s01e01.mkv", "runtime": 1800, "userrating": 0},
+        {"season": 1, "episode": 2, "label": "Two", "episodeid": 2, "playcount": 0,
+         "file": "/tv/s01e02.mkv", "runtime": 1800, "userrating": 0},
+        {"season": 2, "episode": 1, "label": "Three", "episodeid": 3, "playcount": 0,
+         "file": "/tv/s02e01.mkv", "runtime": 1800, "userrating": 0},
+    ]
+    with mock.patch.object(kodiUtilities, "checkExclusion", return_value=False):
+        collected, watched = kodiUtilities.kodiRpcToTraktEpisodeProjections(episodes)
+
+    assert [s["number"] for s in collected] == [1, 2]
+    assert [e["number"] for e in collected[0]["episodes"]] == [1, 2]
+    assert [s["number"] for s in watched] == [1, 2]
+    assert [e["number"] for e in watched[0]["episodes"]] == [1]
+    assert watched[1]["episodes"] == []
+    assert watched[0]["episodes"][0] is collected[0]["episodes"][0]
+    assert watched[0]["episodes"][0]["plays"] == 2
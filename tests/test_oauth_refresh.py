@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+#
+
+import threading
+
+import mock
+
+from trakt.core.configuration import ConfigurationManager
+from trakt.core.http import OAUTH_REFRESH_HARD, OAUTH_REFRESH_SOFT, OAUTH_REFRESH_SOFT_RETRY, HttpClient
+
+CREATED_AT = 1600000000
+EXPIRES_IN = 90 * 24 * 60 * 60
+EXPIRES_AT = CREATED_AT + EXPIRES_IN
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeClient:
+    def __init__(self):
+        self.configuration = ConfigurationManager()
+        self.configuration.defaults.oauth(
+            token="token", refresh_token="refresh", created_at=CREATED_AT, expires_in=EXPIRES_IN,
+            refresh=True, username="user"
+        )
+
+
+def make_http(now, refreshed=True):
+    clock = FakeClock(now)
+    http = HttpClient(FakeClient(), clock=clock)
+    http._refresh_oauth = mock.Mock(return_value=refreshed)
+    return http, clock
+
+
+def refresh_threads():
+    return [thread for thread in threading.enumerate() if thread.name == "trakt-oauth-refresh"]
+
+
+def wait_for_refreshes():
+    for thread in refresh_threads():
+        thread.join(5)
+
+
+def test_valid_token_is_not_refreshed():
+    http, _ = make_http(EXPIRES_AT - OAUTH_REFRESH_SOFT - 1)
+
+    assert http.validate()
+    wait_for_refreshes()
+    assert not http._refresh_oauth.called
+
+
+def test_soft_deadline_refreshes_in_the_background_once():
+    http, _ = make_http(EXPIRES_AT - OAUTH_REFRESH_SOFT + 1)
+    release = threading.Event()
+    http._refresh_oauth.side_effect = lambda: release.wait(5)
+
+    assert http.validate()
+    # while the refresh runs, requests don't start another one
+    assert http.validate()
+    release.set()
+    wait_for_refreshes()
+
+    assert http._refresh_oauth.call_count == 1
+    assert http._oauth_scheduled == set()
+
+
+def test_failed_soft_refresh_is_retried_later():
+    http, clock = make_http(EXPIRES_AT - OAUTH_REFRESH_SOFT + 1, refreshed=False)
+
+    assert http.validate()
+    wait_for_refreshes()
+    assert http._oauth_scheduled == set()
+
+    # not on every request right away
+    assert http.validate()
+    wait_for_refreshes()
+    assert http._refresh_oauth.call_count == 1
+
+    clock.now += OAUTH_REFRESH_SOFT_RETRY + 1
+    assert http.validate()
+    wait_for_refreshes()
+    assert http._refresh_oauth.call_count == 2
+
+
+def test_hard_deadline_refreshes_before_the_request():
+    http, _ = make_http(EXPIRES_AT - OAUTH_REFRESH_HARD + 1)
+
+    assert http.validate()
+    http._refresh_oauth.assert_called_once_with()
+    assert not refresh_threads()
+
+
+def test_hard_deadline_fails_when_the_refresh_fails():
+    http, _ = make_http(EXPIRES_AT - OAUTH_REFRESH_HARD + 1, refreshed=False)
+
+    assert not http.validate()
+    assert http._refresh_oauth.call_count == 1
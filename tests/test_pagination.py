@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+#
+
+import json
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+import requests
+
+from trakt.core.configuration import ConfigurationManager
+from trakt.core.exceptions import ServerError
+from trakt.core.pagination import PaginationIterator
+
+
+def make_response(request, items, pages=None, status=200):
+    response = requests.Response()
+    response.status_code = status
+    response.headers["Content-Type"] = "application/json"
+    if pages is not None:
+        response.headers["X-Pagination-Limit"] = "2"
+        response.headers["X-Pagination-Item-Count"] = str(pages * 2)
+        response.headers["X-Pagination-Page-Count"] = str(pages)
+    response._content = json.dumps(items).encode("utf-8")
+    response.request = request
+    return response
+
+
+class FakeHttp:
+    def __init__(self, pages, paginated=True, fail=None):
+        self.pages = pages
+        self.paginated = paginated
+        # page -> number of times it fails before it is served
+        self.fail = dict(fail or {})
+        self.sent = []
+        self.threads = set()
+
+    def send(self, request):
+        page = int(parse_qs(urlsplit(request.url).query).get("page", ["1"])[0])
+        self.sent.append((request.method, page))
+        self.threads.add(threading.current_thread().name)
+        if self.fail.get(page):
+            self.fail[page] -= 1
+            return make_response(request, {}, status=503)
+        pages = self.pages if self.paginated else None
+        if request.method == "HEAD":
+            return make_response(request, [], pages)
+        return make_response(request, [page * 10, page * 10 + 1], pages)
+
+
+class FakeClient:
+    def __init__(self, http):
+        self.http = http
+        self.configuration = ConfigurationManager()
+
+
+def make_iterator(http, **kwargs):
+    request = requests.Request("GET", "https://api.trakt.tv/sync/history/episodes?limit=2").prepare()
+    return PaginationIterator(FakeClient(http), request, **kwargs)
+
+
+def test_prefetch_yields_pages_in_order():
+    http = FakeHttp(pages=6)
+    items = list(make_iterator(http).with_prefetch(3))
+
+    assert items == [n for page in range(1, 7) for n in (page * 10, page * 10 + 1)]
+    assert sorted(page for method, page in http.sent if method == "GET") == [1, 2, 3, 4, 5, 6]
+    assert len(http.threads) > 1
+
+
+def test_prefetch_worker_error_falls_back_to_sequential():
+    http = FakeHttp(pages=4, fail={3: 1})
+    items = list(make_iterator(http).with_prefetch(2))
+
+    assert items == [n for page in range(1, 5) for n in (page * 10, page * 10 + 1)]
+    # page 3 failed on a worker and was fetched again in order
+    assert [page for method, page in http.sent if method == "GET"].count(3) == 2
+
+
+def test_prefetch_worker_error_raises_with_exceptions():
+    http = FakeHttp(pages=3, fail={2: 2})
+    iterator = make_iterator(http, exceptions=True).with_prefetch(2)
+
+    with pytest.raises(ServerError):
+        list(iterator)
+
+
+def test_resolve_with_get_skips_head_and_buffers_first_page():
+    http = FakeHttp(pages=2)
+    items = list(make_iterator(http, resolve_with_get=True))
+
+    assert items == [10, 11, 20, 21]
+    assert http.sent == [("GET", 1), ("GET", 2)]
+
+
+def test_resolve_with_get_without_pagination_headers_is_a_single_page():
+    http = FakeHttp(pages=1, paginated=False)
+    iterator = make_iterator(http, resolve_with_get=True)
+
+    assert list(iterator) == [10, 11]
+    assert iterator.total_pages == 1
+    assert http.sent == [("GET", 1)]
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+#
+
+import threading
+import time
+
+import pytest
+import requests
+
+from trakt.core import ratelimit
+from trakt.core.ratelimit import LANE_BACKGROUND, LANE_DEFERRED, LANE_INTERACTIVE, WriteScheduler
+
+
+class FakeClock:
+    """Stands in for the time module, only moves when advanced."""
+
+    strptime = staticmethod(time.strptime)
+
+    def __init__(self):
+        self.now = 1000.0
+        self.wall = 1600000000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.wall
+
+    def advance(self, seconds):
+        self.now += seconds
+        self.wall += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    return clock
+
+
+def sleeping_scheduler(clock, **kwargs):
+    # waits on the condition "sleep" by advancing the fake clock, single threaded only
+    scheduler = WriteScheduler(**kwargs)
+    scheduler._condition.wait = lambda timeout=None: clock.advance(timeout)
+    return scheduler
+
+
+def test_refill_rate_and_burst(clock):
+    scheduler = sleeping_scheduler(clock, rate=2.0, burst=3)
+
+    assert [scheduler.acquire() for _ in range(3)] == [0, 0, 0]
+    # bucket is empty, the next token takes 1 / rate
+    assert scheduler.acquire() == pytest.approx(0.5)
+
+    # refills never go past the burst size
+    clock.advance(100)
+    assert [scheduler.acquire() for _ in range(3)] == [0, 0, 0]
+    assert scheduler.acquire() == pytest.approx(0.5)
+
+
+def test_penalize_blocks_every_lane(clock):
+    scheduler = sleeping_scheduler(clock, rate=10.0, burst=10)
+
+    scheduler.penalize(30)
+    assert scheduler.acquire(LANE_INTERACTIVE) == pytest.approx(30)
+
+    scheduler.penalize(30)
+    assert scheduler.acquire(LANE_DEFERRED) == pytest.approx(30)
+
+
+def test_update_follows_x_ratelimit_header(clock):
+    scheduler = sleeping_scheduler(clock)
+
+    response = requests.Response()
+    response.headers["X-Ratelimit"] = (
+        '{"name": "UNAUTHED_API_POST_LIMIT", "period": 10, "limit": 5, "remaining": 0,'
+        ' "until": "2020-09-13T12:26:45Z"}'
+    )
+    scheduler.update(response)
+
+    assert scheduler.rate == pytest.approx(0.5)
+    assert scheduler.burst == 5
+    # "until" is 5s after the fake wall clock
+    assert scheduler.acquire() == pytest.approx(5)
+
+
+def test_lanes_are_served_by_priority_then_in_order(clock):
+    scheduler = WriteScheduler(rate=1.0, burst=1)
+    scheduler._tokens = 0.0
+    served = []
+
+    def acquire(name, lane):
+        scheduler.acquire(lane)
+        served.append(name)
+
+    def queued():
+        with scheduler._condition:
+            return sum(len(queue) for queue in scheduler._queues.values())
+
+    threads = []
+    for name, lane in (
+        ("deferred", LANE_DEFERRED),
+        ("background-1", LANE_BACKGROUND),
+        ("interactive", LANE_INTERACTIVE),
+        ("background-2", LANE_BACKGROUND),
+    ):
+        thread = threading.Thread(target=acquire, args=(name, lane))
+        thread.start()
+        threads.append(thread)
+        # queue the callers one after another
+        while queued() < len(threads):
+            time.sleep(0.001)
+
+    # hand out one token at a time
+    for count in range(1, len(threads) + 1):
+        with scheduler._condition:
+            clock.advance(1)
+            scheduler._condition.notify_all()
+        while len(served) < count:
+            time.sleep(0.001)
+
+    for thread in threads:
+        thread.join(1)
+
+    assert served == ["interactive", "background-1", "background-2", "deferred"]
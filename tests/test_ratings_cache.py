@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+
+from resources.lib.ratings_cache import CHECK_INTERVAL, RatingsCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1600000000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class FakeItem:
+    def __init__(self, data):
+        self.data = data
+
+    def to_dict(self):
+        return self.data
+
+
+def fake_ratings(media):
+    if media == "movies":
+        return {("trakt", "1"): FakeItem({"ids": {"trakt": 1}, "rating": 7})}
+    show = {
+        "ids": {"trakt": 10},
+        "rating": 8,
+        "seasons": [
+            {"number": 1, "rating": 6, "episodes": [{"number": 2, "ids": {"trakt": 100}, "rating": 9}]}
+        ],
+    }
+    return {("trakt", "10"): FakeItem(show)}
+
+
+def test_RatingsCache_reloads_only_when_rated_at_changes():
+    fetched = []
+    activities = {"movies": {"rated_at": "a"}}
+
+    def fetch(media):
+        fetched.append(media)
+        return fake_ratings(media)
+
+    clock = FakeClock()
+    cache = RatingsCache(fetch, lambda: activities, clock=clock)
+    assert cache.movie(1)["rating"] == 7
+    assert cache.movie("1")["rating"] == 7
+    assert fetched == ["movies"]
+
+    # last_activities isn't looked at again within CHECK_INTERVAL
+    activities = {"movies": {"rated_at": "b"}}
+    clock.advance(CHECK_INTERVAL - 1)
+    assert cache.movie(1)["rating"] == 7
+    assert fetched == ["movies"]
+
+    clock.advance(1)
+    assert cache.movie(1)["rating"] == 7
+    assert fetched == ["movies", "movies"]
+
+
+def test_RatingsCache_update_in_place():
+    fetched = []
+    activities = {"movies": {"rated_at": "a"}, "episodes": {"rated_at": "a"}}
+
+    def fetch(media):
+        fetched.append(media)
+        return fake_ratings(media)
+
+    cache = RatingsCache(fetch, lambda: activities)
+    assert cache.episode(10, 1, 2)["rating"] == 9
+    assert cache.movie(1)["rating"] == 7
+
+    cache.update({"movies": [{"ids": {"trakt": 1}, "rating": 3}], "episodes": [{"ids": {"trakt": 100}, "rating": 4}]})
+    activities["movies"]["rated_at"] = "b"
+    activities["episodes"]["rated_at"] = "b"
+    assert cache.movie(1)["rating"] == 3
+    assert cache.episode(10, 1, 2)["rating"] == 4
+
+    cache.update({"movies": [{"ids": {"trakt": 1}}]}, remove=True)
+    activities["movies"]["rated_at"] = "c"
+    assert cache.movie(1) == {}
+    assert fetched == ["episodes", "movies"]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+#
+
+import sys
+
+import mock
+import pytest
+
+for module in ("xbmcaddon", "xbmcvfs"):
+    sys.modules.setdefault(module, mock.Mock())
+
+from resources.lib import runtime_store  # noqa: E402
+from resources.lib.runtime_store import RuntimeStore  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(runtime_store.xbmcvfs, "translatePath", lambda path: str(tmp_path))
+    monkeypatch.setattr(runtime_store.xbmcvfs, "exists", lambda path: True)
+    return RuntimeStore()
+
+
+def test_put_get_round_trip(store):
+    store.put_many({1: 1800, "2": 2700.0})
+
+    assert store.get_many([1, 2, 3]) == {1: 1800, 2: 2700}
+    assert store.get_many(["1"]) == {1: 1800}
+    assert store.get_many([]) == {}
+
+    store.put_many({1: 1500})
+    assert store.get_many([1]) == {1: 1500}
+
+
+def test_get_many_beyond_the_sqlite_variable_limit(store):
+    store.put_many(dict((traktId, traktId * 60) for traktId in range(1, 1201)))
+
+    runtimes = store.get_many(range(1, 1301))
+
+    assert len(runtimes) == 1200
+    assert runtimes[1200] == 72000
+
+
+def test_stores_share_the_database(store):
+    store.put_many({1: 1800})
+
+    assert RuntimeStore().get_many([1]) == {1: 1800}
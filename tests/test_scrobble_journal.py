@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+#
+
+import sys
+import time
+
+import mock
+
+for module in ("xbmc", "xbmcgui", "xbmcaddon", "xbmcvfs"):
+    sys.modules.setdefault(module, mock.Mock())
+
+from resources.lib.scrobble_journal import MAX_RETRY_DELAY, STALE_AFTER, ScrobbleSender  # noqa: E402
+
+
+class FakeJournal:
+    def __init__(self):
+        self.events = []
+
+    def add(self, media_type, media_info, show_info, status, progress):
+        row_id = len(self.events) + 1
+        self.events.append({
+            "id": row_id,
+            "media_type": media_type,
+            "media_info": media_info,
+            "show_info": show_info,
+            "status": status,
+            "progress": progress,
+            "created_at": time.time(),
+            "attempts": 0,
+        })
+        return row_id
+
+    def get_pending(self):
+        return [dict(event) for event in self.events]
+
+    def remove_many(self, row_ids):
+        self.events = [event for event in self.events if event["id"] not in row_ids]
+
+    def increment_attempts(self, row_id):
+        for event in self.events:
+            if event["id"] == row_id:
+                event["attempts"] += 1
+
+    def __len__(self):
+        return len(self.events)
+
+
+def make_sender(send):
+    expired = mock.Mock()
+    sender = ScrobbleSender(FakeJournal(), send, expired)
+    return sender, expired
+
+
+def test_flush_sends_and_runs_callback():
+    sender, expired = make_sender(lambda event: {"action": event["status"]})
+    callback = mock.Mock()
+    sender.add("movie", {"title": "Up"}, None, "start", 1.0, callback)
+
+    sender.flush()
+
+    assert len(sender.journal) == 0
+    callback.assert_called_once_with({"action": "start"}, False)
+    assert not expired.called
+
+
+def test_flush_carries_callbacks_of_superseded_events():
+    send = mock.Mock(side_effect=lambda event: {"action": event["status"]})
+    sender, expired = make_sender(send)
+    started, paused, stopped = mock.Mock(), mock.Mock(), mock.Mock()
+    sender.add("movie", {"title": "Up"}, None, "start", 1.0, started)
+    sender.add("movie", {"title": "Up"}, None, "pause", 10.0, paused)
+    sender.add("movie", {"title": "Up"}, None, "stop", 90.0, stopped)
+
+    sender.flush()
+
+    # only the stop goes out, the start and pause callbacks still run with its response
+    assert send.call_count == 1
+    stopped.assert_called_once_with({"action": "stop"}, False)
+    started.assert_called_once_with({"action": "stop"}, True)
+    paused.assert_called_once_with({"action": "stop"}, True)
+
+
+def test_flush_backs_off_when_send_raises():
+    send = mock.Mock(side_effect=ValueError("boom"))
+    sender, expired = make_sender(send)
+    sender.add("movie", {"title": "Up"}, None, "stop", 90.0)
+    sender.add("movie", {"title": "Heat"}, None, "start", 1.0)
+
+    sender.flush()
+
+    # the first event stays queued with a retry scheduled, the next waits behind it
+    assert send.call_count == 1
+    assert [event["attempts"] for event in sender.journal.events] == [1, 0]
+    assert sender._retry_at > time.time()
+    assert not expired.called
+
+
+def test_flush_keeps_failed_events_until_they_go_stale():
+    sender, expired = make_sender(mock.Mock(side_effect=ValueError("boom")))
+    callback = mock.Mock()
+    sender.add("movie", {"title": "Up"}, None, "start", 1.0, callback)
+
+    for _ in range(20):
+        sender.flush()
+
+    # Trakt is unreachable for a while, the event is still there
+    assert [event["attempts"] for event in sender.journal.events] == [20]
+    assert sender._retry_at <= time.time() + MAX_RETRY_DELAY
+    assert not expired.called
+
+    sender.journal.events[0]["created_at"] -= STALE_AFTER + 1
+    sender.flush()
+
+    assert len(sender.journal) == 0
+    assert not callback.called
+
+
+def test_flush_sends_once_trakt_is_back():
+    send = mock.Mock(side_effect=[None, None, {"action": "scrobble"}])
+    sender, expired = make_sender(send)
+    callback = mock.Mock()
+    sender.add("movie", {"title": "Up"}, None, "stop", 90.0, callback)
+
+    for _ in range(3):
+        sender.flush()
+
+    assert len(sender.journal) == 0
+    callback.assert_called_once_with({"action": "scrobble"}, False)
+    assert not expired.called
+
+
+def test_flush_expires_stale_events_without_sending():
+    send = mock.Mock()
+    sender, expired = make_sender(send)
+    sender.add("movie", {"title": "Up"}, None, "stop", 90.0)
+    sender.journal.events[0]["created_at"] -= STALE_AFTER + 1
+
+    sender.flush()
+
+    assert not send.called
+    assert len(sender.journal) == 0
+    expired.assert_called_once()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+
+import sys
+
+import mock
+import pytest
+
+for module in ("xbmcaddon", "xbmcvfs"):
+    sys.modules.setdefault(module, mock.Mock())
+
+from resources.lib import search_cache  # noqa: E402
+from resources.lib.search_cache import FOUND_TTL, NOT_FOUND_TTL, SearchCache  # noqa: E402
+
+
+class FakeClock:
+    """Stands in for the time module, only moves when advanced."""
+
+    def __init__(self):
+        self.now = 1600000000.0
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(search_cache, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(search_cache.xbmcvfs, "translatePath", lambda path: str(tmp_path))
+    monkeypatch.setattr(search_cache.xbmcvfs, "exists", lambda path: True)
+    return SearchCache()
+
+
+def count(cache):
+    with cache._get_conn() as conn:
+        return conn.execute("SELECT COUNT(*) FROM search_results").fetchone()[0]
+
+
+def test_keys():
+    assert SearchCache.lookupKey("12345", "tvdb") == "lookup/tvdb/12345"
+    assert SearchCache.queryKey(" Some Title ", "show", 2019) == "query/show/2019/some title"
+    assert SearchCache.queryKey("Some Title", "show", None) == "query/show//some title"
+
+
+def test_found_results_expire_after_found_ttl(cache, clock):
+    cache.put("lookup/tvdb/1", [{"type": "show", "show": {"title": "Show"}}])
+
+    clock.advance(FOUND_TTL - 1)
+    assert cache.get("lookup/tvdb/1") == [{"type": "show", "show": {"title": "Show"}}]
+
+    clock.advance(1)
+    assert cache.get("lookup/tvdb/1") is None
+
+
+def test_misses_are_cached_for_not_found_ttl(cache, clock):
+    cache.put("query/show//unknown", [])
+
+    assert cache.get("query/show//unknown") == []
+    assert cache.get("query/show//never searched") is None
+
+    clock.advance(NOT_FOUND_TTL)
+    assert cache.get("query/show//unknown") is None
+
+
+def test_purge_only_drops_expired_rows(cache, clock):
+    cache.put("lookup/tvdb/1", [{"type": "show"}])
+    cache.put("lookup/tvdb/2", [])
+
+    clock.advance(NOT_FOUND_TTL)
+    cache.purge()
+
+    assert count(cache) == 1
+    assert cache.get("lookup/tvdb/1") == [{"type": "show"}]
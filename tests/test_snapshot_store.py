@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+#
+
+import sys
+
+import mock
+import pytest
+
+for module in ("xbmcaddon", "xbmcvfs"):
+    sys.modules.setdefault(module, mock.Mock())
+
+from resources.lib import snapshot_store  # noqa: E402
+from resources.lib.snapshot_store import MAX_AGE, SnapshotStore  # noqa: E402
+
+STAMP = "2024-01-01T10:00:00.000Z"
+
+
+class FakeClock:
+    """Stands in for the time module, only moves when advanced."""
+
+    def __init__(self):
+        self.now = 1600000000.0
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(snapshot_store, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(snapshot_store.xbmcvfs, "translatePath", lambda path: str(tmp_path))
+    monkeypatch.setattr(snapshot_store.xbmcvfs, "exists", lambda path: True)
+    return SnapshotStore()
+
+
+def test_put_get_round_trip(store, clock):
+    items = [{"plays": 1, "movie": {"ids": {"trakt": 1}}}]
+    store.put("sync/watched/movies", STAMP, items)
+
+    assert store.get("sync/watched/movies") == {"stamp": STAMP, "items": items, "fetched_at": clock.now}
+    assert store.get("sync/watched/shows") is None
+
+    # a delta keeps the time of the last full download
+    store.put("sync/watched/movies", "2024-01-02T10:00:00.000Z", items, fetched_at=clock.now - 60)
+    snapshot = store.get("sync/watched/movies")
+    assert snapshot["stamp"] == "2024-01-02T10:00:00.000Z"
+    assert snapshot["fetched_at"] == clock.now - 60
+
+
+def test_snapshots_expire_after_max_age(store, clock):
+    store.put("sync/collection/movies", STAMP, [])
+
+    clock.advance(MAX_AGE)
+    assert store.get("sync/collection/movies") is not None
+
+    clock.advance(1)
+    assert store.get("sync/collection/movies") is None
+
+
+def test_invalidate_by_prefix(store):
+    for endpoint in ("sync/watched/movies", "sync/watched/shows", "sync/watchedx/shows", "sync/collection/shows"):
+        store.put(endpoint, STAMP, [])
+
+    # addToHistory drops the watched snapshots
+    store.invalidate("sync/watched/")
+
+    assert store.get("sync/watched/movies") is None
+    assert store.get("sync/watched/shows") is None
+    assert store.get("sync/watchedx/shows") is not None
+    assert store.get("sync/collection/shows") is not None
+
+
+def test_purge(store):
+    store.put("sync/watched/movies", STAMP, [])
+
+    store.purge()
+
+    assert store.get("sync/watched/movies") is None
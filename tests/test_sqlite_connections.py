@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+#
+
+import gc
+import threading
+
+from resources.lib.sqlite_connections import ThreadConnections
+
+
+def test_ThreadConnections_one_connection_per_thread(tmp_path):
+    connections = ThreadConnections(str(tmp_path / "test.db"))
+    conn = connections.get()
+    assert connections.get() is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(connections.get()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+    # the connection of a finished thread is closed with it
+    del thread
+    gc.collect()
+    try:
+        other[0].execute("SELECT 1")
+        closed = False
+    except Exception:
+        closed = True
+    assert closed
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+
+import sys
+
+import mock
+import pytest
+
+for module in ("xbmcaddon", "xbmcvfs"):
+    sys.modules.setdefault(module, mock.Mock())
+
+from resources.lib import sqlitequeue  # noqa: E402
+from resources.lib.sqlitequeue import DispatchQueue, SqliteQueue  # noqa: E402
+
+
+@pytest.fixture
+def profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlitequeue.xbmcvfs, "translatePath", lambda path: str(tmp_path))
+    monkeypatch.setattr(sqlitequeue.xbmcvfs, "exists", lambda path: True)
+    return tmp_path
+
+
+def test_get_many_keeps_order_and_leaves_the_rest(profile):
+    queue = DispatchQueue()
+    for index in range(5):
+        queue.append({"action": "seek", "index": index})
+
+    assert [item["index"] for item in queue.get_many(3)] == [0, 1, 2]
+    assert len(queue) == 2
+    # only the items handed out are gone from SQLite
+    assert [item["index"] for item in queue.store] == [3, 4]
+
+    assert [item["index"] for item in queue.get_many(10)] == [3, 4]
+    assert queue.get_many(10) == []
+    assert len(queue.store) == 0
+
+
+def test_reload_picks_up_items_of_other_processes_once(profile):
+    queue = DispatchQueue()
+    queue.append({"action": "paused"})
+    # the context menu script writes to the same database
+    SqliteQueue().append({"action": "manualSync"})
+
+    queue.reload()
+    queue.reload()
+
+    assert queue.get_many(10) == [{"action": "paused"}, {"action": "manualSync"}]
+    queue.reload()
+    assert queue.get_many(10) == []
+
+
+def test_purge(profile):
+    queue = DispatchQueue()
+    queue.append({"action": "paused"})
+
+    queue.purge()
+
+    assert len(queue) == 0
+    assert len(queue.store) == 0
+
+
+def test_append_writes_through_to_sqlite(profile):
+    queue = DispatchQueue()
+    queue.append({"action": "started", "id": 1})
+
+    # the row is in SQLite right away, a restarted service still has it
+    assert list(SqliteQueue()) == [{"action": "started", "id": 1}]
+    restarted = DispatchQueue()
+    assert len(restarted) == 0
+    restarted.reload()
+    assert restarted.get_many(10) == [{"action": "started", "id": 1}]
+    assert len(SqliteQueue()) == 0
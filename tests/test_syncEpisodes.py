@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+#
+
+import sys
+
+import mock
+from requests.exceptions import ConnectionError, ReadTimeout
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+for module in ("xbmc", "xbmcgui", "xbmcaddon"):
+    sys.modules.setdefault(module, mock.Mock())
+
+from resources.lib.syncEpisodes import SyncEpisodes  # noqa: E402
+
+
+def show(title, tvdb):
+    return {
+        "title": title,
+        "ids": {"tvdb": tvdb},
+        "seasons": [{"number": 1, "episodes": [{"number": 1}, {"number": 2}]}],
+    }
+
+
+def make_sync(addToHistory):
+    syncEpisodes = SyncEpisodes.__new__(SyncEpisodes)
+    syncEpisodes.sync = mock.Mock()
+    syncEpisodes.sync.IsCanceled.return_value = False
+    syncEpisodes.sync.traktapi.addToHistory.side_effect = addToHistory
+    return syncEpisodes
+
+
+def test_addBatchToHistory_resends_halves_when_connection_refused():
+    calls = []
+
+    def addToHistory(payload, exceptions=False):
+        calls.append([s["title"] for s in payload["shows"]])
+        if len(payload["shows"]) > 1:
+            reason = NewConnectionError(None, "Connection refused")
+            raise ConnectionError(MaxRetryError(None, "/sync/history", reason))
+        return {"added": {"episodes": 2}, "not_found": {"shows": []}}
+
+    syncEpisodes = make_sync(addToHistory)
+    errors = syncEpisodes._SyncEpisodes__addBatchToHistory([show("a", 1), show("b", 2)])
+
+    assert errors == 0
+    assert calls == [["a", "b"], ["a"], ["b"]]
+
+
+def test_addBatchToHistory_never_resends_after_read_timeout():
+    calls = []
+
+    def addToHistory(payload, exceptions=False):
+        calls.append(payload)
+        raise ReadTimeout("read timed out")
+
+    syncEpisodes = make_sync(addToHistory)
+    errors = syncEpisodes._SyncEpisodes__addBatchToHistory([show("a", 1), show("b", 2)])
+
+    assert errors == 2
+    assert len(calls) == 1
+
+
+def test_addBatchToHistory_counts_not_found_shows():
+    def addToHistory(payload, exceptions=False):
+        return {"added": {"episodes": 2}, "not_found": {"shows": [{"ids": {"tvdb": 2}}]}}
+
+    syncEpisodes = make_sync(addToHistory)
+    errors = syncEpisodes._SyncEpisodes__addBatchToHistory([show("a", 1), show("b", 2)])
+
+    assert errors == 1
+    assert syncEpisodes.sync.traktapi.addToHistory.call_count == 1
@@ -47,6 +47,96 @@ def test_chunks():
     assert len(utilities.chunks(movies, 1)) == 3
 
 
+def test_batchShows():
+    def show(title, episodes):
+        return {
+            "title": title,
+            "seasons": [{"number": 1, "episodes": [{"number": n} for n in range(1, episodes + 1)]}],
+        }
+
+    shows = [show("a", 3), show("b", 3), show("c", 5), show("d", 1)]
+
+    batches = utilities.batchShows(shows, maxEpisodes=6)
+    assert [[s["title"] for s in batch] for batch in batches] == [["a", "b"], ["c", "d"]]
+
+    batches = utilities.batchShows(shows, maxEpisodes=2)
+    assert [len(batch) for batch in batches] == [1, 1, 1, 1]
+
+    batches = utilities.batchShows(shows, maxBytes=1)
+    assert len(batches) == 4
+
+
+def test_buildHistoryPayload_and_findNotFoundScrobbles():
+    show = {"ids": {"tvdb": 1}, "title": "Show", "year": 2020}
+    scrobbles = [
+        {"id": 1, "media_type": "movie", "media_info": {"ids": {"imdb": "tt1"}, "title": "M", "year": 2000},
+         "show_info": None, "watched_at": "a"},
+        {"id": 2, "media_type": "episode", "media_info": {"season": 1, "number": 1}, "show_info": show, "watched_at": "b"},
+        {"id": 3, "media_type": "episode", "media_info": {"season": 1, "number": 2}, "show_info": show, "watched_at": "c"},
+        {"id": 4, "media_type": "episode", "media_info": {"season": 2, "number": 1}, "show_info": show, "watched_at": "d"},
+    ]
+
+    payload = utilities.buildHistoryPayload(scrobbles)
+    assert payload["movies"] == [{"ids": {"imdb": "tt1"}, "title": "M", "year": 2000, "watched_at": "a"}]
+    assert len(payload["shows"]) == 1
+    seasons = payload["shows"][0]["seasons"]
+    assert [s["number"] for s in seasons] == [1, 2]
+    assert [e["number"] for e in seasons[0]["episodes"]] == [1, 2]
+
+    notFound = {"movies": [{"ids": {"imdb": "tt1"}}], "shows": []}
+    assert [s["id"] for s in utilities.findNotFoundScrobbles(scrobbles, notFound)] == [1]
+    notFound = {"shows": [{"ids": {"tvdb": 1}}]}
+    assert [s["id"] for s in utilities.findNotFoundScrobbles(scrobbles, notFound)] == [2, 3, 4]
+    # only the listed episode of the show, not its siblings
+    notFound = {"shows": [{"ids": {"tvdb": 1}, "seasons": [{"number": 1, "episodes": [{"number": 2}]}]}]}
+    assert [s["id"] for s in utilities.findNotFoundScrobbles(scrobbles, notFound)] == [3]
+    notFound = {"shows": [{"ids": {"tvdb": 1}, "seasons": [{"number": 2}]}]}
+    assert [s["id"] for s in utilities.findNotFoundScrobbles(scrobbles, notFound)] == [4]
+    scrobbles[1]["media_info"]["ids"] = {"tvdb": 11}
+    notFound = {"episodes": [{"ids": {"tvdb": 11}}]}
+    assert [s["id"] for s in utilities.findNotFoundScrobbles(scrobbles, notFound)] == [2]
+
+
+def test_compactScrobbles():
+    def event(id, status, progress, ids):
+        return {"id": id, "media_type": "movie", "media_info": {"ids": ids, "title": "M", "year": 2000},
+                "show_info": None, "status": status, "progress": progress}
+
+    events = [
+        event(1, "start", 1, {"imdb": "tt1"}),
+        event(2, "pause", 10, {"imdb": "tt1", "trakt": 5}),
+        event(3, "stop", 90, {"trakt": 5}),
+        event(4, "stop", 90, {"trakt": 5}),
+        event(5, "start", 0, {"imdb": "tt2"}),
+        event(6, "start", 0, {"imdb": "tt3"}),
+    ]
+    events[4]["media_info"]["title"] = "Other"
+    events[5]["media_info"]["title"] = "Third"
+
+    kept, superseded = utilities.compactScrobbles(events)
+    assert [e["id"] for e in kept] == [4, 5, 6]
+    assert [e["id"] for e in superseded] == [1, 2, 3]
+
+
+def test_coalesceEvents():
+    events = [
+        {"action": "started"},
+        {"action": "seek", "time": 1},
+        {"action": "seekchapter", "chapter": 2},
+        {"action": "seek", "time": 3},
+        {"action": "paused"},
+        {"action": "resumed"},
+        {"action": "paused"},
+        {"action": "stopped"},
+    ]
+    assert utilities.coalesceEvents(events) == [
+        {"action": "started"},
+        {"action": "seek", "time": 3},
+        {"action": "paused"},
+        {"action": "stopped"},
+    ]
+
+
 def test_getFormattedItemName_Show():
     data = load_params_from_json("tests/fixtures/show.json")
     assert utilities.getFormattedItemName("show", data) == "Game of Thrones"
@@ -480,6 +570,32 @@ def test_compareEpisodes_matchByTitleAndYear_local_episode_added():
     assert utilities.compareEpisodes(data1, data2, True) == fixture
 
 
+def test_compareEpisodes_with_LibraryIndex():
+    data1 = load_params_from_json("tests/fixtures/compare_shows_local_batman.json")
+    data2 = load_params_from_json(
+        "tests/fixtures/compare_shows_remote_batman_episode.json"
+    )
+    fixture = load_params_from_json(
+        "tests/fixtures/compare_shows_batman_episode_to_add.json"
+    )
+    index1 = utilities.LibraryIndex(data1)
+    index2 = utilities.LibraryIndex(data2)
+
+    assert utilities.compareEpisodes(index1, index2, True) == fixture
+    # a second compare reuses the cached lookups and gives the same result
+    assert utilities.compareEpisodes(index1, index2, True) == fixture
+
+
+def test_LibraryIndex_seasons_cached():
+    data = load_params_from_json("tests/fixtures/compare_shows_local_batman.json")
+    index = utilities.LibraryIndex(data)
+    show = data["shows"][0]
+
+    assert len(index) == len(data["shows"])
+    assert index.find(show, True) is show
+    assert index.seasons(show) is index.seasons(show)
+
+
 def test_compareEpisodes_not_matchByTitleAndYear_no_matches():
     data1 = load_params_from_json("tests/fixtures/compare_shows_local_batman.json")
     data2 = load_params_from_json("tests/fixtures/compare_shows_remote_batman.json")
@@ -655,3 +771,110 @@ def test_findEpisodeMatchInList():
     # and fail with AttributeError: type object 'list' has no attribute 'items'
     result = utilities.findEpisodeMatchInList("121361", 1, 1, list_data, "tvdb")
     assert result == episode_data
+
+
+def test_applyHistoryToWatched_movies():
+    items = [
+        {
+            "plays": 1,
+            "last_watched_at": "2024-01-01T10:00:00.000Z",
+            "last_updated_at": "2024-01-01T10:00:00.000Z",
+            "movie": {"title": "Batman", "year": 1989, "ids": {"trakt": 1}},
+        }
+    ]
+    history = [
+        {
+            "watched_at": "2024-02-01T10:00:00.000Z",
+            "type": "movie",
+            "movie": {"title": "Batman", "year": 1989, "ids": {"trakt": 1}},
+        },
+        {
+            "watched_at": "2024-02-02T10:00:00.000Z",
+            "type": "movie",
+            "movie": {"title": "Batman Returns", "year": 1992, "ids": {"trakt": 2}},
+        },
+    ]
+
+    result = utilities.applyHistoryToWatched(items, history, "movies")
+
+    assert len(result) == 2
+    assert result[0]["plays"] == 2
+    assert result[0]["last_watched_at"] == "2024-02-01T10:00:00.000Z"
+    assert result[1]["plays"] == 1
+    assert result[1]["movie"]["ids"]["trakt"] == 2
+
+
+def test_applyHistoryToWatched_skips_plays_at_the_stamp_and_duplicates():
+    items = [
+        {
+            "plays": 1,
+            "last_watched_at": "2024-01-01T10:00:00.000Z",
+            "last_updated_at": "2024-01-01T10:00:00.000Z",
+            "movie": {"title": "Batman", "year": 1989, "ids": {"trakt": 1}},
+        }
+    ]
+    movie = {"title": "Batman", "year": 1989, "ids": {"trakt": 1}}
+    history = [
+        # the play the snapshot was stamped with, start_at includes it
+        {"id": 10, "watched_at": "2024-01-01T10:00:00.000Z", "type": "movie", "movie": movie},
+        {"id": 11, "watched_at": "2024-01-01T10:00:00.500Z", "type": "movie", "movie": movie},
+        # the same entry again, e.g. pages shifted while they were fetched
+        {"id": 11, "watched_at": "2024-01-01T10:00:00.500Z", "type": "movie", "movie": movie},
+    ]
+
+    result = utilities.applyHistoryToWatched(items, history, "movies", since="2024-01-01T10:00:00.000Z")
+
+    assert result[0]["plays"] == 2
+    assert result[0]["last_watched_at"] == "2024-01-01T10:00:00.500Z"
+
+
+def test_applyHistoryToWatched_shows():
+    show = {"title": "Batman Beyond", "year": 1999, "ids": {"trakt": 512}}
+    items = [
+        {
+            "plays": 1,
+            "last_watched_at": "2024-01-01T10:00:00.000Z",
+            "last_updated_at": "2024-01-01T10:00:00.000Z",
+            "reset_at": None,
+            "show": show,
+            "seasons": [
+                {
+                    "number": 1,
+                    "episodes": [
+                        {"number": 1, "plays": 1, "last_watched_at": "2024-01-01T10:00:00.000Z"}
+                    ],
+                }
+            ],
+        }
+    ]
+    history = [
+        {
+            "watched_at": "2024-02-01T10:00:00.000Z",
+            "type": "episode",
+            "episode": {"season": 1, "number": 2, "ids": {"trakt": 2}},
+            "show": show,
+        },
+        {
+            "watched_at": "2024-02-02T10:00:00.000Z",
+            "type": "episode",
+            "episode": {"season": 2, "number": 1, "ids": {"trakt": 3}},
+            "show": show,
+        },
+    ]
+
+    result = utilities.applyHistoryToWatched(items, history, "shows")
+
+    assert len(result) == 1
+    assert result[0]["plays"] == 3
+    assert result[0]["last_watched_at"] == "2024-02-02T10:00:00.000Z"
+    assert [s["number"] for s in result[0]["seasons"]] == [1, 2]
+    assert [e["number"] for e in result[0]["seasons"][0]["episodes"]] == [1, 2]
+    assert result[0]["seasons"][1]["episodes"][0]["plays"] == 1
+
+
+def test_LibraryIndex_truthiness_follows_the_library():
+    # like the lists it replaces, an empty library is falsy
+    assert not utilities.LibraryIndex({"shows": []})
+    assert not utilities.LibraryIndex([])
+    assert utilities.LibraryIndex([{"title": "M", "year": 2000}])
+    assert utilities.compareMovies(utilities.LibraryIndex([]), [], True) == []
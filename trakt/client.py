@@ -19,6 +19,7 @@ class TraktClient(Emitter):
         adapter_kwargs.setdefault('max_retries', 3)
 
         self.configuration = ConfigurationManager()
+        self.header_templates = {}
         self.http = HttpClient(self, adapter_kwargs)
         self.__interfaces = construct_map(self)
         self._site_url = None
@@ -0,0 +1,208 @@
+from requests.structures import CaseInsensitiveDict
+from urllib.parse import urlsplit
+import json
+import logging
+import re
+import requests
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Cached responses kept per endpoint family (first path segment, e.g. "shows")
+DEFAULT_MAX_ENTRIES = 200
+
+CACHE_CONTROL_MAX_AGE = re.compile(r'max-age\s*=\s*(\d+)', re.IGNORECASE)
+
+# The stored content is already decoded, these no longer describe it
+SKIP_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+
+class CacheEntry(object):
+    def __init__(self, key, status_code, headers, content, etag, expires):
+        self.key = key
+
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+        self.etag = etag
+        self.expires = expires
+
+    @property
+    def fresh(self):
+        return self.expires is not None and self.expires > time.time()
+
+    def build(self, request):
+        """Rebuild a `requests.Response` for `request` from this entry."""
+        response = requests.Response()
+        response.status_code = self.status_code
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.url = request.url
+        response.request = request
+        response.encoding = 'utf-8'
+        response._content = self.content
+
+        return response
+
+
+class ResponseCache(object):
+    """Persistent cache of unauthenticated GET responses.
+
+    Follows the ``Cache-Control`` and ``ETag`` headers Trakt returns: fresh
+    entries (``max-age``) are served without a request, stale entries with an
+    ETag are revalidated with ``If-None-Match``. Responses without any
+    Cache-Control header are kept for `default_ttl` seconds. Every endpoint
+    family keeps at most `max_entries` responses, least recently used ones
+    are evicted first.
+    """
+
+    _create = (
+        'CREATE TABLE IF NOT EXISTS responses ('
+        '  key TEXT PRIMARY KEY,'
+        '  family TEXT NOT NULL,'
+        '  status INTEGER NOT NULL,'
+        '  headers TEXT NOT NULL,'
+        '  content BLOB NOT NULL,'
+        '  etag TEXT,'
+        '  expires REAL,'
+        '  accessed REAL NOT NULL'
+        ')'
+    )
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, default_ttl=0):
+        self.path = path
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+
+        self._local = threading.local()
+
+        with self._get_conn() as conn:
+            conn.execute(self._create)
+            conn.execute('CREATE INDEX IF NOT EXISTS responses_family ON responses (family, accessed)')
+
+    def _get_conn(self):
+        conn = getattr(self._local, 'conn', None)
+
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=60)
+
+        return conn
+
+    @staticmethod
+    def cacheable(request):
+        if request.method != 'GET':
+            return False
+
+        # Never persist anything tied to the user
+        return 'Authorization' not in request.headers and 'trakt-user-token' not in request.headers
+
+    def get(self, request):
+        """Retrieve the cached entry for `request` (fresh or not)."""
+        try:
+            with self._get_conn() as conn:
+                row = conn.execute(
+                    'SELECT status, headers, content, etag, expires FROM responses WHERE key = ?',
+                    (request.url,)
+                ).fetchone()
+
+                if not row:
+                    return None
+
+                conn.execute('UPDATE responses SET accessed = ? WHERE key = ?', (time.time(), request.url))
+        except sqlite3.Error as ex:
+            log.warning('Unable to read cached response: %s', ex)
+            return None
+
+        return CacheEntry(request.url, row[0], json.loads(row[1]), bytes(row[2]), row[3], row[4])
+
+    def put(self, request, response):
+        """Store a successful response, honoring its ``Cache-Control`` header."""
+        if response.status_code != 200:
+            return
+
+        if 'no-store' in response.headers.get('Cache-Control', '').lower():
+            return
+
+        expires = self._expires(response)
+        etag = response.headers.get('ETag')
+
+        # Nothing to serve it for, or revalidate it with
+        if not expires and not etag:
+            return
+
+        family = self._family(request.url)
+
+        try:
+            with self._get_conn() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO responses (key, family, status, headers, content, etag, expires, accessed) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (
+                        request.url, family, response.status_code, json.dumps(self._headers(response)),
+                        sqlite3.Binary(response.content), etag, expires, time.time()
+                    )
+                )
+
+                # Least recently used entries of the family go first
+                conn.execute(
+                    'DELETE FROM responses WHERE family = ? AND key NOT IN ('
+                    '  SELECT key FROM responses WHERE family = ? ORDER BY accessed DESC LIMIT ?'
+                    ')',
+                    (family, family, self.max_entries)
+                )
+        except sqlite3.Error as ex:
+            log.warning('Unable to cache response: %s', ex)
+
+    def revalidated(self, entry, response):
+        """Renew `entry` after a ``304 Not Modified`` response."""
+        entry.expires = self._expires(response) or entry.expires
+
+        try:
+            with self._get_conn() as conn:
+                conn.execute(
+                    'UPDATE responses SET expires = ?, accessed = ? WHERE key = ?',
+                    (entry.expires, time.time(), entry.key)
+                )
+        except sqlite3.Error as ex:
+            log.warning('Unable to update cached response: %s', ex)
+
+    def clear(self):
+        with self._get_conn() as conn:
+            conn.execute('DELETE FROM responses')
+
+    def _expires(self, response):
+        cache_control = response.headers.get('Cache-Control')
+
+        if cache_control is None:
+            if self.default_ttl:
+                return time.time() + self.default_ttl
+
+            return None
+
+        directives = cache_control.lower()
+
+        if 'no-cache' in directives:
+            return 0
+
+        match = CACHE_CONTROL_MAX_AGE.search(directives)
+
+        if match:
+            return time.time() + int(match.group(1))
+
+        return 0
+
+    @staticmethod
+    def _headers(response):
+        return dict(
+            (key, value) for key, value in response.headers.items()
+            if key.lower() not in SKIP_HEADERS
+        )
+
+    @staticmethod
+    def _family(url):
+        parts = urlsplit(url).path.strip('/').split('/')
+
+        return parts[0] if parts else ''
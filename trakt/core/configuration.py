@@ -1,6 +1,7 @@
 # flake8: noqa: E241
 
-from trakt.core.context_collection import ContextCollection
+import itertools
+import threading
 
 DEFAULT_HTTP_RETRY = False
 DEFAULT_HTTP_MAX_RETRIES = 3
@@ -9,12 +10,33 @@ DEFAULT_HTTP_TIMEOUT = (6.05, 24)
 
 
 class ConfigurationManager(object):
+    """Configuration contexts of a client.
+
+    Every thread has its own stack of contexts on top of `defaults`. Lookups
+    are served from a flattened snapshot of the stack, which is rebuilt when
+    the thread pushes or pops a context, or when any context in use changes
+    (tracked with `version`).
+    """
+
     def __init__(self):
         self.defaults = Configuration(self)
-        self.stack = ContextCollection([self.defaults])
+
+        self.version = 0
+        self._versions = itertools.count(1)
+        self._local = threading.local()
 
         self.oauth = OAuthConfiguration(self)
 
+    @property
+    def stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = [self.defaults]
+            self._local.snapshot = None
+
+            return self._local.stack
+
     @property
     def current(self):
         return self.stack[-1]
@@ -29,18 +51,60 @@ class ConfigurationManager(object):
         return Configuration(self).client(id, secret)
 
     def http(self, retry=DEFAULT_HTTP_RETRY, max_retries=DEFAULT_HTTP_MAX_RETRIES, retry_sleep=DEFAULT_HTTP_RETRY_SLEEP,
-             timeout=DEFAULT_HTTP_TIMEOUT):
+             timeout=DEFAULT_HTTP_TIMEOUT, priority=None):
+
+        return Configuration(self).http(retry, max_retries, retry_sleep, timeout, priority)
+
+    def push(self, context):
+        self.stack.append(context)
+        self._local.snapshot = None
+
+    def pop(self):
+        stack = self.stack
+
+        if len(stack) < 2:
+            raise IndexError('No configuration context to pop')
+
+        context = stack.pop()
+        self._local.snapshot = None
+
+        return context
+
+    def changed(self):
+        # Invalidate the snapshots of every thread
+        self.version = next(self._versions)
+
+    def snapshot(self):
+        """Retrieve the flattened configuration of the current thread.
+
+        :return: Values of the topmost context that defines each key
+        :rtype: dict
+        """
+        stack = self.stack
+        snapshot = self._local.snapshot
+
+        if snapshot is not None and self._local.version == self.version:
+            return snapshot
+
+        # Read the version first, a change during the rebuild invalidates it again
+        version = self.version
+        snapshot = {}
 
-        return Configuration(self).http(retry, max_retries, retry_sleep, timeout)
+        for context in stack:
+            snapshot.update((key, value) for key, value in context.data.items() if value is not None)
+
+        self._local.snapshot = snapshot
+        self._local.version = version
+
+        return snapshot
 
     def get(self, key, default=None):
-        for x in range(len(self.stack) - 1, -1, -1):
-            value = self.stack[x].get(key)
+        value = self.snapshot().get(key)
 
-            if value is not None:
-                return value
+        if value is None:
+            return default
 
-        return default
+        return value
 
     def __getitem__(self, key):
         return self.get(key)
@@ -54,37 +118,50 @@ class Configuration(object):
         self.manager = manager
 
         self.data = {}
+        self.active = 0
 
         self.oauth = OAuthConfiguration(self)
 
     def app(self, name=None, version=None, date=None, id=None):
-        self.data['app.name'] = name
-        self.data['app.version'] = version
-        self.data['app.date'] = date
-        self.data['app.id'] = id
-
-        return self
+        return self.update({
+            'app.name': name,
+            'app.version': version,
+            'app.date': date,
+            'app.id': id
+        })
 
     def auth(self, login=None, token=None):
-        self.data['auth.login'] = login
-        self.data['auth.token'] = token
-
-        return self
+        return self.update({
+            'auth.login': login,
+            'auth.token': token
+        })
 
     def client(self, id=None, secret=None):
-        self.data['client.id'] = id
-        self.data['client.secret'] = secret
-
-        return self
+        return self.update({
+            'client.id': id,
+            'client.secret': secret
+        })
 
     def http(self, retry=DEFAULT_HTTP_RETRY, max_retries=DEFAULT_HTTP_MAX_RETRIES, retry_sleep=DEFAULT_HTTP_RETRY_SLEEP,
-             timeout=DEFAULT_HTTP_TIMEOUT):
+             timeout=DEFAULT_HTTP_TIMEOUT, priority=None):
+
+        return self.update({
+            'http.retry': retry,
+            'http.max_retries': max_retries,
+            'http.retry_sleep': retry_sleep,
 
-        self.data['http.retry'] = retry
-        self.data['http.max_retries'] = max_retries
-        self.data['http.retry_sleep'] = retry_sleep
+            'http.timeout': timeout,
 
-        self.data['http.timeout'] = timeout
+            # Request lane (see `trakt.core.ratelimit.LANES`)
+            'http.priority': priority
+        })
+
+    def update(self, values):
+        self.data.update(values)
+
+        # Contexts that aren't on any stack yet can change freely
+        if self.active or self is self.manager.defaults:
+            self.manager.changed()
 
         return self
 
@@ -92,22 +169,20 @@ class Configuration(object):
         return self.data.get(key, default)
 
     def __enter__(self):
-        self.manager.stack.append(self)
+        self.active += 1
+        self.manager.push(self)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        item = self.manager.stack.pop()
+        item = self.manager.pop()
+        self.active -= 1
 
         assert item == self, 'Removed %r from stack, expecting %r' % (item, self)
 
-        # Clear old context lists
-        if len(self.manager.stack) == 1:
-            self.manager.stack.clear()
-
     def __getitem__(self, key):
         return self.data[key]
 
     def __setitem__(self, key, value):
-        self.data[key] = value
+        self.update({key: value})
 
 
 class OAuthConfiguration(object):
@@ -118,7 +193,7 @@ class OAuthConfiguration(object):
         if type(self.owner) is ConfigurationManager:
             return Configuration(self.owner).oauth(token, refresh_token, created_at, expires_in, refresh)
 
-        self.owner.data.update({
+        self.owner.update({
             'oauth.token':          token,
             'oauth.refresh_token':  refresh_token,
 
@@ -135,7 +210,7 @@ class OAuthConfiguration(object):
         if type(self.owner) is ConfigurationManager:
             return Configuration(self.owner).oauth.clear()
 
-        self.owner.data.update({
+        self.owner.update({
             'oauth.token':          None,
             'oauth.refresh_token':  None,
 
@@ -156,7 +231,7 @@ class OAuthConfiguration(object):
         if not response:
             raise ValueError('Invalid "response" parameter provided to oauth.from_response()')
 
-        self.owner.data.update({
+        self.owner.update({
             'oauth.token':          response.get('access_token'),
             'oauth.refresh_token':  response.get('refresh_token'),
 
@@ -1,18 +1,16 @@
 
 from trakt.core.configuration import DEFAULT_HTTP_RETRY, DEFAULT_HTTP_MAX_RETRIES, DEFAULT_HTTP_TIMEOUT, \
-    DEFAULT_HTTP_RETRY_SLEEP
-from trakt.core.context_stack import ContextStack
+    DEFAULT_HTTP_RETRY_SLEEP, Configuration
 from trakt.core.helpers import synchronized
 from trakt.core.keylock import KeyLock
 from trakt.core.pagination import PaginationIterator
+from trakt.core.ratelimit import LANE_BACKGROUND, WriteScheduler
 from trakt.core.request import TraktRequest
 
 from requests.adapters import DEFAULT_POOLBLOCK, HTTPAdapter
 from requests.exceptions import ConnectionError, SSLError
 from requests.packages.urllib3.exceptions import ReadTimeoutError
-from threading import RLock
-import calendar
-import datetime
+from threading import Lock, RLock, Thread
 import logging
 import requests
 import socket
@@ -26,19 +24,30 @@ except ImportError:
 
 log = logging.getLogger(__name__)
 
+# Expired tokens are refreshed (blocking the request) within this window of
+# their expiry, and refreshed in the background within the soft window
+OAUTH_REFRESH_HARD = 48 * 60 * 60
+OAUTH_REFRESH_SOFT = 72 * 60 * 60
+
+# A failed background refresh is tried again after this many seconds
+OAUTH_REFRESH_SOFT_RETRY = 10 * 60
+
+# Unknown expiry (missing "created_at" or "expires_in")
+OAUTH_EXPIRY_UNKNOWN = (None, None)
+
 
 class HttpClient(object):
     # Trakt API: POST/PUT/DELETE limited to 1 call per second
     _WRITE_METHODS = {'POST', 'PUT', 'DELETE'}
 
-    def __init__(self, client, adapter_kwargs=None, keep_alive=True):
+    def __init__(self, client, adapter_kwargs=None, keep_alive=True, clock=time.time):
         self.client = client
+        self.clock = clock
 
         self.adapter_kwargs = adapter_kwargs or {}
         self.keep_alive = keep_alive
 
         # Build client
-        self.configuration = ContextStack()
         self.session = None
 
         self._proxies = {}
@@ -47,9 +56,18 @@ class HttpClient(object):
         self._oauth_refreshing = KeyLock()
         self._oauth_validate_lock = RLock()
 
-        # POST rate limiting: track last write request timestamp
-        self._last_write_time = 0
-        self._write_lock = RLock()
+        # token -> (soft, hard) refresh deadlines
+        self._oauth_deadlines = {}
+        # tokens being refreshed in the background, and when a failed one may be tried again
+        self._oauth_scheduled = set()
+        self._oauth_retry_at = {}
+        self._oauth_schedule_lock = Lock()
+
+        # Optional `trakt.core.cache.ResponseCache` for unauthenticated GET requests
+        self.cache = None
+
+        # POST/PUT/DELETE rate limiting, shared by every thread using this client
+        self.write_scheduler = WriteScheduler()
 
         # Build requests session
         self.rebuild()
@@ -80,15 +98,10 @@ class HttpClient(object):
         self.rebuild()
 
     def configure(self, path=None):
-        self.configuration.push(base_path=path)
-
-        return self
+        return HttpContext(self, base_path=path)
 
     def request(self, method, path=None, params=None, data=None, query=None, authenticated=False,
-                validate_token=True, exceptions=False, pagination=False, **kwargs):
-
-        # Retrieve configuration
-        ctx = self.configuration.pop()
+                validate_token=True, exceptions=False, pagination=False, ctx=None, **kwargs):
 
         # Build request
         request = TraktRequest(
@@ -115,39 +128,54 @@ class HttpClient(object):
         if not self.keep_alive:
             prepared.headers['Connection'] = 'close'
 
-        # Create pagination iterator (if enabled)
+        # Create pagination iterator (if enabled), `pagination='get'` resolves
+        # the pagination state from the first page instead of a HEAD request
         if pagination:
             return PaginationIterator(
                 self.client, prepared,
-                exceptions=exceptions
+                exceptions=exceptions,
+                resolve_with_get=pagination == 'get'
             )
 
         # Send request
         return self.send(prepared)
 
-    def _throttle_write(self, method):
-        """Enforce 1 call/sec for POST/PUT/DELETE per Trakt API rate limits."""
-        if method not in self._WRITE_METHODS:
-            return
+    def send(self, request):
+        cache = self.cache
 
-        with self._write_lock:
-            now = time.time()
-            elapsed = now - self._last_write_time
-            if elapsed < 1.0:
-                wait = 1.0 - elapsed
-                log.debug('Rate throttle: waiting %.2fs before %s request', wait, method)
-                time.sleep(wait)
-            self._last_write_time = time.time()
+        if cache is None or not cache.cacheable(request):
+            return self._send(request)
 
-    def send(self, request):
-        # Enforce POST/PUT/DELETE rate limit (1 call per second)
-        self._throttle_write(request.method)
+        entry = cache.get(request)
+
+        if entry is not None and entry.fresh:
+            log.debug('Serving %s from the response cache', request.url)
+            return entry.build(request)
+
+        if entry is not None and entry.etag:
+            request.headers['If-None-Match'] = entry.etag
+
+        response = self._send(request)
 
+        if response is None:
+            return None
+
+        if response.status_code == 304 and entry is not None:
+            cache.revalidated(entry, response)
+            return entry.build(request)
+
+        cache.put(request, response)
+        return response
+
+    def _send(self, request):
         # Retrieve http configuration
         retry = self.client.configuration.get('http.retry', DEFAULT_HTTP_RETRY)
         max_retries = self.client.configuration.get('http.max_retries', DEFAULT_HTTP_MAX_RETRIES)
         retry_sleep = self.client.configuration.get('http.retry_sleep', DEFAULT_HTTP_RETRY_SLEEP)
         timeout = self.client.configuration.get('http.timeout', DEFAULT_HTTP_TIMEOUT)
+        lane = self.client.configuration.get('http.priority', LANE_BACKGROUND)
+
+        write = request.method in self._WRITE_METHODS
 
         # Send request
         exc_info = None
@@ -159,6 +187,10 @@ class HttpClient(object):
 
             exc_info = None
 
+            # Wait for the write rate limit (every attempt counts against it)
+            if write:
+                self.write_scheduler.acquire(lane)
+
             # Send request
             try:
                 response = self.session.send(request, timeout=timeout)
@@ -174,6 +206,9 @@ class HttpClient(object):
 
                 response = self.rebuild().send(request, timeout=timeout)
 
+            if write and not exc_info:
+                self.write_scheduler.update(response)
+
             # Handle 429 Rate Limit - always retry with Retry-After regardless of retry setting
             if not exc_info and response is not None and response.status_code == 429:
                 retry_after = None
@@ -187,7 +222,12 @@ class HttpClient(object):
                         'Rate limit exceeded (429), waiting %s seconds (Retry-After)',
                         retry_after
                     )
-                    time.sleep(retry_after)
+
+                    if write:
+                        # Holds back every queued write, the next acquire() waits it out
+                        self.write_scheduler.penalize(retry_after)
+                    else:
+                        time.sleep(retry_after)
                     continue
                 else:
                     log.warning('Rate limit exceeded (429), no retries remaining')
@@ -253,12 +293,120 @@ class HttpClient(object):
             return True
 
         # OAuth
-        if config['oauth.token']:
+        token = config['oauth.token']
+
+        if token:
+            soft, hard = self._oauth_deadline(token)
+
+            if soft is None:
+                return True
+
+            current = self.clock()
+
+            # Fast path, no locks until the token is close to expiring
+            if current < soft:
+                return True
+
+            if current < hard:
+                self._schedule_oauth_refresh(token, current)
+                return True
+
             # Validate OAuth token, refresh if needed
             return self._validate_oauth()
 
         return False
 
+    def _oauth_deadline(self, token):
+        deadline = self._oauth_deadlines.get(token)
+
+        if deadline is not None:
+            return deadline
+
+        config = self.client.configuration
+
+        if config['oauth.created_at'] is None or config['oauth.expires_in'] is None:
+            log.debug('OAuth - Missing "created_at" or "expires_in" parameters, '
+                      'unable to determine if the current token is still valid')
+            deadline = OAUTH_EXPIRY_UNKNOWN
+        else:
+            expires_at = config['oauth.created_at'] + config['oauth.expires_in']
+            deadline = (expires_at - OAUTH_REFRESH_SOFT, expires_at - OAUTH_REFRESH_HARD)
+
+        # Only a handful of tokens are ever in use
+        if len(self._oauth_deadlines) >= 8:
+            self._oauth_deadlines.clear()
+
+        self._oauth_deadlines[token] = deadline
+        return deadline
+
+    def _schedule_oauth_refresh(self, token, current):
+        with self._oauth_schedule_lock:
+            if token in self._oauth_scheduled:
+                return
+
+            if current < self._oauth_retry_at.get(token, 0):
+                return
+
+            self._oauth_scheduled.add(token)
+
+        config = self.client.configuration
+
+        # Worker threads have their own configuration stack, hand over the token
+        context = Configuration(config).oauth(
+            token=token,
+            refresh_token=config['oauth.refresh_token'],
+            created_at=config['oauth.created_at'],
+            expires_in=config['oauth.expires_in'],
+            refresh=config['oauth.refresh'],
+            username=config['oauth.username']
+        )
+
+        log.info('OAuth - Token expires soon, refreshing it in the background')
+
+        thread = Thread(target=self._background_refresh_oauth, args=(token, context), name='trakt-oauth-refresh')
+        thread.daemon = True
+        thread.start()
+
+    def _background_refresh_oauth(self, token, context):
+        refreshed = False
+
+        try:
+            refreshed = self._refresh_oauth_in(context)
+        finally:
+            with self._oauth_schedule_lock:
+                self._oauth_scheduled.discard(token)
+
+                if refreshed:
+                    self._oauth_retry_at.pop(token, None)
+                else:
+                    # Don't try again on every request, the hard deadline still applies
+                    self._oauth_retry_at[token] = self.clock() + OAUTH_REFRESH_SOFT_RETRY
+
+    def _refresh_oauth_in(self, context):
+        config = self.client.configuration
+
+        with context:
+            if not config['oauth.refresh'] or not config['oauth.refresh_token']:
+                log.debug('OAuth - Token refreshing is disabled, leaving the token to expire')
+                return False
+
+            username = config['oauth.username']
+
+            if not self._oauth_refreshing[username].acquire(False):
+                log.debug('OAuth - Token is already being refreshed for %r', username)
+                return False
+
+            try:
+                if self._refresh_oauth():
+                    log.info('OAuth - Token has been refreshed in the background')
+                    return True
+            except Exception as ex:
+                log.warning('OAuth - Unable to refresh token in the background: %s', ex)
+            finally:
+                self._oauth_refreshing[username].release()
+
+            return False
+
     def _build_path(self, ctx, path):
         if not ctx:
             # No context available
@@ -279,16 +427,12 @@ class HttpClient(object):
         config = self.client.configuration
 
         # Ensure token expiry is available
-        if config['oauth.created_at'] is None or config['oauth.expires_in'] is None:
-            log.debug('OAuth - Missing "created_at" or "expires_in" parameters, '
-                      'unable to determine if the current token is still valid')
-            return True
+        _, expires_at = self._oauth_deadline(config['oauth.token'])
 
-        # Calculate expiry
-        current = calendar.timegm(datetime.datetime.utcnow().utctimetuple())
-        expires_at = config['oauth.created_at'] + config['oauth.expires_in'] - (48 * 60 * 60)
+        if expires_at is None:
+            return True
 
-        if current < expires_at:
+        if self.clock() < expires_at:
             return True
 
         if not config['oauth.refresh']:
@@ -370,6 +514,36 @@ class HttpClient(object):
         return True
 
 
+class HttpContext(object):
+    """Per-call request context returned by `HttpClient.configure()`.
+
+    Carries the interface base path to the request explicitly, so callers on
+    different threads never share (or have to lock) any request state.
+    """
+
+    def __init__(self, http, base_path=None):
+        self.http = http
+        self.base_path = base_path
+
+    def request(self, method, path=None, params=None, data=None, **kwargs):
+        return self.http.request(method, path, params, data, ctx=self, **kwargs)
+
+    def send(self, request):
+        return self.http.send(request)
+
+    def delete(self, path=None, params=None, data=None, **kwargs):
+        return self.request('DELETE', path, params, data, **kwargs)
+
+    def get(self, path=None, params=None, data=None, **kwargs):
+        return self.request('GET', path, params, data, **kwargs)
+
+    def post(self, path=None, params=None, data=None, **kwargs):
+        return self.request('POST', path, params, data, **kwargs)
+
+    def put(self, path=None, params=None, data=None, **kwargs):
+        return self.request('PUT', path, params, data, **kwargs)
+
+
 class HTTPSAdapter(HTTPAdapter):
     def __init__(self, ssl_version=None, *args, **kwargs):
         self._ssl_version = ssl_version
@@ -1,5 +1,8 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlsplit, urlunsplit, parse_qsl
 
+from trakt.core.configuration import Configuration
 from trakt.core.errors import log_request_error
 from trakt.core.exceptions import ServerError, ClientError, RequestFailedError
 from trakt.core.helpers import try_convert
@@ -9,10 +12,12 @@ log = logging.getLogger(__name__)
 
 
 class PaginationIterator(object):
-    def __init__(self, client, request, exceptions=False):
+    def __init__(self, client, request, exceptions=False, prefetch=0, resolve_with_get=False):
         self.client = client
         self.request = request
         self.exceptions = exceptions
+        self.prefetch = prefetch
+        self.resolve_with_get = resolve_with_get
 
         self.per_page = None
         self.total_items = None
@@ -20,6 +25,9 @@ class PaginationIterator(object):
 
         self._mapper = None
 
+        # First page, when it was retrieved while resolving the pagination state
+        self._buffered = None
+
         # Parse request url
         scheme, netloc, path, query = urlsplit(self.request.url)[:4]
 
@@ -30,12 +38,32 @@ class PaginationIterator(object):
         self.resolve()
 
     def get(self, page):
+        items, state = self._fetch(page, self.per_page)
+
+        if items is None:
+            return None
+
+        self._update_state(state)
+
+        if self._mapper:
+            return self._mapper(items)
+
+        return items
+
+    def _fetch(self, page, per_page):
+        """Retrieve `page`, without touching the iterator state (safe to call from workers).
+
+        :return: Page items and pagination state, or `(None, None)`
+        :rtype: tuple
+        """
         request = self.request.copy()
 
         # Build query parameters
         query = self.query.copy()
         query['page'] = page
-        query['limit'] = self.per_page
+
+        if per_page is not None:
+            query['limit'] = per_page
 
         # Construct request
         request.prepare_url(self.url, query)
@@ -44,7 +72,7 @@ class PaginationIterator(object):
         response = self._send(request)
 
         if not response:
-            return None
+            return None, None
 
         # Parse response, return data
         content_type = response.headers.get('content-type')
@@ -55,28 +83,72 @@ class PaginationIterator(object):
                 items = response.json()
             except Exception as e:
                 log.warning('Unable to parse page: %s', e)
-                return None
+                return None, None
         else:
             log.warning('Received a page with an invalid content type: %r', content_type)
-            return None
+            return None, None
 
-        if self._mapper:
-            return self._mapper(items)
-
-        return items
+        return items, self._read_state(response)
 
     def resolve(self):
+        if self.resolve_with_get:
+            return self._resolve_with_get()
+
         request = self.request.copy()
         request.prepare_method('HEAD')
 
         # Send request
-        if not self._send(request):
+        response = self._send(request)
+
+        if not response:
             log.warning('Unable to resolve pagination state')
 
             # Reset state
-            self.per_page = None
-            self.total_items = None
-            self.total_pages = None
+            self._reset_state()
+            return
+
+        self._update_state(self._read_state(response))
+
+    def _resolve_with_get(self):
+        # Request the first page, its response carries the same pagination
+        # headers as a HEAD request, so the items are kept for iteration
+        page = int(self.query.get('page', 1))
+        items, state = self._fetch(page, self.per_page)
+
+        if items is None:
+            log.warning('Unable to resolve pagination state')
+
+            # Reset state
+            self._reset_state()
+            return
+
+        self._update_state(state)
+
+        if self.total_pages is None:
+            # Not a paginated response, the first page is all there is
+            log.debug('No pagination headers returned, treating the response as a single page')
+            self.total_pages = page
+            self.total_items = len(items)
+
+        self._buffered = (page, items)
+
+    def _get_page(self, page):
+        if self._buffered and self._buffered[0] == page:
+            items = self._buffered[1]
+            self._buffered = None
+
+            if self._mapper:
+                return self._mapper(items)
+
+            return items
+
+        return self.get(page)
+
+    def with_prefetch(self, prefetch):
+        """Keep up to `prefetch` page requests in flight while iterating."""
+        self.prefetch = prefetch
+
+        return self
 
     def with_mapper(self, mapper):
         if self._mapper:
@@ -109,13 +181,29 @@ class PaginationIterator(object):
 
             return None
 
-        # Update pagination state
-        self.per_page = try_convert(response.headers.get('x-pagination-limit'), int)
-        self.total_items = try_convert(response.headers.get('x-pagination-item-count'), int)
-        self.total_pages = try_convert(response.headers.get('x-pagination-page-count'), int)
-
         return response
 
+    @staticmethod
+    def _read_state(response):
+        return (
+            try_convert(response.headers.get('x-pagination-limit'), int),
+            try_convert(response.headers.get('x-pagination-item-count'), int),
+            try_convert(response.headers.get('x-pagination-page-count'), int)
+        )
+
+    def _update_state(self, state):
+        # Only ever called on the iterating thread, responses without
+        # pagination headers leave the state alone
+        if state is None or state[2] is None:
+            return
+
+        self.per_page, self.total_items, self.total_pages = state
+
+    def _reset_state(self):
+        self.per_page = None
+        self.total_items = None
+        self.total_pages = None
+
     def __iter__(self):
         if self.total_pages is None:
             if self.exceptions:
@@ -128,8 +216,17 @@ class PaginationIterator(object):
         current = int(self.query.get('page', 1))
 
         # Fetch pages
+        if self.prefetch > 0 and current < self.total_pages:
+            for item in self._iter_prefetch(current):
+                yield item
+            return
+
+        for item in self._iter_sequential(current):
+            yield item
+
+    def _iter_sequential(self, current):
         while current <= self.total_pages:
-            items = self.get(current)
+            items = self._get_page(current)
 
             if not items:
                 log.warning('Unable to retrieve page #%d, pagination iterator cancelled', current)
@@ -139,3 +236,60 @@ class PaginationIterator(object):
                 yield item
 
             current += 1
+
+    def _iter_prefetch(self, current):
+        # Pages are downloaded on worker threads, but mapped and yielded here
+        # in page order, so the mapper (and the pagination state) is only
+        # ever touched by this thread
+        executor = ThreadPoolExecutor(max_workers=self.prefetch)
+        pending = deque()
+        next_page = current
+
+        if self._buffered and self._buffered[0] == current:
+            for item in self._get_page(current):
+                yield item
+
+            current += 1
+            next_page = current
+
+        # Worker threads have their own configuration stack, hand over ours
+        context = Configuration(self.client.configuration).update(self.client.configuration.snapshot())
+
+        try:
+            while current <= self.total_pages:
+                while next_page <= self.total_pages and len(pending) < self.prefetch:
+                    pending.append(executor.submit(self._fetch_in, context, next_page, self.per_page))
+                    next_page += 1
+
+                try:
+                    items, state = pending.popleft().result()
+                except Exception as e:
+                    log.warning('Unable to prefetch page #%d: %s', current, e)
+                    items = None
+
+                if not items:
+                    log.info('Prefetching page #%d failed, continuing sequentially', current)
+                    break
+
+                self._update_state(state)
+
+                if self._mapper:
+                    items = self._mapper(items)
+
+                for item in items:
+                    yield item
+
+                current += 1
+        finally:
+            for future in pending:
+                future.cancel()
+
+            executor.shutdown(wait=False)
+
+        # Retry the failed page (and continue) one page at a time
+        for item in self._iter_sequential(current):
+            yield item
+
+    def _fetch_in(self, context, page, per_page):
+        with context:
+            return self._fetch(page, per_page)
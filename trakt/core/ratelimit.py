@@ -0,0 +1,177 @@
+from collections import deque
+from threading import Condition
+import calendar
+import json
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+# Request lanes, a lane is only served once every lane before it is empty
+LANE_INTERACTIVE = 'interactive'
+LANE_BACKGROUND = 'background'
+LANE_DEFERRED = 'deferred'
+
+LANES = (LANE_INTERACTIVE, LANE_BACKGROUND, LANE_DEFERRED)
+
+# Trakt API: POST/PUT/DELETE limited to 1 call per second
+DEFAULT_WRITE_RATE = 1.0
+DEFAULT_WRITE_BURST = 1
+
+
+class WriteScheduler(object):
+    """Token bucket shared by every write request (POST/PUT/DELETE) of a client.
+
+    Tokens are refilled at `rate` per second up to `burst`. Every lane has
+    its own queue of waiting callers, the interactive lane is always drained
+    first, then background, then deferred. The bucket
+    follows the ``X-Ratelimit`` header Trakt returns on writes, and a 429
+    response blocks it for the ``Retry-After`` period.
+    """
+
+    def __init__(self, rate=DEFAULT_WRITE_RATE, burst=DEFAULT_WRITE_BURST):
+        self.rate = rate
+        self.burst = burst
+
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+
+        self._queues = dict((lane, deque()) for lane in LANES)
+        self._condition = Condition()
+
+    def acquire(self, lane=LANE_BACKGROUND):
+        """Block until a write may be sent.
+
+        :return: Seconds spent waiting
+        :rtype: float
+        """
+        if lane not in self._queues:
+            log.warning('Unknown request lane %r, using %r', lane, LANE_BACKGROUND)
+            lane = LANE_BACKGROUND
+
+        started = time.monotonic()
+        ticket = object()
+
+        with self._condition:
+            self._queues[lane].append(ticket)
+
+            try:
+                while True:
+                    timeout = None
+
+                    if self._next() is ticket:
+                        now = time.monotonic()
+                        self._refill(now)
+
+                        timeout = self._delay(now)
+
+                        if timeout <= 0:
+                            self._tokens -= 1
+                            break
+
+                    self._condition.wait(timeout)
+            finally:
+                self._queues[lane].remove(ticket)
+
+                # Wake up the next caller in line
+                self._condition.notify_all()
+
+        waited = time.monotonic() - started
+
+        if waited > 0.01:
+            log.debug('Rate throttle: waited %.2fs in the %s lane', waited, lane)
+
+        return waited
+
+    def update(self, response):
+        """Adjust the bucket to the ``X-Ratelimit`` header of a write response."""
+        header = response.headers.get('X-Ratelimit') if response is not None else None
+
+        if not header:
+            return
+
+        try:
+            limit = json.loads(header)
+        except ValueError:
+            log.debug('Unable to parse X-Ratelimit header: %r', header)
+            return
+
+        if not isinstance(limit, dict):
+            return
+
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+
+            if limit.get('limit') and limit.get('period'):
+                self.rate = float(limit['limit']) / float(limit['period'])
+                self.burst = max(int(limit['limit']), 1)
+
+            try:
+                remaining = float(limit['remaining'])
+            except (KeyError, ValueError, TypeError):
+                remaining = None
+
+            if remaining is not None:
+                self._tokens = min(remaining, float(self.burst))
+
+            if remaining is not None and remaining < 1:
+                # Don't trust "until" further out than one period (clock skew)
+                until = self._until(limit.get('until'))
+                period = float(limit.get('period') or 60)
+
+                if until is not None:
+                    self._block(now, min(until, period))
+
+            self._condition.notify_all()
+
+    def penalize(self, retry_after):
+        """Block every write for `retry_after` seconds (after a 429 response)."""
+        with self._condition:
+            now = time.monotonic()
+
+            self._tokens = 0.0
+            self._updated = now
+
+            self._block(now, retry_after)
+            self._condition.notify_all()
+
+    def _next(self):
+        # First waiting caller of the first lane that isn't empty
+        for lane in LANES:
+            if self._queues[lane]:
+                return self._queues[lane][0]
+
+        return None
+
+    def _refill(self, now):
+        self._tokens = min(float(self.burst), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _delay(self, now):
+        delay = self._blocked_until - now
+
+        if self._tokens < 1:
+            delay = max(delay, (1 - self._tokens) / self.rate)
+
+        return delay
+
+    def _block(self, now, seconds):
+        if seconds is None or seconds <= 0:
+            return
+
+        self._blocked_until = max(self._blocked_until, now + seconds)
+
+    @staticmethod
+    def _until(value):
+        # Seconds until an "until" timestamp (e.g. "2020-10-10T00:24:00Z")
+        if not value:
+            return None
+
+        try:
+            until = calendar.timegm(time.strptime(value.rstrip('Z')[:19], '%Y-%m-%dT%H:%M:%S'))
+        except (ValueError, TypeError, AttributeError):
+            return None
+
+        return until - time.time()
@@ -3,6 +3,17 @@ from urllib.parse import urlencode
 from requests import Request
 import json
 
+# Configuration keys the request headers are built from
+HEADER_KEYS = (
+    'client.id',
+    'auth.login', 'auth.token',
+    'oauth.token',
+    'app.name', 'app.version'
+)
+
+# Distinct header sets kept per client (one per token/app combination in use)
+MAX_HEADER_TEMPLATES = 16
+
 
 class TraktRequest(object):
     def __init__(self, client, **kwargs):
@@ -65,29 +76,63 @@ class TraktRequest(object):
         return self.method
 
     def transform_headers(self):
-        headers = self.kwargs.get('headers') or {}
-        headers['Content-Type'] = 'application/json'
+        headers = self.kwargs.get('headers')
+
+        # `Request.prepare()` copies the headers, so the template can be shared
+        if not headers:
+            return self.header_template()
+
+        headers.update(self.header_template())
+        return headers
+
+    def header_template(self):
+        """Retrieve the headers for the current configuration.
+
+        Templates are keyed by the values they are built from, so a token
+        refresh or configuration change simply selects a new template.
+        """
+        config = self.configuration.snapshot()
+        values = {name: config.get(name) for name in HEADER_KEYS}
+        key = tuple(values[name] for name in HEADER_KEYS)
+
+        templates = self.client.header_templates
+        template = templates.get(key)
+
+        if template is not None:
+            return template
+
+        template = self.build_headers(values)
+
+        if len(templates) >= MAX_HEADER_TEMPLATES:
+            templates.clear()
+
+        templates[key] = template
+        return template
 
-        headers['trakt-api-version'] = '2'
+    def build_headers(self, config):
+        headers = {
+            'Content-Type': 'application/json',
+            'trakt-api-version': '2'
+        }
 
         # API Key / Client ID
-        if self.client.configuration['client.id']:
-            headers['trakt-api-key'] = self.client.configuration['client.id']
+        if config['client.id']:
+            headers['trakt-api-key'] = config['client.id']
 
         # xAuth
-        if self.configuration['auth.login'] and self.configuration['auth.token']:
-            headers['trakt-user-login'] = self.configuration['auth.login']
-            headers['trakt-user-token'] = self.configuration['auth.token']
+        if config['auth.login'] and config['auth.token']:
+            headers['trakt-user-login'] = config['auth.login']
+            headers['trakt-user-token'] = config['auth.token']
 
         # OAuth
-        if self.configuration['oauth.token']:
-            headers['Authorization'] = 'Bearer %s' % self.configuration['oauth.token']
+        if config['oauth.token']:
+            headers['Authorization'] = 'Bearer %s' % config['oauth.token']
 
         # User-Agent
-        if self.configuration['app.name'] and self.configuration['app.version']:
-            headers['User-Agent'] = '%s (%s)' % (self.configuration['app.name'], self.configuration['app.version'])
-        elif self.configuration['app.name']:
-            headers['User-Agent'] = self.configuration['app.name']
+        if config['app.name'] and config['app.version']:
+            headers['User-Agent'] = '%s (%s)' % (config['app.name'], config['app.version'])
+        elif config['app.name']:
+            headers['User-Agent'] = config['app.name']
         else:
             headers['User-Agent'] = 'trakt.py (%s)' % self.client.version
 
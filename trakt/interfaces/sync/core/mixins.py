@@ -34,6 +34,10 @@ class Get(Interface):
         items = self.get_data(response, **kwargs)
 
         if isinstance(items, PaginationIterator):
+            # Raw pages (`parse=False`) are returned as they are
+            if kwargs.get('parse') is False:
+                return items
+
             if not flat:
                 raise ValueError('Pagination is only supported with `flat=True`')
 